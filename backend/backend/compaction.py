@@ -0,0 +1,183 @@
+"""
+Source Compaction - Rút gọn nội dung nguồn trước khi đưa vào prompt
+✅ Gom dòng → đoạn văn, bỏ dòng / đoạn trùng (hash, không cần liền kề)
+✅ Xếp hạng đoạn theo BM25 với keyword
+✅ Đóng gói các đoạn tốt nhất vào token budget (SOURCE_TOKEN_BUDGET), giữ thứ tự gốc
+✅ Ước lượng token offline (không gọi API)
+
+File: backend/backend/compaction.py
+"""
+
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+
+# Token budget mặc định cho nội dung nguồn (~ 10.000 ký tự tiếng Anh)
+DEFAULT_TOKEN_BUDGET = 2500
+
+# Gom dòng thành đoạn cho tới khi đủ dài và kết thúc câu
+MIN_PARAGRAPH_CHARS = 200
+SENTENCE_END = ('.', '!', '?', '…', ':', '"', '”', ')')
+
+# BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+WORD = re.compile(r'\w+', re.UNICODE)
+TOKEN_PIECE = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
+
+def estimate_tokens(text):
+    """
+    Ước lượng số token (SentencePiece-like) không cần tokenizer:
+    - từ ASCII: ~4 ký tự / token
+    - từ có dấu / Unicode (tiếng Việt...): ~3 ký tự / token
+    - mỗi dấu câu: 1 token
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in TOKEN_PIECE.findall(text):
+        if piece.isascii():
+            tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == '_' else 1
+        else:
+            tokens += math.ceil(len(piece) / 3) if WORD.match(piece) else 1
+    return tokens
+
+
+def _fingerprint(text):
+    """Hash sau khi chuẩn hoá (lowercase, chỉ giữ chữ/số)"""
+    normalized = ' '.join(WORD.findall(text.lower()))
+    return hashlib.sha1(normalized.encode('utf-8')).digest()
+
+
+def split_paragraphs(text):
+    """
+    Dòng (output của extractor) → đoạn văn.
+
+    Extractor tách text theo từng text node nên 1 câu có thể bị cắt thành nhiều dòng;
+    gom lại tới khi đủ MIN_PARAGRAPH_CHARS và dòng cuối kết thúc câu.
+
+    Returns:
+        (paragraphs, duplicate_lines)
+    """
+    paragraphs = []
+    current = []
+    current_len = 0
+    seen = set()
+    duplicates = 0
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        # Trùng không liền kề (menu lặp, "Read more", disclaimer...)
+        key = _fingerprint(line)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+
+        current.append(line)
+        current_len += len(line)
+
+        if current_len >= MIN_PARAGRAPH_CHARS and line.endswith(SENTENCE_END):
+            paragraphs.append('\n'.join(current))
+            current = []
+            current_len = 0
+
+    if current:
+        paragraphs.append('\n'.join(current))
+
+    return paragraphs, duplicates
+
+
+def bm25_scores(paragraphs, query):
+    """BM25 của từng đoạn với query (keyword)"""
+    query_terms = set(WORD.findall(query.lower()))
+    docs = [Counter(WORD.findall(p.lower())) for p in paragraphs]
+    if not docs or not query_terms:
+        return [0.0] * len(paragraphs)
+
+    n_docs = len(docs)
+    avg_len = sum(sum(d.values()) for d in docs) / n_docs or 1.0
+
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for d in docs if term in d)
+        idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    scores = []
+    for doc in docs:
+        doc_len = sum(doc.values())
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term, 0)
+            if tf:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_len)
+                score += idf[term] * tf * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
+
+
+def compact_source(text, keyword, budget=None, reserved=0):
+    """
+    Nội dung nguồn → bản rút gọn vừa token budget.
+
+    Args:
+        text: nội dung đã clean (mỗi dòng 1 text block)
+        keyword: từ khoá bài viết (query cho BM25)
+        budget: token budget (mặc định SOURCE_TOKEN_BUDGET env, 0 = không giới hạn)
+        reserved: token đã dùng cho phần khác của nguồn (vd structured facts), trừ vào budget
+
+    Returns:
+        (compacted_text, info): info = paragraphs, duplicates, kept, tokens_in, tokens_out
+    """
+    if budget is None:
+        budget = int(os.getenv('SOURCE_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET) or 0)
+    if budget and reserved:
+        # Luôn chừa ít nhất 1/4 budget cho văn bản
+        budget = max(budget - reserved, budget // 4)
+
+    paragraphs, duplicates = split_paragraphs(text or '')
+    tokens = [estimate_tokens(p) for p in paragraphs]
+    tokens_in = sum(tokens)
+
+    if not budget or tokens_in <= budget:
+        selected = list(range(len(paragraphs)))
+    else:
+        scores = bm25_scores(paragraphs, keyword)
+
+        # Đoạn đầu (thường là định nghĩa / giới thiệu) luôn được ưu tiên
+        order = [0] + sorted(range(1, len(paragraphs)), key=lambda i: (-scores[i], i))
+
+        selected = []
+        used = 0
+        for idx in order:
+            if used + tokens[idx] <= budget:
+                selected.append(idx)
+                used += tokens[idx]
+
+        # Giữ thứ tự gốc để văn bản còn mạch lạc
+        selected.sort()
+
+        if not selected:
+            # 1 đoạn khổng lồ (không xuống dòng) → cắt theo tỉ lệ ký tự / token
+            chars = int(len(paragraphs[0]) * budget / tokens[0])
+            paragraphs[0] = paragraphs[0][:chars]
+            tokens[0] = estimate_tokens(paragraphs[0])
+            selected = [0]
+
+    compacted = '\n'.join(paragraphs[i] for i in selected)
+    info = {
+        'paragraphs': len(paragraphs),
+        'duplicates': duplicates,
+        'kept': len(selected),
+        'tokens_in': tokens_in,
+        'tokens_out': sum(tokens[i] for i in selected),
+    }
+    return compacted, info
@@ -0,0 +1,182 @@
+"""
+Context Cache - Gemini explicit context caching cho phần prompt tĩnh theo category
+✅ System instruction (role, required_info, SEO, format...) tạo cache 1 lần / model
+✅ Mọi keyword cùng category dùng lại cache → không gửi + tính tiền lại phần prefix
+✅ TTL (CONTEXT_CACHE_TTL), tự gia hạn khi sắp hết hạn
+✅ Tên cache lưu SQLite → các worker process dùng chung
+✅ 1 lock / key: request đồng thời cùng category chờ lần tạo cache đầu tiên, không tạo trùng
+✅ Prefix quá ngắn / tạo cache lỗi → fallback gửi system instruction trực tiếp
+
+⚠️ Với CATEGORY_RULES hiện tại, system instruction chỉ ~830-920 token cho mọi category,
+   dưới MIN_CACHE_TOKENS của cả flash (1024) lẫn pro (4096) → explicit caching KHÔNG bật,
+   prefix luôn gửi inline (chỉ còn implicit caching của Gemini). Cache chỉ được tạo khi prefix
+   dài hơn (category rules / system instruction lớn hơn) hoặc hạ CONTEXT_CACHE_MIN_TOKENS.
+
+File: backend/backend/context_cache.py
+"""
+
+import os
+import asyncio
+import hashlib
+import time
+
+from google.genai import types
+
+from backend.compaction import estimate_tokens
+from backend.storage import connect, data_path
+
+
+DEFAULT_TTL = 3600
+
+# Gemini chỉ cho cache nội dung từ N token trở lên (theo model)
+MIN_CACHE_TOKENS = {
+    'gemini-2.5-flash': 1024,
+    'gemini-2.5-pro': 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+# Còn ít hơn N giây → gia hạn TTL
+REFRESH_MARGIN = 300
+
+# Tạo cache lỗi → không thử lại trong N giây
+FAILURE_BACKOFF = 600
+
+
+def make_context_key(model, system_instruction):
+    raw = f"{model}|{system_instruction}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ContextCache:
+    """Quản lý cached content (tên + hạn) theo (model, system instruction)"""
+
+    def __init__(self, client, path=None, ttl=None):
+        self.client = client
+        self.path = path or data_path('context_cache.sqlite3', 'CONTEXT_CACHE_DB')
+        self.ttl = int(ttl if ttl is not None else os.getenv('CONTEXT_CACHE_TTL', DEFAULT_TTL))
+
+        self.stats = {'hit': 0, 'created': 0, 'refreshed': 0, 'skipped': 0}
+        self._locks = {}
+        # Key đã báo "quá ngắn" (chỉ log 1 lần / process)
+        self._inline = set()
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS context_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                name TEXT,
+                expire_at REAL,
+                failed_until REAL,
+                created_at REAL
+            )
+        """)
+
+    def _min_tokens(self, model):
+        override = os.getenv('CONTEXT_CACHE_MIN_TOKENS')
+        if override:
+            return int(override)
+        return MIN_CACHE_TOKENS.get(model, DEFAULT_MIN_CACHE_TOKENS)
+
+    def _row(self, key):
+        return self.conn.execute("SELECT * FROM context_cache WHERE cache_key = ?", (key,)).fetchone()
+
+    def _save(self, key, model, name=None, expire_at=None, failed_until=None):
+        self.conn.execute(
+            """INSERT OR REPLACE INTO context_cache (cache_key, model, name, expire_at, failed_until, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (key, model, name, expire_at, failed_until, time.time())
+        )
+
+    @staticmethod
+    def _expire_at(cached, fallback):
+        expire_time = getattr(cached, 'expire_time', None)
+        return expire_time.timestamp() if expire_time else fallback
+
+    async def get(self, model, system_instruction, logger=None):
+        """
+        Tên cached content cho (model, system instruction), tạo / gia hạn nếu cần.
+
+        Returns:
+            name (str) hoặc None → gửi system instruction trực tiếp
+        """
+        if self.ttl <= 0 or not system_instruction:
+            return None
+
+        key = make_context_key(model, system_instruction)
+
+        # Quá ngắn cho explicit caching → gửi inline, không ghi SQLite (không bao giờ tạo được)
+        tokens = estimate_tokens(system_instruction)
+        if tokens < self._min_tokens(model):
+            self.stats['skipped'] += 1
+            if logger and key not in self._inline:
+                logger.info(
+                    f"ℹ️ Prompt prefix ~{tokens} tokens < cache minimum for {model} "
+                    f"({self._min_tokens(model)}) - sending inline"
+                )
+            self._inline.add(key)
+            return None
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            return await self._get_or_create(key, model, system_instruction, logger)
+
+    async def _get_or_create(self, key, model, system_instruction, logger):
+        """Phần của get() chạy trong lock của key"""
+        now = time.time()
+        row = self._row(key)
+
+        if row and row['failed_until'] and row['failed_until'] > now:
+            self.stats['skipped'] += 1
+            return None
+
+        if row and row['name'] and row['expire_at'] and row['expire_at'] > now:
+            if row['expire_at'] - now > REFRESH_MARGIN:
+                self.stats['hit'] += 1
+                return row['name']
+
+            # Sắp hết hạn → gia hạn thay vì tạo mới
+            try:
+                cached = await self.client.aio.caches.update(
+                    name=row['name'],
+                    config=types.UpdateCachedContentConfig(ttl=f'{self.ttl}s')
+                )
+                self._save(key, model, row['name'], self._expire_at(cached, now + self.ttl))
+                self.stats['refreshed'] += 1
+                return row['name']
+            except Exception as e:
+                if logger:
+                    logger.warning(f"⚠️ Context cache refresh failed ({model}): {e}")
+
+        try:
+            cached = await self.client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    display_name=f'acp-{key[:16]}',
+                    ttl=f'{self.ttl}s',
+                )
+            )
+        except Exception as e:
+            self._save(key, model, failed_until=now + FAILURE_BACKOFF)
+            if logger:
+                logger.warning(f"⚠️ Context cache create failed ({model}): {e}")
+            return None
+
+        self._save(key, model, cached.name, self._expire_at(cached, now + self.ttl))
+        self.stats['created'] += 1
+        if logger:
+            logger.info(
+                f"🧠 Context cache created for {model}: {cached.name} "
+                f"(~{estimate_tokens(system_instruction)} tokens, TTL {self.ttl}s)"
+            )
+        return cached.name
+
+    def invalidate(self, model, system_instruction):
+        """Cache bị xoá / hết hạn phía server → quên, lần sau tạo lại"""
+        self.conn.execute(
+            "DELETE FROM context_cache WHERE cache_key = ?", (make_context_key(model, system_instruction),)
+        )
+
+    def close(self):
+        self.conn.close()
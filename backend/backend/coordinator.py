@@ -0,0 +1,83 @@
+"""
+Candidate Coordinator - Stop-on-first-success cho từng keyword
+✅ Thử candidates theo thứ tự Google ranking (hoặc window nhỏ song song)
+✅ Dừng ngay khi 1 trang đạt ngưỡng chất lượng
+✅ Mỗi keyword chỉ emit ĐÚNG 1 item
+
+File: backend/backend/coordinator.py
+"""
+
+
+class KeywordCoordinator:
+    """Điều phối candidates của 1 keyword - emit đúng 1 item"""
+
+    def __init__(self, keyword, candidates, window=1):
+        self.keyword = keyword
+        self.candidates = candidates
+        self.window = max(1, int(window))
+
+        self.next_index = 0
+        self.in_flight = set()
+        self.done = False
+
+        # Kết quả tốt nhất (chưa đạt ngưỡng) - dùng khi hết candidates
+        self.best_item = None
+        self.best_score = -1
+
+    @property
+    def total(self):
+        return len(self.candidates)
+
+    def next_batch(self):
+        """Lấy thêm candidates để lấp đầy window"""
+        batch = []
+
+        if self.done:
+            return batch
+
+        while len(self.in_flight) < self.window and self.next_index < self.total:
+            idx = self.next_index
+            self.next_index += 1
+            self.in_flight.add(idx)
+            batch.append((idx, self.candidates[idx]))
+
+        return batch
+
+    def is_active(self, idx):
+        """Candidate này còn cần xử lý không (keyword chưa xong)"""
+        return not self.done and idx in self.in_flight
+
+    def report_success(self, idx, item):
+        """Trang đạt ngưỡng → chốt keyword, trả về item để emit"""
+        self.in_flight.discard(idx)
+
+        if self.done:
+            return None
+
+        self.done = True
+        self.in_flight.clear()
+        return item
+
+    def report_partial(self, idx, item, score):
+        """Trang chưa đạt ngưỡng → giữ lại nếu tốt nhất, thử tiếp"""
+        self.in_flight.discard(idx)
+
+        if not self.done and score > self.best_score:
+            self.best_item = item
+            self.best_score = score
+
+    def report_failure(self, idx):
+        """Request lỗi → bỏ qua candidate này"""
+        self.in_flight.discard(idx)
+
+    def is_exhausted(self):
+        """Hết candidates và không còn request nào đang chạy"""
+        return not self.done and not self.in_flight and self.next_index >= self.total
+
+    def finalize(self):
+        """Hết candidates → emit kết quả tốt nhất (có thể là None)"""
+        if self.done:
+            return None
+
+        self.done = True
+        return self.best_item
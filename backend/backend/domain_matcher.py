@@ -0,0 +1,119 @@
+"""
+Domain Matcher - Blacklist/whitelist theo domain (suffix-set lookup)
+✅ Build 1 lần, lookup O(số label) thay vì quét cả list
+✅ Match đúng ranh giới label: 'x.com' chặn 'x.com', 'm.x.com' nhưng KHÔNG chặn 'box.com'
+✅ Load từ file (hàng nghìn dòng), hỗ trợ rule allow + deny
+
+Format file (mỗi dòng 1 rule):
+    facebook.com        # deny (mặc định)
+    -pinterest.com      # deny
+    +blog.google.com    # allow - thắng rule deny của domain cha
+    !news.google.com    # allow (cách viết khác)
+    *.tiktok.com        # = tiktok.com
+    # comment
+
+File: backend/backend/domain_matcher.py
+"""
+
+import logging
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+def _clean_domain(domain):
+    domain = domain.strip().lower().rstrip('.')
+    if domain.startswith('*.'):
+        domain = domain[2:]
+    elif domain.startswith('.'):
+        domain = domain[1:]
+    return domain
+
+
+class DomainMatcher:
+    """Suffix-set matcher: rule cụ thể nhất (dài nhất) quyết định"""
+
+    def __init__(self, deny=(), allow=()):
+        self.deny = set()
+        self.allow = set()
+
+        for domain in deny:
+            self.add(domain)
+        for domain in allow:
+            self.add(domain, allow=True)
+
+    def add(self, domain, allow=False):
+        domain = _clean_domain(domain)
+        if not domain:
+            return
+        if allow:
+            self.allow.add(domain)
+            self.deny.discard(domain)
+        else:
+            self.deny.add(domain)
+            self.allow.discard(domain)
+
+    def add_rule(self, line):
+        """Thêm 1 dòng rule (xem format ở đầu file)"""
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            return False
+
+        if line[0] in '+!':
+            self.add(line[1:], allow=True)
+        elif line[0] == '-':
+            self.add(line[1:])
+        else:
+            self.add(line)
+        return True
+
+    def load_file(self, path):
+        """Load rules từ file, trả về số rule đã đọc"""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                count += self.add_rule(line)
+        return count
+
+    @classmethod
+    def build(cls, deny=(), rules_file=''):
+        """
+        Matcher từ list mặc định + file rules (nếu có).
+        File thiếu / không đọc được → log + chỉ dùng list mặc định (build chạy lúc import spider)
+        """
+        matcher = cls(deny=deny)
+        if rules_file:
+            try:
+                matcher.load_file(rules_file)
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"⚠️ Blacklist file {rules_file} unreadable, using built-in list only: {e}")
+                matcher = cls(deny=deny)
+        return matcher
+
+    def match(self, host):
+        """
+        'deny' / 'allow' / None cho 1 hostname.
+
+        Duyệt từ host đầy đủ → suffix ngắn dần: a.b.example.com, b.example.com, example.com, com
+        """
+        # Bỏ userinfo (user:pw@) + port nếu truyền netloc thay vì hostname
+        host = _clean_domain(host.rsplit('@', 1)[-1].split(':')[0])
+        labels = host.split('.')
+
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            if suffix in self.allow:
+                return 'allow'
+            if suffix in self.deny:
+                return 'deny'
+        return None
+
+    def is_blocked(self, url):
+        """URL có bị chặn không"""
+        # .hostname: đã bỏ userinfo + port, lowercase (netloc 'user:pw@facebook.com' lọt blacklist)
+        host = (urlparse(url).hostname or '') if '://' in url else url
+        return self.match(host) == 'deny'
+
+    def __len__(self):
+        return len(self.deny) + len(self.allow)
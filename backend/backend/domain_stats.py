@@ -0,0 +1,163 @@
+"""
+Domain Reputation - Học từ lịch sử scrape từng domain (SQLite)
+✅ Ghi latency, HTTP lỗi, số ký tự lấy được, tỉ lệ phải fallback snippet
+✅ Cập nhật sau mỗi parse_content / errback
+✅ Xếp lại candidates: domain hay fail bị đẩy xuống, domain luôn fail bị bỏ qua
+
+File: backend/backend/domain_stats.py
+"""
+
+import os
+import time
+from urllib.parse import urlparse
+
+from backend.storage import connect, data_path
+
+
+def normalize_domain(url_or_domain):
+    """URL / netloc → domain chuẩn (lowercase, bỏ www., bỏ port)"""
+    value = url_or_domain or ''
+    domain = urlparse(value).netloc if '://' in value else value
+    domain = domain.lower().split(':')[0]
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain
+
+
+class DomainReputation:
+    """Persistent per-domain extraction stats"""
+
+    # Cần tối thiểu N lần thử trước khi bỏ qua domain
+    MIN_SAMPLES = int(os.getenv('DOMAIN_MIN_SAMPLES', '5'))
+
+    # Tỉ lệ "vô dụng" (lỗi HTTP + fallback snippet) từ ngưỡng này → bỏ qua
+    SKIP_RATE = float(os.getenv('DOMAIN_SKIP_RATE', '0.9'))
+
+    # Domain tệ nhất bị đẩy xuống tối đa N vị trí so với Google ranking
+    MAX_DEMOTION = 5
+
+    # Prior (smoothing) cho domain ít dữ liệu
+    PRIOR_SAMPLES = 2
+    PRIOR_BAD_RATE = 0.2
+
+    def __init__(self, path=None):
+        self.path = path or data_path('domain_stats.sqlite3', 'DOMAIN_STATS_DB')
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS domain_stats (
+                domain TEXT PRIMARY KEY,
+                fetches INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                successes INTEGER DEFAULT 0,
+                fallbacks INTEGER DEFAULT 0,
+                total_chars INTEGER DEFAULT 0,
+                total_latency REAL DEFAULT 0,
+                latency_samples INTEGER DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+
+    # === Update ===
+
+    def record_fetch(self, domain, latency=None, chars=0, success=False, fallback=False):
+        """Sau parse_content: trang tải được, lấy được bao nhiêu ký tự"""
+        self._upsert(
+            normalize_domain(domain),
+            fetches=1,
+            successes=1 if success else 0,
+            fallbacks=1 if fallback else 0,
+            total_chars=int(chars),
+            latency=latency
+        )
+
+    def record_failure(self, domain, latency=None):
+        """Sau errback: HTTP lỗi / timeout / DNS..."""
+        self._upsert(normalize_domain(domain), failures=1, latency=latency)
+
+    def _upsert(self, domain, fetches=0, failures=0, successes=0, fallbacks=0, total_chars=0, latency=None):
+        if not domain:
+            return
+
+        has_latency = latency is not None
+        self.conn.execute(
+            """INSERT INTO domain_stats
+                   (domain, fetches, failures, successes, fallbacks, total_chars,
+                    total_latency, latency_samples, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(domain) DO UPDATE SET
+                   fetches = fetches + excluded.fetches,
+                   failures = failures + excluded.failures,
+                   successes = successes + excluded.successes,
+                   fallbacks = fallbacks + excluded.fallbacks,
+                   total_chars = total_chars + excluded.total_chars,
+                   total_latency = total_latency + excluded.total_latency,
+                   latency_samples = latency_samples + excluded.latency_samples,
+                   updated_at = excluded.updated_at""",
+            (domain, fetches, failures, successes, fallbacks, total_chars,
+             float(latency) if has_latency else 0.0, 1 if has_latency else 0, time.time())
+        )
+
+    # === Query ===
+
+    def get(self, domain):
+        """Stats của domain (dict, kèm các chỉ số suy ra) hoặc None"""
+        row = self.conn.execute(
+            "SELECT * FROM domain_stats WHERE domain = ?", (normalize_domain(domain),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        stats = dict(row)
+        attempts = stats['fetches'] + stats['failures']
+        stats['attempts'] = attempts
+        stats['failure_rate'] = stats['failures'] / attempts if attempts else 0.0
+        stats['fallback_rate'] = stats['fallbacks'] / stats['fetches'] if stats['fetches'] else 0.0
+        stats['avg_chars'] = stats['total_chars'] / stats['fetches'] if stats['fetches'] else 0.0
+        stats['avg_latency'] = (
+            stats['total_latency'] / stats['latency_samples'] if stats['latency_samples'] else None
+        )
+        return stats
+
+    def bad_rate(self, stats):
+        """Tỉ lệ lần thử vô dụng (lỗi HTTP + fallback), có smoothing"""
+        if not stats:
+            return self.PRIOR_BAD_RATE
+        bad = stats['failures'] + stats['fallbacks']
+        return (bad + self.PRIOR_BAD_RATE * self.PRIOR_SAMPLES) / (stats['attempts'] + self.PRIOR_SAMPLES)
+
+    def should_skip(self, stats):
+        """Domain đã thử đủ nhiều và hầu như luôn vô dụng"""
+        if not stats or stats['attempts'] < self.MIN_SAMPLES:
+            return False
+        return (stats['failures'] + stats['fallbacks']) / stats['attempts'] >= self.SKIP_RATE
+
+    def rank(self, candidates, url_key='url'):
+        """
+        Xếp lại candidates theo lịch sử domain.
+
+        Returns:
+            (ranked, skipped): skipped = [(candidate, stats)] bị bỏ qua.
+            Không bao giờ bỏ hết - luôn giữ ít nhất 1 candidate.
+        """
+        scored = []
+        skipped = []
+
+        for idx, candidate in enumerate(candidates):
+            stats = self.get(candidate[url_key])
+            if self.should_skip(stats):
+                skipped.append((idx, candidate, stats))
+                continue
+            # Giữ Google ranking, chỉ đẩy domain tệ xuống vài bậc
+            scored.append((idx + self.bad_rate(stats) * self.MAX_DEMOTION, idx, candidate))
+
+        if not scored and skipped:
+            # Tất cả đều tệ → vẫn thử cái đầu tiên
+            idx, candidate, _ = skipped.pop(0)
+            scored.append((idx, idx, candidate))
+
+        scored.sort(key=lambda entry: (entry[0], entry[1]))
+        ranked = [candidate for _, _, candidate in scored]
+        return ranked, [(candidate, stats) for _, candidate, stats in skipped]
+
+    def close(self):
+        self.conn.close()
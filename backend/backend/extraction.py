@@ -0,0 +1,685 @@
+"""
+Extraction Engine - Lấy nội dung chính từ HTML
+✅ 'density' (mặc định): chấm điểm block theo text length / link density / punctuation,
+   lấy subtree điểm cao nhất (nếu tự tin hơn kết quả cascade)
+✅ 'fast': lxml, 1 lần duyệt cây → bỏ boilerplate + gom candidates + tìm ảnh
+✅ 'legacy': BeautifulSoup cascade cũ (giữ nguyên output, bật bằng EXTRACTION_ENGINE=legacy)
+✅ Cùng thứ tự strategy: fandom → WordPress → <article> → <main> → role=main → class → <body>
+✅ Confidence (0-1) cho nội dung trả về → spider quyết định success theo chất lượng
+✅ Template: trả về selector + chữ ký layout của content root; lần sau truyền lại
+   → chỉ 1 lookup selector, không khớp nữa thì chạy full cascade
+✅ Structured facts (JSON-LD, infobox, bảng thông số, meta) lấy trước khi bỏ boilerplate
+
+File: backend/backend/extraction.py
+"""
+
+import hashlib
+import os
+import re
+import time
+from urllib.parse import urlparse
+
+import lxml.html
+from lxml import etree
+
+from backend.structured_facts import extract_facts
+
+
+# Tags luôn bỏ
+BOILERPLATE_TAGS = {'script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript'}
+
+# Class chứa các từ này → bỏ
+CLUTTER_CLASSES = ['navigation', 'sidebar', 'menu', 'footer', 'header', 'ads', 'advertisement', 'cookie', 'popup']
+
+# Fast engine: không bỏ container gốc chỉ vì class (vd <body class="has-sidebar">)
+PROTECTED_TAGS = {'html', 'body', 'main', 'article'}
+
+WP_CLASS_HINTS = ['entry-content', 'post-content', 'article-content', 'content-area']
+CONTENT_CLASS_NAMES = ['content', 'article', 'post', 'entry', 'body', 'main-content', 'page-content']
+FANDOM_BLOCK_TAGS = ('p', 'h2', 'h3', 'h4', 'ul', 'ol')
+IMAGE_SKIP_WORDS = ['logo', 'icon', 'avatar', 'ad', 'banner']
+
+# Density scoring: các tag được coi là "đoạn văn"
+PARAGRAPH_TAGS = {'p', 'pre', 'blockquote', 'td'}
+PUNCTUATION = re.compile(r'[.,;:!?…]')
+
+WP_MARKER = re.compile(r'wordpress|wp-content', re.IGNORECASE)
+WP_MARKER_BYTES = re.compile(rb'wordpress|wp-content', re.IGNORECASE)
+
+# Template đã học chỉ được dùng khi nội dung đủ tốt, nếu không → full cascade
+TEMPLATE_MIN_CONFIDENCE = 0.3
+
+# Giới hạn nội dung sau khi clean
+MAX_CONTENT_CHARS = 20000
+
+
+def extract(html, source_url, encoding=None, engine=None, template=None):
+    """
+    Extract main content + image.
+
+    Args:
+        html: str hoặc bytes (response body)
+        source_url: URL trang
+        encoding: encoding của bytes (nếu biết)
+        engine: 'density' | 'fast' | 'legacy' (mặc định: EXTRACTION_ENGINE env, 'density')
+        template: {strategy, selector, signature} đã học cho domain (bỏ qua với legacy)
+
+    Returns:
+        dict: content (chưa clean), image_url, strategy, confidence (None với legacy),
+              template (để lưu lại, hoặc None), facts (key → value), metrics
+    """
+    engine = engine or os.getenv('EXTRACTION_ENGINE', 'density')
+    started = time.perf_counter()
+
+    if engine == 'legacy':
+        result = _extract_legacy(html, source_url, encoding)
+    else:
+        result = _extract_fast(html, source_url, encoding, use_density=(engine == 'density'), template=template)
+
+    result['metrics']['engine'] = engine
+    result['metrics']['parse_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def clean_content(content, max_chars=MAX_CONTENT_CHARS):
+    """Bỏ dòng ngắn (menu), bỏ dòng trùng liền kề, giới hạn độ dài"""
+    lines = [line.strip() for line in content.split('\n') if line.strip()]
+
+    # Remove very short lines (navigation, menu items)
+    lines = [line for line in lines if len(line) > 15]
+
+    # Remove duplicates
+    cleaned_lines = []
+    prev_line = None
+    for line in lines:
+        if line != prev_line:
+            cleaned_lines.append(line)
+            prev_line = line
+
+    content = '\n'.join(cleaned_lines)
+
+    # Limit but keep substantial content
+    if max_chars and len(content) > max_chars:
+        content = content[:max_chars]
+
+    return content
+
+
+def resolve_image_src(src, source_url):
+    """//x, /x, http(s)://x → URL tuyệt đối ('' nếu không xử lý được)"""
+    if src.startswith('//'):
+        return 'https:' + src
+    if src.startswith('/'):
+        parsed = urlparse(source_url)
+        return f"{parsed.scheme}://{parsed.netloc}{src}"
+    if src.startswith('http'):
+        return src
+    return ''
+
+
+# ============== FAST ENGINE (lxml, single pass) ==============
+
+def _parse_document(html, encoding=None):
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        encoding = 'utf-8'
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding else lxml.html.HTMLParser()
+    return lxml.html.document_fromstring(html, parser=parser)
+
+
+def _text(el, separator='\n'):
+    """= BeautifulSoup get_text(separator, strip=True)"""
+    return separator.join(s.strip() for s in el.itertext() if s.strip())
+
+
+def _subtree_stats(order):
+    """
+    Stats cho mọi phần tử, tính 1 lượt bottom-up:
+    [text_len, link_len, punctuation, own_len]
+
+    - text_len = len(get_text(strip=True))
+    - link_len = phần text nằm trong <a>
+    - own_len = text trực tiếp (không tính phần tử con)
+
+    order: phần tử theo thứ tự pre-order → duyệt ngược = con trước cha.
+    """
+    stats = {}
+    for el in reversed(order):
+        own = el.text.strip() if el.text else ''
+        text_len = own_len = len(own)
+        punct = len(PUNCTUATION.findall(own)) if own else 0
+        link_len = 0
+
+        for child in el:
+            if isinstance(child.tag, str):
+                child_stats = stats.get(child)
+                if child_stats:
+                    text_len += child_stats[0]
+                    link_len += child_stats[1]
+                    punct += child_stats[2]
+            if child.tail:
+                tail = child.tail.strip()
+                text_len += len(tail)
+                own_len += len(tail)
+                punct += len(PUNCTUATION.findall(tail))
+
+        if el.tag == 'a':
+            link_len = text_len
+
+        stats[el] = [text_len, link_len, punct, own_len]
+    return stats
+
+
+def block_quality(text_len, link_len, punct):
+    """
+    Confidence 0-1 của 1 block nội dung:
+    - đủ dài (>= 1500 ký tự → tối đa)
+    - ít link (link density >= 50% → 0)
+    - có dấu câu như văn xuôi (>= 1 dấu / 100 ký tự → tối đa)
+    """
+    if text_len <= 0:
+        return 0.0, 0.0, 0.0
+
+    link_density = link_len / text_len
+    punct_density = punct / text_len
+
+    length_score = min(1.0, text_len / 1500)
+    link_score = 1.0 - min(1.0, link_density * 2)
+    punct_score = min(1.0, punct_density / 0.01)
+
+    # Nhân thêm (1 - link density): trang dài toàn menu/link không được điểm cao
+    confidence = (0.5 * length_score + 0.3 * link_score + 0.2 * punct_score) * (1 - link_density)
+    return round(confidence, 3), round(link_density, 3), round(punct_density, 4)
+
+
+def _score_blocks(order, stats):
+    """
+    Readability-style: mỗi đoạn văn cộng điểm cho cha (100%) và ông (50%),
+    điểm cuối = điểm * (1 - link density). Trả về (phần tử tốt nhất, điểm).
+    """
+    scores = {}
+
+    for el in order:
+        tag = el.tag
+        el_stats = stats[el]
+
+        if tag in PARAGRAPH_TAGS:
+            text_len, punct = el_stats[0], el_stats[2]
+        elif tag == 'div' and el_stats[3] >= 25:
+            # <div> chứa text trực tiếp = đoạn văn
+            text_len, punct = el_stats[3], el_stats[2]
+        else:
+            continue
+
+        if text_len < 25:
+            continue
+
+        score = 1 + punct + min(text_len / 100, 3)
+
+        parent = el.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0) + score
+
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+
+    best, best_score = None, 0.0
+    for el, score in scores.items():
+        el_stats = stats.get(el)
+        if not el_stats or not el_stats[0]:
+            continue
+        final = score * (1 - el_stats[1] / el_stats[0])
+        if final > best_score:
+            best, best_score = el, final
+
+    return best, best_score
+
+
+def _empty_result(strategy='none'):
+    return {
+        'content': '', 'image_url': '', 'strategy': strategy, 'confidence': 0.0, 'template': None, 'facts': {},
+        'metrics': {'nodes': 0, 'dropped': 0}
+    }
+
+
+def _walk(start, is_fandom=False, is_wordpress=False):
+    """
+    1 lần duyệt cây từ start: bỏ qua subtree boilerplate, gom candidates + meta + ảnh.
+
+    Returns:
+        dict: order (pre-order, đã bỏ boilerplate), dropped, first, fandom_root,
+              wp_hits, class_hits, og_image, tw_image, img_srcs, nodes
+    """
+    found = {
+        'fandom_root': None,
+        'wp_hits': {},
+        'first': {'article': None, 'main': None, 'role_main': None, 'body': None},
+        'class_hits': {name: [] for name in CONTENT_CLASS_NAMES},
+        'og_image': '',
+        'tw_image': '',
+        'img_srcs': [],
+        'dropped': [],
+        'order': [],
+        'nodes': 0,
+    }
+    first = found['first']
+    wp_hits = found['wp_hits']
+    class_hits = found['class_hits']
+    order = found['order']
+    dropped = found['dropped']
+
+    stack = [start]
+    while stack:
+        el = stack.pop()
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue  # comment / processing instruction
+        found['nodes'] += 1
+        tag = tag.lower()
+
+        if tag in BOILERPLATE_TAGS:
+            dropped.append(el)
+            continue
+
+        cls = (el.get('class') or '').lower()
+        if cls and tag not in PROTECTED_TAGS and any(c in cls for c in CLUTTER_CLASSES):
+            dropped.append(el)
+            continue
+
+        order.append(el)
+
+        if tag == 'meta':
+            if not found['og_image'] and el.get('property') == 'og:image':
+                found['og_image'] = el.get('content') or ''
+            elif not found['tw_image'] and el.get('name') == 'twitter:image':
+                found['tw_image'] = el.get('content') or ''
+        elif tag == 'img':
+            src = el.get('src') or el.get('data-src')
+            if src:
+                found['img_srcs'].append(src)
+        elif tag == 'article' and first['article'] is None:
+            first['article'] = el
+        elif tag == 'main' and first['main'] is None:
+            first['main'] = el
+        elif tag == 'body' and first['body'] is None:
+            first['body'] = el
+
+        if first['role_main'] is None and el.get('role') == 'main':
+            first['role_main'] = el
+
+        if cls:
+            if is_fandom and found['fandom_root'] is None and tag == 'div' and 'mw-parser-output' in cls.split():
+                found['fandom_root'] = el
+            if is_wordpress and tag in ('div', 'article'):
+                for hint in WP_CLASS_HINTS:
+                    if hint not in wp_hits and hint in cls:
+                        wp_hits[hint] = el
+            if tag in ('div', 'section'):
+                for name in CONTENT_CLASS_NAMES:
+                    if name in cls:
+                        class_hits[name].append(el)
+
+        # Duyệt con theo thứ tự document
+        stack.extend(reversed(el))
+
+    for el in dropped:
+        el.drop_tree()
+
+    return found
+
+
+def _fandom_text(fandom_root):
+    parts = []
+    for elem in fandom_root.iter(*FANDOM_BLOCK_TAGS):
+        text = _text(elem, ' ')
+        if text and len(text) > 10:
+            parts.append(text + '\n\n')
+    return ''.join(parts)
+
+
+def _pick_image(og_image, tw_image, img_srcs, source_url):
+    image_url = og_image or tw_image
+    if not image_url:
+        for src in img_srcs:
+            if not any(skip in src.lower() for skip in IMAGE_SKIP_WORDS):
+                image_url = resolve_image_src(src, source_url)
+                if image_url:
+                    break
+    return image_url
+
+
+# === TEMPLATE (selector học được theo domain) ===
+
+def element_selector(el):
+    """Selector đơn giản cho content root: 'tag#id' / 'tag.class1.class2' / 'tag'"""
+    tag = el.tag.lower()
+    el_id = (el.get('id') or '').strip()
+    if el_id and ' ' not in el_id:
+        return f'{tag}#{el_id}'
+    classes = (el.get('class') or '').split()
+    if classes:
+        return tag + ''.join(f'.{c}' for c in classes[:3])
+    return tag
+
+
+def root_signature(el):
+    """Chữ ký layout: chuỗi tag + class đầu tiên từ <html> tới content root"""
+    parts = []
+    while el is not None and isinstance(el.tag, str):
+        classes = (el.get('class') or '').split()
+        parts.append(el.tag.lower() + (f'.{classes[0]}' if classes else ''))
+        el = el.getparent()
+    raw = '>'.join(reversed(parts))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _find_selector(root, selector):
+    """Phần tử đầu tiên khớp selector dạng element_selector()"""
+    if '#' in selector:
+        tag, el_id = selector.split('#', 1)
+        matches = root.xpath(f'//{tag}[@id=$el_id]', el_id=el_id)
+    else:
+        tag, *classes = selector.split('.')
+        conditions = ''.join(
+            f'[contains(concat(" ", normalize-space(@class), " "), " {c} ")]' for c in classes
+        )
+        matches = root.xpath(f'//{tag}{conditions}')
+    return matches[0] if matches else None
+
+
+def _template_of(el, strategy):
+    if el is None or strategy in ('none', 'body'):
+        return None
+    return {
+        'strategy': strategy,
+        'selector': element_selector(el),
+        'signature': root_signature(el),
+    }
+
+
+def _extract_with_template(root, source_url, template, facts):
+    """
+    Fast path: chỉ tìm selector đã học + xử lý subtree của nó.
+    None nếu selector không còn khớp / layout đổi / nội dung kém → chạy full cascade.
+    """
+    try:
+        node = _find_selector(root, template['selector'])
+    except (etree.XPathError, KeyError, ValueError):
+        return None
+    if node is None or root_signature(node) != template.get('signature'):
+        return None
+
+    found = _walk(node)
+    stats = _subtree_stats(found['order'])
+    if node not in stats:
+        return None
+
+    if template.get('strategy') == 'fandom':
+        content = _fandom_text(node)
+    else:
+        content = _text(node)
+    confidence, link_density, punct_density = block_quality(*stats[node][:3])
+
+    if len(content) <= 100 or confidence < TEMPLATE_MIN_CONFIDENCE:
+        return None
+
+    # Ảnh: meta og/twitter (head) + ảnh trong content root, rồi tới toàn trang
+    og_image = tw_image = ''
+    for meta in root.iter('meta'):
+        if not og_image and meta.get('property') == 'og:image':
+            og_image = meta.get('content') or ''
+        elif not tw_image and meta.get('name') == 'twitter:image':
+            tw_image = meta.get('content') or ''
+    img_srcs = found['img_srcs'] or [
+        src for src in (img.get('src') or img.get('data-src') for img in root.iter('img')) if src
+    ]
+
+    return {
+        'content': content,
+        'image_url': _pick_image(og_image, tw_image, img_srcs, source_url),
+        'strategy': f"template:{template['strategy']}",
+        'confidence': confidence,
+        'template': template,
+        'facts': facts,
+        'metrics': {
+            'nodes': found['nodes'],
+            'dropped': len(found['dropped']),
+            'link_density': link_density,
+            'punct_density': punct_density,
+            'template': 'hit'
+        }
+    }
+
+
+def _extract_fast(html, source_url, encoding=None, use_density=False, template=None):
+    try:
+        root = _parse_document(html, encoding)
+    except (etree.ParserError, ValueError):
+        return _empty_result()
+
+    # === STRUCTURED FACTS: trước khi bỏ <script> JSON-LD / <aside> infobox ===
+    facts = extract_facts(root)
+
+    # === TEMPLATE: thử selector đã học cho domain trước ===
+    if template:
+        result = _extract_with_template(root, source_url, template, facts)
+        if result:
+            return result
+        # Fast path có thể đã bỏ boilerplate 1 phần cây → parse lại cho cascade
+        root = _parse_document(html, encoding)
+
+    is_fandom = 'fandom.com' in source_url or 'wikia.com' in source_url
+    # Không lowercase cả trang - regex IGNORECASE quét 1 lần
+    marker = WP_MARKER if isinstance(html, str) else WP_MARKER_BYTES
+    is_wordpress = bool(marker.search(html))
+
+    # === ONE WALK: bỏ qua subtree boilerplate, gom mọi thứ cần thiết ===
+    found = _walk(root, is_fandom, is_wordpress)
+    order = found['order']
+    first = found['first']
+    fandom_root = found['fandom_root']
+    wp_hits = found['wp_hits']
+    class_hits = found['class_hits']
+
+    # Text / link / punctuation của mọi block (1 lượt)
+    stats = _subtree_stats(order)
+
+    # === STRATEGY CASCADE (trên candidates đã gom) ===
+    content = ''
+    strategy = 'none'
+    chosen = None
+
+    # Strategy 1: Specific selectors for known platforms
+    if fandom_root is not None:
+        content = _fandom_text(fandom_root)
+        if content:
+            strategy = 'fandom'
+            chosen = fandom_root
+
+    # Strategy 2: WordPress (very common)
+    if not content and is_wordpress:
+        for hint in WP_CLASS_HINTS:
+            if hint in wp_hits:
+                chosen = wp_hits[hint]
+                content = _text(chosen)
+                strategy = f'wordpress:{hint}'
+                break
+
+    # Strategy 3: Semantic HTML5 tags
+    for key in ('article', 'main', 'role_main'):
+        if not content and first[key] is not None:
+            chosen = first[key]
+            content = _text(chosen)
+            strategy = key
+
+    # Strategy 4: Common class names
+    if not content:
+        for name in CONTENT_CLASS_NAMES:
+            candidates = class_hits[name]
+            if candidates:
+                # Get longest div (likely main content)
+                best_candidate = max(candidates, key=lambda d: stats[d][0])
+                text = _text(best_candidate)
+                if len(text) > 100:
+                    chosen = best_candidate
+                    content = text
+                    strategy = f'class:{name}'
+                    break
+
+    # Strategy 5: Last resort - body
+    if not content and first['body'] is not None:
+        chosen = first['body']
+        content = _text(chosen)
+        strategy = 'body'
+
+    confidence, link_density, punct_density = (
+        block_quality(*stats[chosen][:3]) if chosen is not None and content else (0.0, 0.0, 0.0)
+    )
+
+    # === DENSITY SCORING: thay kết quả cascade nếu tự tin hơn ===
+    if use_density:
+        best, best_score = _score_blocks(order, stats)
+        if best is not None and best is not chosen:
+            best_quality = block_quality(*stats[best][:3])
+            if best_quality[0] > confidence:
+                chosen = best
+                content = _text(best)
+                strategy = f'density:{best.tag}'
+                confidence, link_density, punct_density = best_quality
+
+    # === FIND IMAGE ===
+    image_url = _pick_image(found['og_image'], found['tw_image'], found['img_srcs'], source_url)
+
+    metrics = {
+        'nodes': found['nodes'],
+        'dropped': len(found['dropped']),
+        'link_density': link_density,
+        'punct_density': punct_density
+    }
+    if template:
+        metrics['template'] = 'miss'
+
+    return {
+        'content': content,
+        'image_url': image_url,
+        'strategy': strategy,
+        'confidence': confidence,
+        'template': _template_of(chosen, strategy) if content else None,
+        'facts': facts,
+        'metrics': metrics
+    }
+
+
+# ============== LEGACY ENGINE (BeautifulSoup cascade) ==============
+
+def _extract_legacy(html, source_url, encoding=None):
+    from bs4 import BeautifulSoup
+
+    if isinstance(html, bytes):
+        html = html.decode(encoding or 'utf-8', errors='replace')
+
+    soup = BeautifulSoup(html, 'lxml')
+
+    # Remove unwanted
+    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']):
+        tag.decompose()
+
+    # Remove clutter
+    for clutter in CLUTTER_CLASSES:
+        for elem in soup.find_all(class_=lambda x: x and clutter in x.lower()):
+            elem.decompose()
+
+    content = ''
+    strategy = 'none'
+
+    # Strategy 1: Specific selectors for known platforms
+    if 'fandom.com' in source_url or 'wikia.com' in source_url:
+        main_content = soup.find('div', class_='mw-parser-output')
+        if main_content:
+            for elem in main_content.find_all(list(FANDOM_BLOCK_TAGS)):
+                text = elem.get_text(separator=' ', strip=True)
+                if text and len(text) > 10:
+                    content += text + '\n\n'
+            if content:
+                strategy = 'fandom'
+
+    # Strategy 2: WordPress (very common)
+    if not content and ('wordpress' in html.lower() or 'wp-content' in html.lower()):
+        for class_hint in WP_CLASS_HINTS:
+            post_content = soup.find(['div', 'article'], class_=lambda x: x and class_hint in x.lower())
+            if post_content:
+                content = post_content.get_text(separator='\n', strip=True)
+                strategy = f'wordpress:{class_hint}'
+                break
+
+    # Strategy 3: Semantic HTML5 tags
+    if not content:
+        article = soup.find('article')
+        if article:
+            content = article.get_text(separator='\n', strip=True)
+            strategy = 'article'
+
+    if not content:
+        main = soup.find('main')
+        if main:
+            content = main.get_text(separator='\n', strip=True)
+            strategy = 'main'
+
+    if not content:
+        main_role = soup.find(attrs={'role': 'main'})
+        if main_role:
+            content = main_role.get_text(separator='\n', strip=True)
+            strategy = 'role_main'
+
+    # Strategy 4: Common class names
+    if not content:
+        for class_name in CONTENT_CLASS_NAMES:
+            candidates = soup.find_all(['div', 'section'], class_=lambda x: x and class_name in x.lower())
+            if candidates:
+                # Get longest div (likely main content)
+                best_candidate = max(candidates, key=lambda d: len(d.get_text(strip=True)))
+                text = best_candidate.get_text(separator='\n', strip=True)
+                if len(text) > 100:
+                    content = text
+                    strategy = f'class:{class_name}'
+                    break
+
+    # Strategy 5: Last resort - body
+    if not content:
+        body = soup.find('body')
+        if body:
+            content = body.get_text(separator='\n', strip=True)
+            strategy = 'body'
+
+    # === FIND IMAGE ===
+    image_url = ''
+
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        image_url = og_image.get('content')
+
+    if not image_url:
+        tw_image = soup.find('meta', attrs={'name': 'twitter:image'})
+        if tw_image and tw_image.get('content'):
+            image_url = tw_image.get('content')
+
+    if not image_url:
+        # Find first reasonable img
+        for img in soup.find_all('img'):
+            src = img.get('src') or img.get('data-src')
+            if src and not any(skip in src.lower() for skip in IMAGE_SKIP_WORDS):
+                image_url = resolve_image_src(src, source_url)
+                if image_url:
+                    break
+
+    return {
+        'content': content,
+        'image_url': image_url,
+        'strategy': strategy,
+        'confidence': None,
+        'template': None,
+        'facts': {},
+        'metrics': {}
+    }
@@ -0,0 +1,87 @@
+"""
+Extraction Templates - Selector nội dung đã học theo domain (SQLite)
+✅ Lưu strategy + CSS-like selector + chữ ký layout của content root thắng cuộc
+✅ Lần sau cùng domain: extract thử selector này trước (1 lookup thay vì cả cascade)
+✅ Selector hỏng N lần liên tiếp (site đổi giao diện) → quên, học lại từ cascade
+
+File: backend/backend/extraction_templates.py
+"""
+
+import os
+import time
+
+from backend.domain_stats import normalize_domain
+from backend.storage import connect, data_path
+
+
+class TemplateCache:
+    """Persistent domain → extraction template"""
+
+    # Miss liên tiếp trước khi xoá template
+    MAX_MISSES = int(os.getenv('TEMPLATE_MAX_MISSES', '3'))
+
+    def __init__(self, path=None):
+        self.path = path or data_path('templates.sqlite3', 'TEMPLATE_DB')
+        self.stats = {'hit': 0, 'miss': 0, 'learned': 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_templates (
+                domain TEXT PRIMARY KEY,
+                strategy TEXT NOT NULL,
+                selector TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                misses INTEGER DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+
+    def get(self, domain):
+        """Template {strategy, selector, signature} của domain hoặc None"""
+        row = self.conn.execute(
+            "SELECT strategy, selector, signature FROM extraction_templates WHERE domain = ?",
+            (normalize_domain(domain),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record_hit(self, domain):
+        self.stats['hit'] += 1
+        self.conn.execute(
+            "UPDATE extraction_templates SET hits = hits + 1, misses = 0, updated_at = ? WHERE domain = ?",
+            (time.time(), normalize_domain(domain))
+        )
+
+    def record_miss(self, domain):
+        """Selector không còn khớp → đếm, quá MAX_MISSES thì xoá"""
+        self.stats['miss'] += 1
+        domain = normalize_domain(domain)
+        self.conn.execute(
+            "UPDATE extraction_templates SET misses = misses + 1, updated_at = ? WHERE domain = ?",
+            (time.time(), domain)
+        )
+        self.conn.execute(
+            "DELETE FROM extraction_templates WHERE domain = ? AND misses >= ?",
+            (domain, self.MAX_MISSES)
+        )
+
+    def learn(self, domain, template):
+        """Lưu template của lần extract thành công (ghi đè template cũ)"""
+        domain = normalize_domain(domain)
+        if not domain or not template:
+            return
+        self.stats['learned'] += 1
+        self.conn.execute(
+            """INSERT INTO extraction_templates (domain, strategy, selector, signature, hits, misses, updated_at)
+               VALUES (?, ?, ?, ?, 0, 0, ?)
+               ON CONFLICT(domain) DO UPDATE SET
+                   strategy = excluded.strategy,
+                   selector = excluded.selector,
+                   signature = excluded.signature,
+                   misses = 0,
+                   updated_at = excluded.updated_at""",
+            (domain, template['strategy'], template['selector'], template['signature'], time.time())
+        )
+
+    def close(self):
+        self.conn.close()
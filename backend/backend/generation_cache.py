@@ -0,0 +1,131 @@
+"""
+Generation Cache - Cache kết quả AI theo (model, temperature, hash prompt) (SQLite)
+✅ Retry vì lỗi WordPress / chạy lại batch → prompt giống hệt → lấy lại bài, không gọi Gemini
+✅ TTL (GENERATION_CACHE_TTL, giây)
+✅ Giới hạn dung lượng (GENERATION_CACHE_MAX_MB) → xoá entry lâu không dùng nhất (LRU)
+✅ Force refresh (GENERATION_CACHE_REFRESH=1): luôn gọi API, vẫn ghi đè cache
+
+File: backend/backend/generation_cache.py
+"""
+
+import os
+import json
+import hashlib
+import time
+
+from backend.storage import connect, data_path
+
+
+# Mặc định giữ bài đã generate 30 ngày, tối đa 200 MB
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_MB = 200
+
+
+def make_generation_key(prompt, model, temperature):
+    """Key theo nội dung prompt + model + temperature"""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    raw = f"{model}|{float(temperature):.3f}|{prompt_hash}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """Content-addressed cache cho kết quả AI đã parse (title / content / excerpt)"""
+
+    def __init__(self, path=None, ttl=None, max_bytes=None, refresh=None):
+        self.path = path or data_path('generation_cache.sqlite3', 'GENERATION_CACHE_DB')
+        self.ttl = int(ttl if ttl is not None else os.getenv('GENERATION_CACHE_TTL', DEFAULT_TTL))
+        if max_bytes is None:
+            max_bytes = float(os.getenv('GENERATION_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024
+        self.max_bytes = int(max_bytes)
+        if refresh is None:
+            refresh = os.getenv('GENERATION_CACHE_REFRESH', '').lower() in ('1', 'true', 'yes')
+        self.refresh = refresh
+
+        self.stats = {'hit': 0, 'miss': 0, 'stored': 0, 'evicted': 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_last_used ON generation_cache(last_used_at)"
+        )
+
+    def get(self, prompt, model, temperature):
+        """Kết quả đã cache (dict) hoặc None nếu miss / hết hạn / refresh"""
+        if self.refresh or self.ttl <= 0:
+            self.stats['miss'] += 1
+            return None
+
+        key = make_generation_key(prompt, model, temperature)
+        row = self.conn.execute(
+            "SELECT result, created_at FROM generation_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+
+        if row is None or time.time() - row['created_at'] > self.ttl:
+            self.stats['miss'] += 1
+            return None
+
+        self.conn.execute(
+            "UPDATE generation_cache SET last_used_at = ? WHERE cache_key = ?", (time.time(), key)
+        )
+        self.stats['hit'] += 1
+        return json.loads(row['result'])
+
+    def set(self, prompt, model, temperature, data):
+        """Lưu kết quả hợp lệ (có title + content), rồi evict nếu vượt dung lượng"""
+        if not isinstance(data, dict) or not data.get('title') or not data.get('content'):
+            return
+
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        self.conn.execute(
+            """INSERT OR REPLACE INTO generation_cache
+                   (cache_key, model, result, size, created_at, last_used_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (make_generation_key(prompt, model, temperature), model, payload,
+             len(payload.encode('utf-8')), now, now)
+        )
+        self.stats['stored'] += 1
+        self.evict()
+
+    def evict(self):
+        """Xoá entry hết hạn + entry ít dùng nhất tới khi tổng dung lượng <= max_bytes"""
+        removed = self.purge_expired()
+
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM generation_cache").fetchone()[0]
+        if self.max_bytes > 0 and total > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT cache_key, size FROM generation_cache ORDER BY last_used_at"
+            ).fetchall()
+            victims = []
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append((row['cache_key'],))
+                total -= row['size']
+            self.conn.executemany("DELETE FROM generation_cache WHERE cache_key = ?", victims)
+            removed += len(victims)
+
+        self.stats['evicted'] += removed
+        return removed
+
+    def purge_expired(self):
+        """Xoá entries đã hết hạn, trả về số dòng đã xoá"""
+        if self.ttl <= 0:
+            return 0
+        cur = self.conn.execute(
+            "DELETE FROM generation_cache WHERE created_at < ?",
+            (time.time() - self.ttl,)
+        )
+        return cur.rowcount
+
+    def close(self):
+        self.conn.close()
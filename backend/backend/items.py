@@ -16,6 +16,7 @@ class BlogPostItem(scrapy.Item):
     source_url = scrapy.Field()
     raw_text = scrapy.Field()
     image_url = scrapy.Field()
+    structured_facts = scrapy.Field()
 
     # Dữ liệu AI tạo ra (Output)
     ai_title = scrapy.Field()
@@ -0,0 +1,241 @@
+"""
+Job Store - SQLite-backed, resumable keyword runs
+✅ Mỗi keyword = 1 job, định danh bằng idempotency key (keyword + category + site)
+✅ Track từng stage: searched → scraped → generated → published
+✅ Lease + heartbeat: runner chết → job tự được nhả cho runner khác
+✅ Lưu kết quả AI → chạy lại KHÔNG tốn Gemini quota lần 2
+
+File: backend/backend/jobstore.py
+"""
+
+import json
+import hashlib
+import time
+import uuid
+
+from backend.storage import connect, data_path
+
+
+STAGES = ('searched', 'scraped', 'generated', 'published')
+
+# Lease mặc định (giây) - runner phải heartbeat trước khi hết hạn
+DEFAULT_LEASE_SECONDS = 300
+
+
+def make_idempotency_key(keyword, category_name='', wp_url=''):
+    """Key cố định cho (keyword, category, site) → chạy lại không tạo job mới"""
+    raw = '|'.join([
+        ' '.join(keyword.lower().split()),
+        (category_name or '').strip().lower(),
+        (wp_url or '').strip().rstrip('/').lower(),
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def new_owner_id():
+    """ID cho 1 runner (dùng làm lease owner)"""
+    return uuid.uuid4().hex[:12]
+
+
+class JobStore:
+    """SQLite job store cho keyword runs"""
+
+    def __init__(self, path=None):
+        self.path = path or data_path('jobs.sqlite3', 'JOB_DB')
+        self.conn = connect(self.path)
+        self._init_schema()
+
+    def _init_schema(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                idempotency_key TEXT PRIMARY KEY,
+                batch_id TEXT,
+                keyword TEXT NOT NULL,
+                category_name TEXT DEFAULT '',
+                wp_url TEXT DEFAULT '',
+                status TEXT DEFAULT 'pending',
+                searched_at REAL,
+                scraped_at REAL,
+                generated_at REAL,
+                published_at REAL,
+                source_url TEXT DEFAULT '',
+                ai_result TEXT,
+                post_link TEXT DEFAULT '',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT DEFAULT '',
+                lease_owner TEXT,
+                lease_expires REAL,
+                heartbeat_at REAL,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, status)")
+
+    # === Enqueue ===
+
+    def enqueue(self, keywords, category_name='', wp_url='', batch_id=None):
+        """Thêm keywords vào store (bỏ qua job đã tồn tại), trả về list keys"""
+        now = time.time()
+        keys = []
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kw in keywords:
+                key = make_idempotency_key(kw, category_name, wp_url)
+                keys.append(key)
+                self.conn.execute(
+                    """INSERT OR IGNORE INTO jobs
+                       (idempotency_key, batch_id, keyword, category_name, wp_url,
+                        status, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)""",
+                    (key, batch_id, kw, category_name or '', wp_url or '', now, now)
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return keys
+
+    # === Lease ===
+
+    def claim(self, key, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Nhận job nếu chưa xong và không bị runner khác giữ lease"""
+        now = time.time()
+        cur = self.conn.execute(
+            """UPDATE jobs
+               SET status = 'running', lease_owner = ?, lease_expires = ?,
+                   heartbeat_at = ?, attempts = attempts + 1, updated_at = ?
+               WHERE idempotency_key = ?
+                 AND status != 'done'
+                 AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)""",
+            (owner, now + lease_seconds, now, now, key, owner, now)
+        )
+        return cur.rowcount == 1
+
+    def heartbeat(self, key, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Gia hạn lease khi job vẫn đang chạy"""
+        now = time.time()
+        cur = self.conn.execute(
+            """UPDATE jobs SET lease_expires = ?, heartbeat_at = ?
+               WHERE idempotency_key = ? AND lease_owner = ?""",
+            (now + lease_seconds, now, key, owner)
+        )
+        return cur.rowcount == 1
+
+    def complete(self, key):
+        """Job xong hoàn toàn - nhả lease"""
+        self.conn.execute(
+            """UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL,
+                   last_error = '', updated_at = ?
+               WHERE idempotency_key = ?""",
+            (time.time(), key)
+        )
+
+    def fail(self, key, error=''):
+        """Job lỗi - nhả lease, giữ nguyên các stage đã xong để resume"""
+        self.conn.execute(
+            """UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL,
+                   last_error = ?, updated_at = ?
+               WHERE idempotency_key = ?""",
+            ((error or '')[:500], time.time(), key)
+        )
+
+    # === Stages ===
+
+    def mark_stage(self, key, stage, source_url=None, ai_result=None, post_link=None):
+        """Đánh dấu 1 stage đã xong (kèm dữ liệu của stage đó)"""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+
+        now = time.time()
+        sets = [f"{stage}_at = ?", "updated_at = ?"]
+        params = [now, now]
+
+        if source_url is not None:
+            sets.append("source_url = ?")
+            params.append(source_url)
+        if ai_result is not None:
+            sets.append("ai_result = ?")
+            params.append(json.dumps(ai_result, ensure_ascii=False))
+        if post_link is not None:
+            sets.append("post_link = ?")
+            params.append(post_link)
+
+        params.append(key)
+        self.conn.execute(
+            f"UPDATE jobs SET {', '.join(sets)} WHERE idempotency_key = ?",
+            params
+        )
+
+    def record_error(self, key, error):
+        """Ghi lỗi gần nhất (không đổi status)"""
+        self.conn.execute(
+            "UPDATE jobs SET last_error = ?, updated_at = ? WHERE idempotency_key = ?",
+            ((error or '')[:500], time.time(), key)
+        )
+
+    # === Query ===
+
+    def get(self, key):
+        """Lấy 1 job (dict) hoặc None"""
+        row = self.conn.execute(
+            "SELECT * FROM jobs WHERE idempotency_key = ?", (key,)
+        ).fetchone()
+        return self._to_dict(row)
+
+    def get_ai_result(self, key):
+        """Kết quả AI đã lưu (nếu stage generated đã xong)"""
+        job = self.get(key)
+        if job and job.get('generated_at') and job.get('ai_result'):
+            return job['ai_result']
+        return None
+
+    def is_published(self, key):
+        job = self.get(key)
+        return bool(job and job.get('published_at'))
+
+    def unfinished(self, category_name=None, wp_url=None, batch_id=None):
+        """Jobs chưa xong (pending / failed / running với lease đã hết hạn)"""
+        query = """SELECT * FROM jobs
+                   WHERE status != 'done'
+                     AND (lease_owner IS NULL OR lease_expires < ?)"""
+        params = [time.time()]
+
+        if category_name is not None:
+            query += " AND category_name = ?"
+            params.append(category_name)
+        if wp_url is not None:
+            query += " AND wp_url = ?"
+            params.append(wp_url)
+        if batch_id is not None:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+
+        query += " ORDER BY created_at"
+        return [self._to_dict(row) for row in self.conn.execute(query, params)]
+
+    def summary(self, batch_id=None):
+        """Đếm jobs theo status"""
+        query = "SELECT status, COUNT(*) AS n FROM jobs"
+        params = []
+        if batch_id is not None:
+            query += " WHERE batch_id = ?"
+            params.append(batch_id)
+        query += " GROUP BY status"
+        return {row['status']: row['n'] for row in self.conn.execute(query, params)}
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        if job.get('ai_result'):
+            try:
+                job['ai_result'] = json.loads(job['ai_result'])
+            except ValueError:
+                job['ai_result'] = None
+        return job
+
+    def close(self):
+        self.conn.close()
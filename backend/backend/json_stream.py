@@ -0,0 +1,161 @@
+"""
+JSON Stream Validator - Kiểm tra JSON của AI ngay trong lúc stream
+✅ Nhận từng chunk text, theo dõi cấu trúc (string / escape / độ sâu)
+✅ Phát hiện sớm: không phải JSON, key ngoài schema, giá trị sai kiểu, ngoặc lệch
+✅ Bỏ qua ```json fence / text thừa ở đầu và cuối (như _extract_json)
+✅ Sai → raise StreamValidationError → pipeline huỷ stream và retry ngay
+
+File: backend/backend/json_stream.py
+"""
+
+
+# Tối đa bao nhiêu ký tự "rác" (```json, lời dẫn) trước dấu { đầu tiên
+MAX_PREAMBLE_CHARS = 300
+
+
+class StreamValidationError(ValueError):
+    """Response stream không đúng JSON / schema"""
+
+
+class IncrementalJSONValidator:
+    """
+    Validator 1 lượt cho object JSON top-level dạng {"key": "string", ...}.
+
+    Không dựng lại object - chỉ kiểm tra; text đầy đủ vẫn parse bằng json.loads ở cuối.
+    """
+
+    def __init__(self, allowed_keys, string_keys=None):
+        self.allowed_keys = set(allowed_keys)
+        self.string_keys = set(string_keys if string_keys is not None else allowed_keys)
+
+        self.chars = 0
+        self.preamble_chars = 0
+        self.started = False
+        self.finished = False
+        self.stack = []
+
+        self.in_string = False
+        self.escape = False
+        self.string_buf = []
+        self.expect = 'key'          # depth 1: 'key' → ':' → 'value' → ',' ...
+        self.current_key = None
+        self.keys = []
+
+    @property
+    def complete(self):
+        return self.finished
+
+    def feed(self, text):
+        for ch in text:
+            self.chars += 1
+            if not self.started:
+                self._feed_preamble(ch)
+            elif not self.finished:
+                self._feed_char(ch)
+            else:
+                # Phần sau object (``` đóng fence...) bị _extract_json bỏ qua
+                return
+
+    # === Trước dấu { ===
+
+    def _feed_preamble(self, ch):
+        if ch == '{':
+            self.started = True
+            self.stack.append('{')
+            self.expect = 'key'
+            return
+
+        self.preamble_chars += 1
+        if self.preamble_chars > MAX_PREAMBLE_CHARS:
+            raise StreamValidationError("No JSON object in response preamble")
+
+    # === Trong object ===
+
+    def _feed_char(self, ch):
+        depth = len(self.stack)
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == '\\':
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                if depth == 1 and self.expect == 'key':
+                    self._on_key(''.join(self.string_buf))
+                    self.expect = ':'
+                elif depth == 1 and self.expect == 'value':
+                    self.expect = ','
+            elif depth == 1 and self.expect == 'key':
+                self.string_buf.append(ch)
+            return
+
+        if ch.isspace():
+            return
+
+        if depth == 1:
+            self._feed_top_level(ch)
+            return
+
+        # Giá trị lồng (list / object) của key không bắt buộc là string
+        if ch == '"':
+            self.in_string = True
+        elif ch in '{[':
+            self.stack.append(ch)
+        elif ch in '}]':
+            self._close(ch)
+            if len(self.stack) == 1:
+                self.expect = ','
+
+    def _feed_top_level(self, ch):
+        if self.expect == 'key':
+            if ch == '"':
+                self.in_string = True
+                self.string_buf = []
+            elif ch == '}' and not self.keys:
+                self._close(ch)
+            else:
+                raise StreamValidationError(f"Expected key, got {ch!r}")
+
+        elif self.expect == ':':
+            if ch != ':':
+                raise StreamValidationError(f"Expected ':' after key {self.current_key!r}")
+            self.expect = 'value'
+
+        elif self.expect == 'value':
+            if self.current_key in self.string_keys and ch != '"':
+                raise StreamValidationError(f"Value of {self.current_key!r} must be a string")
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.stack.append(ch)
+            else:
+                # number / true / false / null: chờ tới ',' hoặc '}'
+                self.expect = 'scalar'
+
+        elif self.expect in (',', 'scalar'):
+            if ch == ',':
+                self.expect = 'key'
+            elif ch == '}':
+                self._close(ch)
+            elif self.expect == ',':
+                raise StreamValidationError(f"Expected ',' or '}}' after {self.current_key!r}, got {ch!r}")
+
+    def _on_key(self, key):
+        if key not in self.allowed_keys:
+            raise StreamValidationError(f"Unexpected key {key!r} (schema: {sorted(self.allowed_keys)})")
+        if key in self.keys:
+            raise StreamValidationError(f"Duplicate key {key!r}")
+        self.keys.append(key)
+        self.current_key = key
+
+    def _close(self, ch):
+        opener = self.stack.pop() if self.stack else None
+        if (opener, ch) not in (('{', '}'), ('[', ']')):
+            raise StreamValidationError(f"Mismatched {ch!r}")
+        if not self.stack:
+            self.finished = True
+
+    def missing(self, required):
+        """Key bắt buộc chưa xuất hiện"""
+        return [key for key in required if key not in self.keys]
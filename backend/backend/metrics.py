@@ -0,0 +1,219 @@
+"""
+AI Metrics - Telemetry token / chi phí / latency cho từng lần gọi Gemini (SQLite)
+✅ Ghi prompt / output / cached / thinking tokens từ usage_metadata, model, latency, lần thử
+✅ Chi phí thật theo bảng giá từng model (GEMINI_PRICING ghi đè)
+✅ Tiết kiệm nhờ cache: context cache (token cached rẻ hơn) + generation cache (không gọi API)
+✅ Dashboard đọc summary(): chi phí / keyword, tokens/s, tiết kiệm
+
+Config:
+    GEMINI_PRICING='{"gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached": 0.075}}'  (USD / 1M tokens)
+    METRICS_DB=/path/metrics.sqlite3
+
+File: backend/backend/metrics.py
+"""
+
+import os
+import json
+import time
+
+from backend.storage import connect, data_path
+
+
+# USD / 1M tokens (output đã gồm thinking tokens)
+DEFAULT_PRICING = {
+    'gemini-2.5-flash': {'input': 0.30, 'output': 2.50, 'cached': 0.075},
+    'gemini-2.5-pro': {'input': 1.25, 'output': 10.00, 'cached': 0.31},
+}
+
+
+def load_pricing():
+    """DEFAULT_PRICING + GEMINI_PRICING (JSON) từ env"""
+    pricing = {model: dict(price) for model, price in DEFAULT_PRICING.items()}
+    raw = os.getenv('GEMINI_PRICING', '')
+    if raw:
+        for model, price in json.loads(raw).items():
+            pricing.setdefault(model, {}).update(price)
+    return pricing
+
+
+def usage_tokens(response):
+    """usage_metadata của response / chunk cuối → dict token counts (0 nếu thiếu)"""
+    usage = getattr(response, 'usage_metadata', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_token_count', None) or 0,
+        'output_tokens': getattr(usage, 'candidates_token_count', None) or 0,
+        'cached_tokens': getattr(usage, 'cached_content_token_count', None) or 0,
+        'thoughts_tokens': getattr(usage, 'thoughts_token_count', None) or 0,
+    }
+
+
+class MetricsStore:
+    """Log từng lần gọi AI + tổng hợp cho dashboard"""
+
+    def __init__(self, path=None, pricing=None):
+        self.path = path or data_path('metrics.sqlite3', 'METRICS_DB')
+        self.pricing = pricing if pricing is not None else load_pricing()
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                keyword TEXT,
+                model TEXT,
+                kind TEXT,
+                status TEXT,
+                attempt INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                thoughts_tokens INTEGER DEFAULT 0,
+                latency REAL,
+                cost REAL DEFAULT 0,
+                saved REAL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_created ON ai_calls(created_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_keyword ON ai_calls(keyword)")
+
+    # === Cost ===
+
+    def cost(self, model, prompt_tokens=0, output_tokens=0, cached_tokens=0, thoughts_tokens=0):
+        """Chi phí USD của 1 lần gọi (token cached tính giá cached)"""
+        price = self.pricing.get(model)
+        if not price:
+            return 0.0
+        fresh = max(0, prompt_tokens - cached_tokens)
+        return (
+            fresh * price.get('input', 0)
+            + cached_tokens * price.get('cached', price.get('input', 0))
+            + (output_tokens + thoughts_tokens) * price.get('output', 0)
+        ) / 1e6
+
+    def cached_savings(self, model, cached_tokens):
+        """Tiết kiệm nhờ context cache: cached tokens tính giá input thường vs giá cached"""
+        price = self.pricing.get(model)
+        if not price or not cached_tokens:
+            return 0.0
+        return cached_tokens * (price.get('input', 0) - price.get('cached', price.get('input', 0))) / 1e6
+
+    # === Record ===
+
+    def record_call(self, model, response=None, keyword=None, kind='generate', status='ok',
+                    attempt=0, latency=None, error=None, tokens=None):
+        """
+        1 lần gọi Gemini (thành công hoặc lỗi) → 1 dòng.
+        tokens: token counts thay cho usage_metadata (request bị huỷ giữa chừng → ước lượng)
+        """
+        tokens = tokens or usage_tokens(response)
+        cost = self.cost(model, **tokens)
+        saved = self.cached_savings(model, tokens['cached_tokens'])
+        self._insert(keyword, model, kind, status, attempt, tokens, latency, cost, saved, error)
+        return cost
+
+    def record_cache_hit(self, model, keyword=None, prompt_tokens=0):
+        """
+        Generation cache hit → không gọi API.
+        Tiết kiệm ≈ prompt ước lượng + output trung bình của model.
+        """
+        row = self.conn.execute(
+            """SELECT AVG(output_tokens + thoughts_tokens) FROM ai_calls
+               WHERE model = ? AND kind = 'generate' AND status = 'ok'""",
+            (model,)
+        ).fetchone()
+        avg_output = row[0] or 0
+        saved = self.cost(model, prompt_tokens=prompt_tokens, output_tokens=int(avg_output))
+        tokens = {'prompt_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0, 'thoughts_tokens': 0}
+        self._insert(keyword, model, 'generation_cache', 'ok', 0, tokens, None, 0.0, saved, None)
+
+    def _insert(self, keyword, model, kind, status, attempt, tokens, latency, cost, saved, error):
+        self.conn.execute(
+            """INSERT INTO ai_calls
+                   (created_at, keyword, model, kind, status, attempt, prompt_tokens, output_tokens,
+                    cached_tokens, thoughts_tokens, latency, cost, saved, error)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (time.time(), keyword, model, kind, status, attempt, tokens['prompt_tokens'],
+             tokens['output_tokens'], tokens['cached_tokens'], tokens['thoughts_tokens'],
+             latency, cost, saved, str(error)[:500] if error else None)
+        )
+
+    # === Query ===
+
+    def summary(self, since=None):
+        """
+        Tổng hợp từ `since` (timestamp, None = tất cả).
+
+        Returns:
+            dict: calls, keywords, cost, cost_per_keyword, tokens_per_second, saved,
+                  retries, cache_hits, per_model (list dict)
+        """
+        since = since or 0
+        row = self.conn.execute(
+            """SELECT
+                   SUM(kind != 'generation_cache') AS calls,
+                   COUNT(DISTINCT keyword) AS keywords,
+                   COALESCE(SUM(cost), 0) AS cost,
+                   COALESCE(SUM(saved), 0) AS saved,
+                   SUM(status != 'ok') AS retries,
+                   SUM(kind = 'generation_cache') AS cache_hits,
+                   COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(output_tokens + thoughts_tokens), 0) AS output_tokens,
+                   COALESCE(SUM(cached_tokens), 0) AS cached_tokens
+               FROM ai_calls WHERE created_at >= ?""",
+            (since,)
+        ).fetchone()
+        stats = {key: row[key] or 0 for key in row.keys()}
+        stats['cost_per_keyword'] = stats['cost'] / stats['keywords'] if stats['keywords'] else None
+        stats['tokens_per_second'] = self._tokens_per_second(since)
+
+        stats['per_model'] = [
+            dict(model_row) for model_row in self.conn.execute(
+                """SELECT model,
+                          SUM(kind != 'generation_cache') AS calls,
+                          SUM(status != 'ok') AS failed,
+                          COALESCE(SUM(cost), 0) AS cost,
+                          COALESCE(SUM(saved), 0) AS saved,
+                          AVG(CASE WHEN status = 'ok' AND kind = 'generate' THEN latency END) AS avg_latency,
+                          COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                          COALESCE(SUM(output_tokens + thoughts_tokens), 0) AS output_tokens,
+                          COALESCE(SUM(cached_tokens), 0) AS cached_tokens
+                   FROM ai_calls WHERE created_at >= ?
+                   GROUP BY model ORDER BY cost DESC""",
+                (since,)
+            )
+        ]
+        return stats
+
+    def _tokens_per_second(self, since):
+        """Output tokens / giây trên các lần gọi thành công có đo latency"""
+        row = self.conn.execute(
+            """SELECT SUM(output_tokens + thoughts_tokens), SUM(latency) FROM ai_calls
+               WHERE created_at >= ? AND status = 'ok' AND latency > 0""",
+            (since,)
+        ).fetchone()
+        return row[0] / row[1] if row[0] and row[1] else None
+
+    def recent_keywords(self, limit=20):
+        """Chi phí / token / số lần gọi theo keyword (mới nhất trước)"""
+        return [
+            dict(row) for row in self.conn.execute(
+                """SELECT keyword,
+                          GROUP_CONCAT(DISTINCT model) AS models,
+                          SUM(kind != 'generation_cache') AS calls,
+                          SUM(status != 'ok') AS retries,
+                          COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                          COALESCE(SUM(output_tokens + thoughts_tokens), 0) AS output_tokens,
+                          COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+                          ROUND(COALESCE(SUM(latency), 0), 1) AS latency,
+                          COALESCE(SUM(cost), 0) AS cost,
+                          COALESCE(SUM(saved), 0) AS saved,
+                          MAX(created_at) AS last_at
+                   FROM ai_calls WHERE keyword IS NOT NULL
+                   GROUP BY keyword ORDER BY last_at DESC LIMIT ?""",
+                (limit,)
+            )
+        ]
+
+    def close(self):
+        self.conn.close()
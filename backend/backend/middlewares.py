@@ -0,0 +1,30 @@
+"""
+Scrapy Middlewares
+✅ Huỷ request candidates của keyword đã thành công (chưa download)
+
+File: backend/backend/middlewares.py
+"""
+
+from scrapy.exceptions import IgnoreRequest
+
+
+class CandidateCancelMiddleware:
+    """Drop pending candidate requests khi keyword đã có kết quả"""
+
+    def process_request(self, request, spider):
+        try_index = request.meta.get('try_index')
+        keyword = request.meta.get('keyword')
+
+        if try_index is None or keyword is None:
+            return None
+
+        coordinators = getattr(spider, 'coordinators', None)
+        if not coordinators:
+            return None
+
+        coordinator = coordinators.get(keyword)
+        if coordinator and not coordinator.is_active(try_index - 1):
+            spider.logger.debug(f"⏭️ Cancel: {request.url[:80]} (keyword done)")
+            raise IgnoreRequest(f"Keyword already resolved: {keyword}")
+
+        return None
@@ -0,0 +1,248 @@
+"""
+Model Router - Chọn model Gemini theo sức khoẻ thực tế (SQLite, dùng chung giữa các process)
+✅ Rolling latency + tỉ lệ lỗi (EWMA) theo từng model, qua nhiều item / nhiều lần chạy
+✅ Circuit breaker: model lỗi liên tiếp / hết quota / 404 → mở mạch, bỏ qua tới hết cooldown
+✅ Hết cooldown → half-open: cho 1 request thử, lỗi tiếp → mở lại với cooldown gấp đôi
+✅ Xếp lại candidates: giữ PREFERRED_MODEL, model hay lỗi bị đẩy xuống
+
+Config:
+    CIRCUIT_FAILURE_THRESHOLD=3   lỗi liên tiếp trước khi mở mạch
+    CIRCUIT_COOLDOWN=300          cooldown (giây) cho lỗi thường, gấp đôi mỗi lần mở lại
+    CIRCUIT_QUOTA_COOLDOWN=60     cooldown khi model liên tục 429
+    CIRCUIT_NOT_FOUND_COOLDOWN=86400
+    MODEL_ROUTER_DB=/path/model_router.sqlite3
+
+File: backend/backend/model_router.py
+"""
+
+import os
+import time
+
+from backend.storage import connect, data_path
+
+
+# Loại lỗi → (số lần liên tiếp trước khi mở mạch, env cooldown, cooldown mặc định)
+# Không có 'invalid' (sai JSON / schema): thường do prompt của 1 keyword, không phải sức khoẻ model
+FAILURE_POLICIES = {
+    'error': ('CIRCUIT_FAILURE_THRESHOLD', 3, 'CIRCUIT_COOLDOWN', 300),
+    'quota': ('CIRCUIT_QUOTA_THRESHOLD', 2, 'CIRCUIT_QUOTA_COOLDOWN', 60),
+    'not_found': ('CIRCUIT_NOT_FOUND_THRESHOLD', 1, 'CIRCUIT_NOT_FOUND_COOLDOWN', 86400),
+}
+
+# Cooldown tối đa sau nhiều lần mở lại liên tiếp (trừ khi cooldown gốc đã dài hơn)
+MAX_COOLDOWN = 3600 * 6
+
+# Trọng số EWMA cho mẫu mới (latency, tỉ lệ lỗi)
+EWMA_ALPHA = 0.2
+
+# Model lỗi 100% bị đẩy xuống tối đa N vị trí so với thứ tự ưu tiên
+MAX_DEMOTION = 2
+
+# Giữ N mẫu latency gần nhất / model (cho percentile)
+LATENCY_WINDOW = 200
+
+
+class ModelRouter:
+    """Persistent per-model health + circuit breaker"""
+
+    def __init__(self, path=None):
+        self.path = path or data_path('model_router.sqlite3', 'MODEL_ROUTER_DB')
+        self.stats = {'opened': 0, 'skipped': 0, 'probes': 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS model_health (
+                model TEXT PRIMARY KEY,
+                calls INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                error_rate REAL DEFAULT 0,
+                avg_latency REAL,
+                consecutive_failures INTEGER DEFAULT 0,
+                last_error_kind TEXT,
+                last_error TEXT,
+                open_until REAL DEFAULT 0,
+                open_count INTEGER DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS model_latency (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT NOT NULL,
+                latency REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_model_latency_model ON model_latency(model, id)"
+        )
+
+    # === Update ===
+
+    def record_success(self, model, latency=None):
+        """Gọi thành công → đóng mạch, cập nhật EWMA"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._row(model)
+            error_rate = (1 - EWMA_ALPHA) * row['error_rate'] if row else 0.0
+            avg_latency = row['avg_latency'] if row else None
+            if latency is not None:
+                avg_latency = latency if avg_latency is None else (
+                    (1 - EWMA_ALPHA) * avg_latency + EWMA_ALPHA * latency
+                )
+                self._add_latency(model, latency, now)
+
+            self._save(model, now, calls=1, error_rate=error_rate, avg_latency=avg_latency,
+                       consecutive_failures=0, open_until=0, open_count=0)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def record_latency(self, model, latency):
+        """
+        Chỉ thêm mẫu latency cho percentile (không tính là 1 lần gọi).
+        Dùng cho request chính bị hedge thắng: thời gian đã chạy là cận dưới latency thật.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._add_latency(model, latency, time.time())
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _add_latency(self, model, latency, now):
+        self.conn.execute(
+            "INSERT INTO model_latency (model, latency, created_at) VALUES (?, ?, ?)",
+            (model, float(latency), now)
+        )
+        self.conn.execute(
+            """DELETE FROM model_latency WHERE model = ? AND id <= (
+                   SELECT id FROM model_latency WHERE model = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+               )""",
+            (model, model, LATENCY_WINDOW)
+        )
+
+    def record_failure(self, model, kind='error', error=None):
+        """
+        Gọi lỗi → cập nhật EWMA, mở mạch nếu vượt ngưỡng của loại lỗi.
+
+        Returns:
+            True nếu mạch của model đang mở (caller nên chuyển model khác)
+        """
+        threshold_env, threshold, cooldown_env, cooldown = FAILURE_POLICIES.get(kind, FAILURE_POLICIES['error'])
+        threshold = int(os.getenv(threshold_env, threshold))
+        cooldown = float(os.getenv(cooldown_env, cooldown))
+
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._row(model)
+            error_rate = (1 - EWMA_ALPHA) * (row['error_rate'] if row else 0.0) + EWMA_ALPHA
+            consecutive = (row['consecutive_failures'] if row else 0) + 1
+            open_until = row['open_until'] if row else 0
+            open_count = row['open_count'] if row else 0
+
+            # Half-open (vừa hết cooldown) mà lỗi tiếp → mở lại ngay
+            # Đang mở (request khác cùng lúc lỗi) → giữ nguyên cooldown
+            half_open = open_count > 0
+            if open_until <= now and (consecutive >= threshold or half_open):
+                open_until = now + min(max(MAX_COOLDOWN, cooldown), cooldown * (2 ** open_count))
+                open_count += 1
+                self.stats['opened'] += 1
+
+            self._save(model, now, calls=1, failures=1, error_rate=error_rate,
+                       avg_latency=row['avg_latency'] if row else None,
+                       consecutive_failures=consecutive, open_until=open_until, open_count=open_count,
+                       last_error_kind=kind, last_error=str(error)[:500] if error else None)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return open_until > now
+
+    def _row(self, model):
+        return self.conn.execute("SELECT * FROM model_health WHERE model = ?", (model,)).fetchone()
+
+    def _save(self, model, now, calls=0, failures=0, error_rate=0.0, avg_latency=None,
+              consecutive_failures=0, open_until=0, open_count=0, last_error_kind=None, last_error=None):
+        self.conn.execute(
+            """INSERT INTO model_health
+                   (model, calls, failures, error_rate, avg_latency, consecutive_failures,
+                    last_error_kind, last_error, open_until, open_count, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(model) DO UPDATE SET
+                   calls = calls + excluded.calls,
+                   failures = failures + excluded.failures,
+                   error_rate = excluded.error_rate,
+                   avg_latency = excluded.avg_latency,
+                   consecutive_failures = excluded.consecutive_failures,
+                   last_error_kind = COALESCE(excluded.last_error_kind, last_error_kind),
+                   last_error = COALESCE(excluded.last_error, last_error),
+                   open_until = excluded.open_until,
+                   open_count = excluded.open_count,
+                   updated_at = excluded.updated_at""",
+            (model, calls, failures, error_rate, avg_latency, consecutive_failures,
+             last_error_kind, last_error, open_until, open_count, now)
+        )
+
+    # === Query ===
+
+    def get(self, model):
+        """Health của model (dict) hoặc None nếu chưa có dữ liệu"""
+        row = self._row(model)
+        return dict(row) if row else None
+
+    def is_open(self, model):
+        """Mạch đang mở (trong cooldown) → không gọi model này"""
+        row = self._row(model)
+        return bool(row and row['open_until'] > time.time())
+
+    def latency_percentile(self, model, pct, min_samples=1):
+        """Percentile latency (giây) trên LATENCY_WINDOW mẫu gần nhất, None nếu chưa đủ min_samples mẫu"""
+        rows = self.conn.execute(
+            "SELECT latency FROM model_latency WHERE model = ? ORDER BY id DESC LIMIT ?",
+            (model, LATENCY_WINDOW)
+        ).fetchall()
+        if not rows or len(rows) < min_samples:
+            return None
+        values = sorted(row['latency'] for row in rows)
+        idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+        return values[idx]
+
+    def rank(self, candidates):
+        """
+        Xếp lại models theo health.
+
+        Returns:
+            (ranked, skipped): skipped = [(model, health)] đang mở mạch.
+            Không bao giờ bỏ hết - tất cả đều mở → thử model sắp hết cooldown nhất.
+        """
+        now = time.time()
+        scored = []
+        skipped = []
+
+        for idx, model in enumerate(candidates):
+            health = self.get(model)
+            if health and health['open_until'] > now:
+                skipped.append((health['open_until'], idx, model, health))
+                continue
+            # Giữ thứ tự ưu tiên, model hay lỗi bị đẩy xuống
+            error_rate = health['error_rate'] if health else 0.0
+            scored.append((idx + error_rate * MAX_DEMOTION, idx, model))
+
+        if not scored and skipped:
+            skipped.sort()
+            _, idx, model, _ = skipped.pop(0)
+            scored.append((idx, idx, model))
+            self.stats['probes'] += 1
+
+        self.stats['skipped'] += len(skipped)
+        scored.sort(key=lambda entry: (entry[0], entry[1]))
+        return [model for _, _, model in scored], [(model, health) for _, _, model, health in skipped]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,121 @@
+"""
+Outline Mode - Bài dài: dàn ý trước, viết các phần (H2) song song rồi ghép lại
+✅ Tách dàn ý HTML (mở bài + <h2> + ghi chú) thành danh sách phần
+✅ Kiểm tra dàn ý: đủ số phần, không trùng tiêu đề
+✅ Kiểm tra từng phần: đúng tiêu đề, đúng 1 <h2>, không lấn sang phần khác, đủ độ dài
+✅ Ghép mở bài + các phần theo thứ tự dàn ý → ai_content
+
+File: backend/backend/outline.py
+"""
+
+import html
+import re
+
+
+MIN_SECTIONS = 3
+MAX_SECTIONS = 8
+
+# Mỗi phần tối thiểu N từ (dù min_words / số phần nhỏ hơn)
+MIN_SECTION_WORDS = 200
+
+# Phần ngắn hơn tỉ lệ này so với mục tiêu → viết lại
+SHORT_SECTION_RATIO = 0.4
+
+H2_RE = re.compile(r'<h2[^>]*>(.*?)</h2\s*>', re.IGNORECASE | re.DOTALL)
+H1_RE = re.compile(r'<h1[^>]*>.*?</h1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]+>')
+NUMBERING_RE = re.compile(r'^\s*(?:phần\s*)?\d+[.):\-]\s*', re.IGNORECASE)
+
+
+def strip_tags(fragment):
+    """HTML → text (bỏ thẻ, unescape, gộp khoảng trắng)"""
+    return ' '.join(html.unescape(TAG_RE.sub(' ', fragment or '')).split())
+
+
+def normalize_heading(heading):
+    """So khớp tiêu đề: bỏ thẻ, số thứ tự đầu dòng, dấu câu cuối, không phân biệt hoa thường"""
+    text = NUMBERING_RE.sub('', strip_tags(heading)).lower()
+    return text.strip(' .:;!?-–—"\'')
+
+
+def count_words(fragment):
+    return len(strip_tags(fragment).split())
+
+
+def parse_outline(content):
+    """
+    HTML dàn ý → (intro_html, sections).
+
+    sections = [{'heading': str, 'notes': str}] theo thứ tự <h2> (bỏ số thứ tự đầu tiêu đề)
+    """
+    parts = H2_RE.split(content or '')
+    intro = parts[0].strip()
+    sections = []
+    for idx in range(1, len(parts) - 1, 2):
+        heading = NUMBERING_RE.sub('', strip_tags(parts[idx]))
+        if heading:
+            sections.append({'heading': heading, 'notes': strip_tags(parts[idx + 1])})
+    return intro, sections
+
+
+def check_outline(sections):
+    """Lỗi của dàn ý (list rỗng = hợp lệ)"""
+    problems = []
+    if len(sections) < MIN_SECTIONS:
+        problems.append(f"only {len(sections)} sections (min {MIN_SECTIONS})")
+    if len(sections) > MAX_SECTIONS:
+        problems.append(f"{len(sections)} sections (max {MAX_SECTIONS})")
+
+    seen = set()
+    for section in sections:
+        key = normalize_heading(section['heading'])
+        if key in seen:
+            problems.append(f"duplicate heading {section['heading']!r}")
+        seen.add(key)
+    return problems
+
+
+def section_words(min_words, intro, sections):
+    """Số từ mục tiêu / phần: phần còn lại của min_words sau mở bài, chia đều"""
+    remaining = max(0, min_words - count_words(intro))
+    return max(MIN_SECTION_WORDS, remaining // max(1, len(sections)))
+
+
+def check_section(data, sections, index, words):
+    """
+    Kiểm tra + chuẩn hoá 1 phần AI đã viết.
+
+    Returns:
+        (html, problems): html bắt đầu bằng <h2> đúng tiêu đề dàn ý; problems rỗng = hợp lệ
+    """
+    expected = sections[index]['heading']
+    content = H1_RE.sub('', data.get('content', '')).strip()
+    problems = []
+
+    if normalize_heading(data.get('title', '')) != normalize_heading(expected):
+        problems.append(f"title {data.get('title', '')!r} does not match heading {expected!r}")
+
+    headings = [normalize_heading(h) for h in H2_RE.findall(content)]
+    others = {normalize_heading(entry['heading']) for pos, entry in enumerate(sections) if pos != index}
+    overlap = [h for h in headings if h in others]
+    if overlap:
+        problems.append(f"contains other sections ({', '.join(overlap)})")
+    elif len(headings) > 1:
+        problems.append(f"{len(headings)} <h2> headings, expected 1")
+
+    # Thiếu / sai <h2> đầu phần → dùng đúng tiêu đề dàn ý
+    if not headings:
+        content = f"<h2>{html.escape(expected)}</h2>\n{content}"
+    elif headings[0] != normalize_heading(expected) and not overlap:
+        content = H2_RE.sub(f"<h2>{html.escape(expected)}</h2>", content, count=1)
+
+    written = count_words(content)
+    if written < words * SHORT_SECTION_RATIO:
+        problems.append(f"too short ({written} words, target {words})")
+
+    return content, problems
+
+
+def assemble(intro, sections_html):
+    """Mở bài + các phần theo thứ tự → HTML bài hoàn chỉnh"""
+    return '\n\n'.join(part.strip() for part in [intro, *sections_html] if part and part.strip())
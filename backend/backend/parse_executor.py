@@ -0,0 +1,52 @@
+"""
+Parse Executor - Chạy extract HTML ngoài reactor (process pool)
+✅ PARSE_WORKERS=N: N process con parse lxml/BeautifulSoup song song
+✅ Reactor không bị block → multi-keyword crawl vẫn tải trang trong lúc parse
+✅ Kết quả trả về dạng Deferred (callback Scrapy await được)
+✅ PARSE_WORKERS=0 (mặc định): parse ngay trong process, cùng API
+
+File: backend/backend/parse_executor.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from twisted.internet import defer
+
+from backend.extraction import extract
+
+
+class ParseExecutor:
+    """Process pool cho extract(), kết quả là Deferred"""
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = int(os.getenv('PARSE_WORKERS', '0') or 0)
+        self.workers = max(0, workers)
+        self.pool = None
+
+        if self.workers:
+            # spawn: process con sạch, không kế thừa reactor / SQLite connections
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+    def submit(self, body, source_url, encoding=None, **kwargs):
+        """
+        extract(body, source_url, encoding, ...) → Deferred[dict]
+
+        Body phải là bytes/str (pickle được) - không truyền response object.
+        """
+        if not self.pool:
+            return defer.maybeDeferred(extract, body, source_url, encoding=encoding, **kwargs)
+
+        future = self.pool.submit(extract, body, source_url, encoding=encoding, **kwargs)
+        return defer.Deferred.fromFuture(asyncio.wrap_future(future))
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
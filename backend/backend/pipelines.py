@@ -1,18 +1,83 @@
 """
 Scrapy Pipelines - V3 Universal System ONLY (OPTIMIZED)
 Clean version with improved error handling and stats
+✅ Gemini async (client.aio): không block reactor, nhiều keyword generate song song
+✅ AI_CONCURRENCY: số request Gemini đồng thời tối đa
+✅ Backoff rate limit bằng asyncio.sleep (crawl vẫn chạy trong lúc chờ)
+✅ Rate limiter dùng chung giữa các process (RPM/TPM theo model) → không chạm 429
+✅ Streaming (AI_STREAMING): kiểm tra JSON từng chunk, sai schema → huỷ + retry ngay
+✅ Structured output (AI_STRUCTURED_OUTPUT): response_mime_type JSON + schema title/excerpt/content
+✅ Response bị cắt (MAX_TOKENS / JSON dở dang) → request "viết tiếp" + ghép, không generate lại
+✅ Model router: latency / tỉ lệ lỗi theo model + circuit breaker → bỏ qua model đang hỏng
+✅ Hedged requests (AI_HEDGING=1): call chính chậm quá percentile latency → gọi thêm 1 request, lấy cái xong trước
+✅ Metrics: token (prompt / output / cached), latency, chi phí từng lần gọi → metrics store cho dashboard
+✅ Outline mode (AI_OUTLINE_MODE=deep|all): bài dài → dàn ý, viết các phần song song, kiểm tra rồi ghép
+✅ Context caching: phần prompt tĩnh theo category → system instruction + Gemini cached content
+   (prefix hiện tại < mức tối thiểu của explicit cache → thực tế gửi inline, xem context_cache.py)
+✅ Generation cache: prompt giống hệt (retry sau lỗi publish) → dùng lại bài, không gọi API
 
 File: backend/backend/pipelines.py
 """
 
 import os
+import time
+import asyncio
 import requests
 import json
-import time
 from google import genai
 from google.genai import types
 from scrapy.exceptions import DropItem
 
+from backend.compaction import estimate_tokens
+from backend.rate_limiter import RateLimiter
+from backend.generation_cache import GenerationCache
+from backend.context_cache import ContextCache
+from backend.model_router import ModelRouter
+from backend.metrics import MetricsStore, usage_tokens
+from backend.json_stream import IncrementalJSONValidator, StreamValidationError
+from backend.outline import (
+    parse_outline, check_outline, section_words, check_section, assemble, count_words, MIN_SECTIONS, MAX_SECTIONS
+)
+
+
+class SchemaValidationError(ValueError):
+    """Response JSON hợp lệ nhưng sai schema bài viết"""
+
+
+# Schema JSON mà prompt yêu cầu
+RESPONSE_KEYS = ('title', 'excerpt', 'content')
+REQUIRED_KEYS = ('title', 'content')
+
+# Structured output: Gemini bị ràng buộc trả đúng object này (không cần bóc ```json)
+ARTICLE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        'title': types.Schema(type=types.Type.STRING, description="Tiêu đề bài viết (H1)"),
+        'excerpt': types.Schema(type=types.Type.STRING, description="Mô tả SEO 150-160 ký tự"),
+        'content': types.Schema(type=types.Type.STRING, description="Nội dung HTML"),
+    },
+    required=list(RESPONSE_KEYS),
+    property_ordering=list(RESPONSE_KEYS),
+)
+
+# Log tiến độ stream mỗi N token
+STREAM_PROGRESS_TOKENS = 1000
+
+# Hedging: cần tối thiểu N mẫu latency để tin percentile (ít hơn → AI_HEDGE_DEFAULT_DELAY)
+HEDGE_MIN_SAMPLES = 20
+
+# Viết tiếp response bị cắt (tối đa AI_MAX_CONTINUATIONS lần)
+CONTINUATION_PROMPT = (
+    "Phản hồi trước của bạn bị cắt giữa chừng do giới hạn độ dài. "
+    "Hãy viết TIẾP chính xác từ ký tự cuối cùng ở trên (có thể đang giữa câu hoặc giữa thẻ HTML). "
+    "KHÔNG lặp lại phần đã viết, KHÔNG thêm lời dẫn hay ```, "
+    "và kết thúc đúng cấu trúc JSON (đóng chuỗi và dấu }) khi viết xong."
+)
+
+# Độ dài tối thiểu để coi đầu đoạn viết tiếp là lặp lại đuôi đoạn trước
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 500
+
 # V3: Universal Intelligent Generator (ONLY)
 try:
     from backend.universal_intelligent_generator import UniversalIntelligentGenerator
@@ -26,16 +91,53 @@ except ImportError:
         print("⚠️ V3 Universal Generator not found!")
 
 
+def record_result(spider, keyword, **fields):
+    """Báo kết quả keyword về spider (multi-keyword tracking)"""
+    if hasattr(spider, 'record_result'):
+        spider.record_result(keyword, **fields)
+
+
 class AiGenerationPipeline:
     """AI Generation Pipeline - V3 Universal System (Optimized)"""
     
     def __init__(self):
         self.client = None
         self.universal_generator = None
+        self.semaphore = None
+        self.rate_limiter = None
+        self.generation_cache = None
+        self.context_cache = None
+        self.model_router = None
+        self.metrics = None
+        self.streaming = os.getenv("AI_STREAMING", "1").lower() in ('1', 'true', 'yes')
+        self.structured_output = os.getenv("AI_STRUCTURED_OUTPUT", "1").lower() in ('1', 'true', 'yes')
+        self.max_continuations = int(os.getenv("AI_MAX_CONTINUATIONS", "2") or 0)
+        
+        # Hedging: chỉ bật khi cần cắt tail latency (tốn thêm request)
+        self.hedging = os.getenv("AI_HEDGING", "0").lower() in ('1', 'true', 'yes')
+        self.hedge_percentile = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_delay = float(os.getenv("AI_HEDGE_MIN_DELAY", "10"))
+        self.hedge_default_delay = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "45"))
+        self.hedge_budget = float(os.getenv("AI_HEDGE_BUDGET", "0.1"))
+        self.hedge_model = os.getenv("AI_HEDGE_MODEL", "")
+        
+        # Outline mode: '' tắt, 'deep' chỉ category depth=deep, 'all' mọi category
+        outline_mode = os.getenv("AI_OUTLINE_MODE", "0").lower()
+        self.outline_mode = 'all' if outline_mode in ('1', 'true', 'yes', 'all') else 'deep' if outline_mode == 'deep' else ''
+        self.section_concurrency = max(1, int(os.getenv("AI_SECTION_CONCURRENCY", "3") or 1))
+        self.section_attempts = 2
+        
         self.stats = {
             'total_processed': 0,
             'ai_success': 0,
-            'ai_failed': 0
+            'ai_failed': 0,
+            'ai_resumed': 0,
+            'ai_cached': 0,
+            'ai_continuations': 0,
+            'ai_calls': 0,
+            'ai_hedged': 0,
+            'ai_hedge_wins': 0,
+            'ai_sectioned': 0
         }
     
     def open_spider(self, spider):
@@ -48,6 +150,42 @@ class AiGenerationPipeline:
         self.client = genai.Client(api_key=api_key)
         spider.logger.info("✅ Gemini Client ready")
         
+        # Giới hạn số request Gemini chạy cùng lúc (các item khác chờ, không block reactor)
+        concurrency = max(1, int(os.getenv("AI_CONCURRENCY", "2") or 1))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        spider.logger.info(f"🔀 AI concurrency: {concurrency}")
+        
+        # Quota RPM/TPM dùng chung cho mọi worker process
+        try:
+            self.rate_limiter = RateLimiter()
+        except Exception as e:
+            spider.logger.warning(f"⚠️ Rate limiter disabled: {e}")
+        
+        # Cache kết quả theo (model, temperature, prompt)
+        try:
+            self.generation_cache = GenerationCache()
+        except Exception as e:
+            spider.logger.warning(f"⚠️ Generation cache disabled: {e}")
+        
+        # Health + circuit breaker theo model, dùng chung giữa các lần chạy
+        try:
+            self.model_router = ModelRouter()
+        except Exception as e:
+            spider.logger.warning(f"⚠️ Model router disabled: {e}")
+        
+        # Token / chi phí / latency từng lần gọi (dashboard tab Stats)
+        try:
+            self.metrics = MetricsStore()
+        except Exception as e:
+            spider.logger.warning(f"⚠️ Metrics disabled: {e}")
+        
+        # Cache phần prompt tĩnh (system instruction) phía Gemini
+        if os.getenv("CONTEXT_CACHE", "1").lower() in ('1', 'true', 'yes'):
+            try:
+                self.context_cache = ContextCache(self.client)
+            except Exception as e:
+                spider.logger.warning(f"⚠️ Context cache disabled: {e}")
+        
         # V3: Initialize Universal Generator
         if V3_AVAILABLE:
             try:
@@ -64,18 +202,60 @@ class AiGenerationPipeline:
         spider.logger.info(f"  Total processed: {self.stats['total_processed']}")
         spider.logger.info(f"  AI success: {self.stats['ai_success']}")
         spider.logger.info(f"  AI failed: {self.stats['ai_failed']}")
+        spider.logger.info(f"  AI resumed (job store): {self.stats['ai_resumed']}")
+        spider.logger.info(f"  AI cached (generation cache): {self.stats['ai_cached']}")
+        spider.logger.info(f"  AI continuations (truncated responses): {self.stats['ai_continuations']}")
+        if self.outline_mode:
+            spider.logger.info(f"  AI sectioned articles (outline mode): {self.stats['ai_sectioned']}")
+        if self.hedging:
+            spider.logger.info(
+                f"  AI hedged requests: {self.stats['ai_hedged']}/{self.stats['ai_calls']} calls, "
+                f"{self.stats['ai_hedge_wins']} won by the hedge"
+            )
+        if self.context_cache:
+            context_stats = self.context_cache.stats
+            spider.logger.info(
+                f"  Context cache: {context_stats['hit']} hit / {context_stats['created']} created / "
+                f"{context_stats['refreshed']} refreshed / {context_stats['skipped']} inline"
+            )
+        if self.model_router:
+            router_stats = self.model_router.stats
+            spider.logger.info(
+                f"  Model router: {router_stats['opened']} circuits opened, "
+                f"{router_stats['skipped']} skipped models, {router_stats['probes']} probes"
+            )
+        if self.rate_limiter:
+            limiter_stats = self.rate_limiter.stats
+            spider.logger.info(
+                f"  Rate limiter: {limiter_stats['waited']}/{limiter_stats['acquired']} calls waited, "
+                f"{limiter_stats['wait_seconds']:.1f}s total"
+            )
     
-    def process_item(self, item, spider):
+    async def process_item(self, item, spider):
         """Process each item with V3 Universal System"""
         
         if not self.client:
+            record_result(spider, item['keyword'], status='ai_failed', error='Gemini Client not initialized')
             raise DropItem("❌ Gemini Client not initialized")
         
         if not V3_AVAILABLE or not self.universal_generator:
+            record_result(spider, item['keyword'], status='ai_failed', error='V3 not available')
             raise DropItem("❌ V3 Universal Generator not available!")
 
         self.stats['total_processed'] += 1
         spider.logger.info(f"--- 🤖 Processing: {item['keyword']} ---")
+        
+        # === Resume: dùng lại kết quả AI đã lưu (không tốn quota lần 2) ===
+        job_store = getattr(spider, 'job_store', None)
+        if job_store:
+            saved = job_store.get_ai_result(spider.job_key(item['keyword']))
+            if saved:
+                self.stats['ai_resumed'] += 1
+                item['ai_title'] = saved['title']
+                item['ai_content'] = saved['content']
+                item['ai_excerpt'] = saved.get('excerpt', '')
+                spider.logger.info(f"♻️ Reusing saved AI result for: {item['keyword']}")
+                return item
 
         # Get configurations from environment
         brand_name = os.getenv("BRAND_NAME", "Website")
@@ -92,16 +272,21 @@ class AiGenerationPipeline:
         spider.logger.info(f"📁 Category: {category_name or 'N/A'}")
         spider.logger.info(f"✨ Using V3 Universal System")
         
-        # === V3: Generate Universal Prompt ===
+        # === V3: Generate Universal Prompt (phần tĩnh theo category + phần theo keyword) ===
         try:
-            final_prompt = self.universal_generator.generate_with_auto_analysis(
+            # Resolve 1 lần: dùng cho prompt + outline mode
+            rules = self.universal_generator.resolve_rules(category_name or "")
+            system_instruction, final_prompt = self.universal_generator.generate_with_auto_analysis(
                 keyword=item['keyword'],
                 category_name=category_name,
                 brand_name=brand_name,
                 site_url=wp_url,
                 base_content=item['raw_text'],
                 site_description=site_description,
-                sample_keywords=sample_keywords
+                sample_keywords=sample_keywords,
+                structured_facts=item.get('structured_facts'),
+                split=True,
+                rules=rules
             )
             
             spider.logger.info("✅ V3 prompt generated")
@@ -109,13 +294,26 @@ class AiGenerationPipeline:
         except Exception as e:
             self.stats['ai_failed'] += 1
             spider.logger.error(f"❌ V3 prompt generation failed: {e}")
+            record_result(spider, item['keyword'], status='ai_failed', error=f"V3 failed: {e}"[:200])
             raise DropItem(f"V3 failed for keyword: {item['keyword']}")
         
         # === Call AI API ===
-        result = self._call_ai_api(final_prompt, spider)
+        result = None
+        if self._use_outline_mode(rules):
+            result = await self._generate_sectioned(
+                item['keyword'], final_prompt, system_instruction, rules, spider
+            )
+            if result is None:
+                spider.logger.warning("↩️ Outline mode failed - falling back to single-call generation")
+        
+        if result is None:
+            result = await self._call_ai_api(
+                final_prompt, spider, system_instruction=system_instruction, keyword=item['keyword']
+            )
         
         if result is None:
             self.stats['ai_failed'] += 1
+            record_result(spider, item['keyword'], status='ai_failed', error='AI failed')
             raise DropItem(f"AI failed: {item['keyword']}")
         
         # Success
@@ -127,11 +325,111 @@ class AiGenerationPipeline:
         item['ai_excerpt'] = result.get('excerpt', '')
         
         spider.logger.info(f"✅ AI generated content for: {item['keyword']}")
+        record_result(spider, item['keyword'], status='generated',
+                      ai_title=result['title'], model=result.get('_model_used', ''),
+                      ai_result={
+                          'title': result['title'],
+                          'content': result['content'],
+                          'excerpt': result.get('excerpt', ''),
+                          '_model_used': result.get('_model_used', '')
+                      })
         
         return item
     
-    def _call_ai_api(self, prompt, spider):
-        """Call Gemini API with retry logic (Optimized)"""
+    def _use_outline_mode(self, rules):
+        return self.outline_mode == 'all' or (self.outline_mode == 'deep' and rules.get('depth') == 'deep')
+    
+    async def _generate_sectioned(self, keyword, keyword_prompt, system_instruction, rules, spider):
+        """
+        Outline mode: 1 call dàn ý (title / excerpt / mở bài + H2) → các phần viết song song
+        (tối đa AI_SECTION_CONCURRENCY) → kiểm tra + ghép.
+        
+        Returns:
+            dict như _call_ai_api, hoặc None (caller fallback về 1 call)
+        """
+        started = time.monotonic()
+        generator = self.universal_generator
+        
+        spider.logger.info(f"🧩 Outline mode: generating outline for {keyword}")
+        outline = await self._call_ai_api(
+            generator.build_outline_prompt(keyword_prompt, rules, min_sections=MIN_SECTIONS, max_sections=MAX_SECTIONS),
+            spider, system_instruction=system_instruction, keyword=keyword
+        )
+        if outline is None:
+            return None
+        
+        intro, sections = parse_outline(outline['content'])
+        problems = check_outline(sections)
+        if problems:
+            spider.logger.warning(f"⚠️ Invalid outline: {'; '.join(problems)}")
+            return None
+        
+        words = section_words(generator.min_words(rules), intro, sections)
+        spider.logger.info(
+            f"🧩 Outline: {len(sections)} sections × ~{words} words, "
+            f"writing {min(self.section_concurrency, len(sections))} at a time"
+        )
+        
+        limit = asyncio.Semaphore(self.section_concurrency)
+        
+        async def write(index):
+            async with limit:
+                return await self._write_section(
+                    keyword, keyword_prompt, system_instruction, outline['title'], sections, index, words, spider
+                )
+        
+        tasks = [asyncio.ensure_future(write(index)) for index in range(len(sections))]
+        try:
+            for task in asyncio.as_completed(tasks):
+                if await task is None:
+                    # 1 phần hỏng → cả bài fallback, không tốn thêm cho các phần còn lại
+                    return None
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        content = assemble(intro, [task.result() for task in tasks])
+        total_words = count_words(content)
+        if total_words < generator.min_words(rules):
+            spider.logger.warning(f"⚠️ Sectioned article has {total_words} words (< {generator.min_words(rules)})")
+        
+        self.stats['ai_sectioned'] += 1
+        spider.logger.info(
+            f"🧩 Assembled {len(sections)} sections (~{total_words} words) in {time.monotonic() - started:.1f}s"
+        )
+        return {
+            'title': outline['title'],
+            'excerpt': outline['excerpt'],
+            'content': content,
+            '_model_used': outline.get('_model_used', '')
+        }
+    
+    async def _write_section(self, keyword, keyword_prompt, system_instruction, title, sections, index, words, spider):
+        """Viết 1 phần; sai tiêu đề / lấn phần khác / quá ngắn → viết lại kèm ghi chú lỗi"""
+        note = ""
+        for attempt in range(self.section_attempts):
+            prompt = self.universal_generator.build_section_prompt(
+                keyword_prompt, title, sections, index, words, note=note
+            )
+            data = await self._call_ai_api(prompt, spider, system_instruction=system_instruction, keyword=keyword)
+            if data is None:
+                return None
+            
+            section_html, problems = check_section(data, sections, index, words)
+            if not problems:
+                spider.logger.info(f"✅ Section {index + 1}/{len(sections)}: {sections[index]['heading']}")
+                return section_html
+            
+            note = '; '.join(problems)
+            spider.logger.warning(
+                f"⚠️ Section {index + 1} inconsistent (attempt {attempt + 1}/{self.section_attempts}): {note}"
+            )
+        
+        return None
+    
+    async def _call_ai_api(self, prompt, spider, system_instruction=None, keyword=None):
+        """Call Gemini API with retry logic (async, non-blocking backoff)"""
         
         preferred_model = os.getenv("PREFERRED_MODEL", "gemini-2.5-flash")
         all_models = ['gemini-2.5-flash', 'gemini-2.5-pro']
@@ -145,40 +443,122 @@ class AiGenerationPipeline:
         spider.logger.info(f"🎯 Preferred Model: {preferred_model}")
         
         max_retries = 3
+        temperature = 0.7
+        
+        # Prompt đầy đủ (= generate_universal_prompt) - key cho generation cache
+        full_prompt = f"{system_instruction}\n---\n\n{prompt}" if system_instruction else prompt
+        prompt_tokens = estimate_tokens(full_prompt)
+        
+        # === Generation cache: cùng prompt đã generate thành công trước đó ===
+        if self.generation_cache:
+            for model_name in candidate_models:
+                try:
+                    cached = self.generation_cache.get(full_prompt, model_name, temperature)
+                except Exception as e:
+                    spider.logger.warning(f"⚠️ Generation cache read failed: {e}")
+                    break
+                if cached:
+                    self.stats['ai_cached'] += 1
+                    spider.logger.info(f"💾 Generation cache hit ({model_name}) - skipping API call")
+                    self._record_metrics(spider, 'record_cache_hit', model_name, keyword=keyword, prompt_tokens=prompt_tokens)
+                    cached['_model_used'] = model_name
+                    return cached
+        
+        # === Model router: bỏ model đang mở mạch, đẩy model hay lỗi xuống ===
+        if self.model_router:
+            candidate_models, skipped = self.model_router.rank(candidate_models)
+            for model_name, health in skipped:
+                remaining = health['open_until'] - time.time()
+                spider.logger.info(
+                    f"⛔ Skipping {model_name}: circuit open for {remaining:.0f}s "
+                    f"({health['last_error_kind']}: {(health['last_error'] or '')[:80]})"
+                )
         
         for model_name in candidate_models:
             spider.logger.info(f"→ Trying model: {model_name}")
             
             for attempt in range(max_retries):
+                # Request khác vừa mở mạch model này → chuyển model luôn
+                if attempt and self.model_router and self.model_router.is_open(model_name):
+                    spider.logger.warning(f"⛔ Circuit opened for {model_name}, trying next...")
+                    break
+                
+                context = {}
+                # Các lần gọi API của lần thử này → ghi metrics 1 lần khi đã biết kết quả
+                calls = []
+                # Model / context thực sự trả lời (hedge có thể thắng) → lỗi sau đó tính cho model này
+                used_model, used_context = model_name, context
                 try:
-                    response = self.client.models.generate_content(
-                        model=model_name,
-                        contents=prompt,
-                        config=types.GenerateContentConfig(
-                            temperature=0.7,
-                            max_output_tokens=8192,
-                        )
+                    if self.rate_limiter:
+                        await self.rate_limiter.acquire(model_name, prompt_tokens, logger=spider.logger)
+                    
+                    context = await self._prompt_context(model_name, system_instruction, spider)
+                    used_context = context
+                    config = types.GenerateContentConfig(
+                        temperature=temperature,
+                        max_output_tokens=8192,
+                        **context
                     )
+                    if self.structured_output:
+                        config.response_mime_type = 'application/json'
+                        config.response_schema = ARTICLE_SCHEMA
+                    
+                    # Chỉ giữ slot trong lúc gọi API - lúc backoff nhường cho keyword khác
+                    async with self.semaphore:
+                        result_text, response, used_model, used_context, latency, primary_elapsed = await self._generate_hedged(
+                            model_name, prompt, config, context, system_instruction, prompt_tokens, spider, calls
+                        )
                     
-                    result_text = response.text
+                    self._adjust_rate_limit(used_model, response, prompt_tokens)
                     
-                    # Parse JSON from response
+                    # Bị cắt giữa chừng → viết tiếp thay vì generate lại từ đầu
+                    result_text = await self._continue_truncated(
+                        used_model, prompt, result_text, response, temperature, spider, used_context, calls=calls
+                    )
+                    
+                    # Parse JSON from response (structured output: đã là JSON thuần, _extract_json không đổi gì)
                     clean_json = self._extract_json(result_text)
-                    data = json.loads(clean_json)
+                    data = self._validate_article(json.loads(clean_json))
+                    self._record_calls(spider, calls, 'ok', keyword, attempt)
                     
-                    # Validate response
-                    if not data.get('title') or not data.get('content'):
-                        raise ValueError("Missing title or content in response")
+                    spider.logger.info(f"✅ AI success with {used_model} ({latency:.1f}s)")
+                    data['_model_used'] = used_model
+                    if self.model_router:
+                        self.model_router.record_success(used_model, latency)
+                        if primary_elapsed is not None:
+                            # Request chính bị huỷ khi chưa xong → giữ mẫu (cận dưới) cho percentile,
+                            # không thì chỉ còn latency ngắn của hedge và hedge delay cứ giảm dần
+                            self.model_router.record_latency(model_name, primary_elapsed)
                     
-                    spider.logger.info(f"✅ AI success with {model_name}")
-                    data['_model_used'] = model_name
+                    if self.generation_cache:
+                        try:
+                            self.generation_cache.set(full_prompt, used_model, temperature, data)
+                        except Exception as e:
+                            spider.logger.warning(f"⚠️ Generation cache write failed: {e}")
                     
                     return data
+                
+                except asyncio.CancelledError:
+                    # Keyword bị huỷ (vd. phần khác của outline mode lỗi) → vẫn ghi token đã dùng
+                    self._record_calls(spider, calls, 'cancelled', keyword, attempt)
+                    raise
                     
+                except (StreamValidationError, SchemaValidationError) as e:
+                    spider.logger.warning(f"🛑 Invalid response (attempt {attempt+1}/{max_retries}): {e}")
+                    if self._record_model_failure(used_model, 'invalid', e, spider, keyword, attempt, calls) and used_model == model_name:
+                        break
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(1)
+                        continue
+                    spider.logger.error(f"❌ Invalid response after {max_retries} attempts")
+                    break
+                
                 except json.JSONDecodeError as e:
                     spider.logger.warning(f"⚠️ JSON parse error (attempt {attempt+1}/{max_retries}): {e}")
+                    if self._record_model_failure(used_model, 'invalid', e, spider, keyword, attempt, calls) and used_model == model_name:
+                        break
                     if attempt < max_retries - 1:
-                        time.sleep(2)
+                        await asyncio.sleep(2)
                         continue
                     spider.logger.error(f"❌ JSON parsing failed after {max_retries} attempts")
                     break
@@ -186,30 +566,446 @@ class AiGenerationPipeline:
                 except Exception as e:
                     err_msg = str(e).lower()
                     
+                    # Cached content hết hạn / bị xoá phía server → tạo lại ở lần thử sau
+                    if used_context.get('cached_content') and "cache" in err_msg:
+                        spider.logger.warning(f"⚠️ Context cache unusable, recreating: {e}")
+                        self._record_calls(spider, calls, 'error', keyword, attempt, e)
+                        self.context_cache.invalidate(used_model, system_instruction)
+                        continue
+                    
                     # Rate limit error
                     if "429" in str(e) or "quota" in err_msg or "rate" in err_msg:
+                        if self.rate_limiter:
+                            self.rate_limiter.drain(used_model)
+                        # 429 liên tục → mở mạch, chuyển model thay vì ngồi chờ
+                        if self._record_model_failure(used_model, 'quota', e, spider, keyword, attempt, calls) and used_model == model_name:
+                            break
                         wait_time = 30 * (attempt + 1)
                         spider.logger.warning(f"⚠️ Rate limit! Waiting {wait_time}s...")
-                        time.sleep(wait_time)
+                        await asyncio.sleep(wait_time)
                         continue
                     
                     # Model not found
                     elif "404" in str(e) or "not found" in err_msg:
-                        spider.logger.warning(f"❌ Model {model_name} not found, trying next...")
+                        spider.logger.warning(f"❌ Model {used_model} not found, trying next...")
+                        self._record_model_failure(used_model, 'not_found', e, spider, keyword, attempt, calls)
                         break
                     
                     # Other errors
                     else:
-                        spider.logger.error(f"❌ Error with {model_name}: {e}")
+                        spider.logger.error(f"❌ Error with {used_model}: {e}")
+                        if self._record_model_failure(used_model, 'error', e, spider, keyword, attempt, calls) and used_model == model_name:
+                            break
                         if attempt < max_retries - 1:
                             spider.logger.info(f"→ Retrying in 5s... ({attempt+2}/{max_retries})")
-                            time.sleep(5)
+                            await asyncio.sleep(5)
                             continue
                         break
         
         spider.logger.error("❌ All models failed!")
         return None
     
+    async def _generate_timed(self, model_name, contents, config, spider, check=False, trace=None):
+        """
+        _generate + đo latency. check=True: response đã xong phải là JSON hợp lệ
+        (để race hedging không nhận bài lỗi).
+        """
+        started = time.monotonic()
+        text, response = await self._generate(
+            model_name, contents, config, spider, validator=IncrementalJSONValidator(RESPONSE_KEYS), trace=trace
+        )
+        if check and not self._is_truncated(text, response):
+            self._validate_article(json.loads(self._extract_json(text)))
+        return text, response, time.monotonic() - started
+    
+    async def _generate_hedged(self, model_name, contents, config, context, system_instruction, prompt_tokens,
+                               spider, calls=None):
+        """
+        Gọi model chính; quá hedge delay mà chưa xong → gọi thêm 1 request (cùng model / AI_HEDGE_MODEL),
+        lấy response hợp lệ về trước, huỷ cái còn lại. Mỗi request được thêm vào `calls` (trace cho metrics).
+        
+        Returns:
+            (text, response, model, context, latency, primary_elapsed): latency của request thắng;
+            primary_elapsed = thời gian request chính đã chạy khi hedge thắng (None nếu request chính thắng)
+        """
+        self.stats['ai_calls'] += 1
+        delay = self._hedge_delay(model_name)
+        if delay is None:
+            trace = self._new_call(calls, model_name, prompt_tokens)
+            text, response, latency = await self._generate_timed(model_name, contents, config, spider, trace=trace)
+            return text, response, model_name, context, latency, None
+        
+        started = time.monotonic()
+        trace = self._new_call(calls, model_name, prompt_tokens)
+        primary = asyncio.ensure_future(self._generate_timed(model_name, contents, config, spider, check=True, trace=trace))
+        tasks = {primary: (model_name, context, trace)}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                hedge = await self._start_hedge(
+                    model_name, contents, config, context, system_instruction, prompt_tokens, delay, spider, calls
+                )
+                if hedge:
+                    task, hedge_model, hedge_context, hedge_trace = hedge
+                    tasks[task] = (hedge_model, hedge_context, hedge_trace)
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Ưu tiên request chính nếu cả 2 xong cùng lúc
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats['ai_hedge_wins'] += 1
+                            spider.logger.info(f"🏁 Hedged request ({tasks[task][0]}) finished first")
+                        text, response, latency = task.result()
+                        used_model, used_context, _ = tasks[task]
+                        primary_elapsed = None if task is primary else time.monotonic() - started
+                        # Request kia đã lỗi / cũng xong → status riêng (chưa xong thì bị huỷ bên dưới)
+                        for other in tasks:
+                            if other is not task and other.done():
+                                error = other.exception()
+                                tasks[other][2].update(status=self._failure_kind(error) if error else 'ok', error=error)
+                        return text, response, used_model, used_context, latency, primary_elapsed
+                    if task is not primary:
+                        error = task.exception()
+                        spider.logger.warning(f"⚠️ Hedged request failed: {error}")
+                        tasks[task][2].update(status=self._failure_kind(error), error=error)
+            
+            # Cả 2 đều lỗi → lỗi của request chính quyết định retry / đổi model
+            raise primary.exception()
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+                tasks[task][2]['status'] = 'cancelled'
+            if losers:
+                # Chờ request bị huỷ đóng stream → trace có usage / latency để ghi metrics
+                await asyncio.wait(losers)
+    
+    def _hedge_delay(self, model_name):
+        """Số giây chờ trước khi hedge (percentile latency của model), None nếu không hedge"""
+        if not self.hedging:
+            return None
+        observed = None
+        if self.model_router:
+            observed = self.model_router.latency_percentile(model_name, self.hedge_percentile, min_samples=HEDGE_MIN_SAMPLES)
+        if observed is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, observed)
+    
+    async def _start_hedge(self, model_name, contents, config, context, system_instruction, prompt_tokens, delay,
+                           spider, calls=None):
+        """Bắt đầu request hedge nếu còn budget + quota → (task, model, context, trace) hoặc None"""
+        if self.stats['ai_hedged'] >= self.hedge_budget * self.stats['ai_calls']:
+            spider.logger.info(f"💸 {model_name} slow (>{delay:.1f}s) but hedge budget used up")
+            return None
+        
+        # Hedge cũng là 1 request Gemini → cần slot AI_CONCURRENCY riêng (request chính đang giữ 1 slot)
+        if self.semaphore.locked():
+            spider.logger.info(f"🚦 {model_name} slow (>{delay:.1f}s) but no free AI slot to hedge")
+            return None
+        await self.semaphore.acquire()
+        started = False
+        try:
+            hedge_model = self.hedge_model or model_name
+            if hedge_model != model_name and self.model_router and self.model_router.is_open(hedge_model):
+                hedge_model = model_name
+            
+            # Không chờ quota cho request phụ
+            if self.rate_limiter and self.rate_limiter.try_acquire(hedge_model, prompt_tokens) > 0:
+                spider.logger.info(f"⏳ {model_name} slow (>{delay:.1f}s) but no quota left to hedge")
+                return None
+            
+            hedge_context = context
+            hedge_config = config
+            if hedge_model != model_name:
+                # cached_content gắn với model → build lại phần prompt tĩnh cho model hedge
+                hedge_context = await self._prompt_context(hedge_model, system_instruction, spider)
+                hedge_config = config.model_copy(update={'cached_content': None, 'system_instruction': None, **hedge_context})
+            
+            self.stats['ai_hedged'] += 1
+            spider.logger.info(f"🪃 {model_name} slower than {delay:.1f}s - hedging with {hedge_model}")
+            trace = self._new_call(calls, hedge_model, prompt_tokens)
+            task = asyncio.ensure_future(
+                self._hedge_call(hedge_model, contents, hedge_config, spider, trace)
+            )
+            started = True
+            return task, hedge_model, hedge_context, trace
+        finally:
+            if not started:
+                self.semaphore.release()
+    
+    async def _hedge_call(self, model_name, contents, config, spider, trace):
+        """Request hedge: trả slot semaphore (lấy trong _start_hedge) khi xong / lỗi / bị huỷ"""
+        try:
+            return await self._generate_timed(model_name, contents, config, spider, check=True, trace=trace)
+        finally:
+            self.semaphore.release()
+    
+    async def _generate(self, model_name, contents, config, spider, validator=None, trace=None):
+        """
+        1 lần gọi Gemini (stream hoặc không) → (text, response / chunk cuối).
+        trace (dict): response / text đã nhận + latency, cập nhật cả khi lỗi / bị huỷ giữa chừng
+        """
+        trace = trace if trace is not None else {}
+        started = time.monotonic()
+        try:
+            if self.streaming:
+                return await self._generate_stream(model_name, contents, config, spider, validator, trace)
+            
+            response = await self.client.aio.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config
+            )
+            trace['response'] = response
+            trace['parts'] = [response.text or '']
+            return response.text or '', response
+        finally:
+            trace['latency'] = time.monotonic() - started
+    
+    async def _generate_stream(self, model_name, contents, config, spider, validator=None, trace=None):
+        """
+        generate_content_stream + validator JSON từng chunk (nếu có).
+        
+        Returns:
+            (text, last_chunk) - last_chunk mang usage_metadata
+        Raises:
+            StreamValidationError: response sai JSON / schema (stream đã bị huỷ, trace giữ chunk cuối)
+        """
+        trace = trace if trace is not None else {}
+        parts = trace['parts'] = []
+        last_chunk = None
+        received = 0
+        next_progress = STREAM_PROGRESS_TOKENS
+        
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=contents,
+            config=config
+        )
+        try:
+            async for chunk in stream:
+                last_chunk = trace['response'] = chunk
+                text = chunk.text or ''
+                if not text:
+                    continue
+                parts.append(text)
+                usage = getattr(chunk, 'usage_metadata', None)
+                received = getattr(usage, 'candidates_token_count', None) or received + estimate_tokens(text)
+                
+                if validator:
+                    validator.feed(text)
+                if received >= next_progress:
+                    spider.logger.info(f"📡 {model_name}: ~{received} tokens received")
+                    next_progress += STREAM_PROGRESS_TOKENS
+        except StreamValidationError:
+            spider.logger.info(f"🛑 Aborting {model_name} stream after ~{received} tokens")
+            raise
+        finally:
+            # Đóng stream → dừng generate phía server khi huỷ sớm
+            aclose = getattr(stream, 'aclose', None)
+            if aclose:
+                await aclose()
+        
+        missing = validator.missing(REQUIRED_KEYS) if validator else []
+        if validator and validator.complete and missing:
+            raise StreamValidationError(f"Missing {', '.join(missing)} in response")
+        
+        return ''.join(parts), last_chunk
+    
+    @staticmethod
+    def _is_truncated(text, response):
+        """JSON chưa đóng (chuỗi / object dở dang), hoặc finish_reason = MAX_TOKENS mà chưa xong"""
+        validator = IncrementalJSONValidator(RESPONSE_KEYS)
+        try:
+            validator.feed(text)
+        except StreamValidationError:
+            # JSON sai hẳn - viết tiếp cũng không cứu được
+            return False
+        if validator.complete:
+            return False
+        if validator.started:
+            return True
+        
+        candidates = getattr(response, 'candidates', None) or []
+        finish_reason = getattr(candidates[0], 'finish_reason', None) if candidates else None
+        return str(getattr(finish_reason, 'name', finish_reason)).endswith('MAX_TOKENS')
+    
+    @staticmethod
+    def _stitch(previous, continuation):
+        """Ghép đoạn viết tiếp: bỏ ``` mở đầu + phần lặp lại đuôi đoạn trước"""
+        # Chỉ bỏ khoảng trắng khi có ``` - không thì giữ nguyên (có thể là dấu cách giữa 2 từ)
+        stripped = continuation.lstrip()
+        for fence in ('```json', '```'):
+            if stripped.startswith(fence):
+                continuation = stripped[len(fence):]
+                continuation = continuation[1:] if continuation.startswith('\n') else continuation
+                break
+        
+        longest = min(len(previous), len(continuation), MAX_OVERLAP_CHARS)
+        for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+            if previous.endswith(continuation[:size]):
+                continuation = continuation[size:]
+                break
+        
+        return previous + continuation
+    
+    async def _prompt_context(self, model_name, system_instruction, spider):
+        """Config cho phần prompt tĩnh: cached_content nếu có cache, không thì system_instruction"""
+        if not system_instruction:
+            return {}
+        if self.context_cache:
+            try:
+                name = await self.context_cache.get(model_name, system_instruction, logger=spider.logger)
+            except Exception as e:
+                spider.logger.warning(f"⚠️ Context cache lookup failed: {e}")
+                name = None
+            if name:
+                return {'cached_content': name}
+        return {'system_instruction': system_instruction}
+    
+    async def _continue_truncated(self, model_name, prompt, text, response, temperature, spider, context=None, calls=None):
+        """Response bị cắt → gửi lại (prompt + phần đã có) và yêu cầu viết tiếp (mỗi lần gọi thêm vào `calls`)"""
+        for round_no in range(1, self.max_continuations + 1):
+            if not self._is_truncated(text, response):
+                break
+            
+            self.stats['ai_continuations'] += 1
+            spider.logger.warning(
+                f"✂️ Response truncated at ~{estimate_tokens(text)} tokens - "
+                f"continuation {round_no}/{self.max_continuations}"
+            )
+            
+            contents = [
+                types.Content(role='user', parts=[types.Part(text=prompt)]),
+                types.Content(role='model', parts=[types.Part(text=text)]),
+                types.Content(role='user', parts=[types.Part(text=CONTINUATION_PROMPT)]),
+            ]
+            # Phần viết tiếp là mảnh JSON → không ràng buộc schema
+            config = types.GenerateContentConfig(
+                temperature=temperature,
+                max_output_tokens=8192,
+                **(context or {})
+            )
+            
+            request_tokens = estimate_tokens(prompt) + estimate_tokens(text)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(model_name, request_tokens, logger=spider.logger)
+            trace = self._new_call(calls, model_name, request_tokens, kind='continuation', attempt=round_no)
+            async with self.semaphore:
+                continuation, response = await self._generate(model_name, contents, config, spider, trace=trace)
+            
+            text = self._stitch(text, continuation)
+        
+        return text
+    
+    def _record_metrics(self, spider, method, *args, **kwargs):
+        """Ghi metrics store - lỗi ghi không được làm hỏng item"""
+        if not self.metrics:
+            return
+        try:
+            getattr(self.metrics, method)(*args, **kwargs)
+        except Exception as e:
+            spider.logger.warning(f"⚠️ Metrics write failed: {e}")
+    
+    @staticmethod
+    def _new_call(calls, model_name, prompt_tokens, kind='generate', attempt=None):
+        """Trace 1 lần gọi API (thêm vào calls) - metrics ghi khi lần thử đã có kết quả"""
+        trace = {
+            'model': model_name, 'kind': kind, 'attempt': attempt, 'prompt_tokens': prompt_tokens,
+            'response': None, 'parts': [], 'latency': None, 'status': None, 'error': None,
+        }
+        if calls is not None:
+            calls.append(trace)
+        return trace
+    
+    def _record_calls(self, spider, calls, status, keyword=None, attempt=0, error=None):
+        """
+        1 dòng metrics / lần gọi API của lần thử: status của lần thử,
+        trừ request đã có kết quả riêng (hedge bị huỷ / lỗi riêng)
+        """
+        for trace in calls:
+            own = trace['status']
+            call_status = own or status
+            self._record_metrics(
+                spider, 'record_call', trace['model'], trace['response'],
+                keyword=keyword, kind=trace['kind'], status=call_status,
+                attempt=attempt if trace['attempt'] is None else trace['attempt'],
+                latency=trace['latency'], error=trace['error'] if own else error,
+                tokens=self._call_tokens(trace, call_status)
+            )
+        calls.clear()
+    
+    @staticmethod
+    def _call_tokens(trace, status):
+        """usage_metadata của lần gọi; thiếu (bị huỷ / dừng sớm) → ước lượng từ prompt + text đã nhận"""
+        tokens = usage_tokens(trace['response'])
+        received = ''.join(trace['parts'])
+        if not tokens['prompt_tokens'] and (received or status == 'cancelled'):
+            tokens['prompt_tokens'] = trace['prompt_tokens']
+        if not tokens['output_tokens'] and received:
+            tokens['output_tokens'] = estimate_tokens(received)
+        return tokens
+    
+    @staticmethod
+    def _failure_kind(error):
+        """Loại lỗi của 1 request (như các nhánh except của _call_ai_api)"""
+        if isinstance(error, (StreamValidationError, SchemaValidationError, json.JSONDecodeError)):
+            return 'invalid'
+        err_msg = str(error).lower()
+        if "429" in err_msg or "quota" in err_msg or "rate" in err_msg:
+            return 'quota'
+        if "404" in err_msg or "not found" in err_msg:
+            return 'not_found'
+        return 'error'
+    
+    def _record_model_failure(self, model_name, kind, error, spider, keyword=None, attempt=0, calls=None):
+        """Báo lỗi cho model router + metrics (các lần gọi API của lần thử) → True nếu mạch của model đang mở"""
+        self._record_calls(spider, calls or [], kind, keyword, attempt, error)
+        # Sai JSON / schema thường do prompt của keyword → chỉ ghi metrics, không mở mạch
+        # (state router dùng chung mọi worker: 1 keyword lỗi không được chặn model cho tất cả)
+        if not self.model_router or kind == 'invalid':
+            return False
+        opened = self.model_router.record_failure(model_name, kind, error)
+        if opened:
+            health = self.model_router.get(model_name)
+            remaining = health['open_until'] - time.time()
+            spider.logger.warning(f"⛔ Circuit open for {model_name} ({kind}), cooling down {remaining:.0f}s")
+        return opened
+    
+    def _adjust_rate_limit(self, model_name, response, prompt_tokens):
+        """Bù token thực tế (usage_metadata) vào bucket"""
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'prompt_token_count', None) if usage else None
+        if self.rate_limiter and actual:
+            try:
+                self.rate_limiter.adjust(model_name, actual - prompt_tokens)
+            except Exception:
+                pass
+    
+    def _validate_article(self, data):
+        """Kiểm tra response theo ARTICLE_SCHEMA, trả về dict đã chuẩn hoá"""
+        if not isinstance(data, dict):
+            raise SchemaValidationError(f"Expected JSON object, got {type(data).__name__}")
+        
+        extra = [key for key in data if key not in RESPONSE_KEYS]
+        if extra:
+            raise SchemaValidationError(f"Unexpected keys: {', '.join(extra)}")
+        
+        for key in RESPONSE_KEYS:
+            value = data.get(key, '')
+            if not isinstance(value, str):
+                raise SchemaValidationError(f"'{key}' must be a string")
+            data[key] = value.strip()
+        
+        missing = [key for key in REQUIRED_KEYS if not data[key]]
+        if missing:
+            raise SchemaValidationError(f"Missing {', '.join(missing)} in response")
+        
+        return data
+    
     def _extract_json(self, text):
         """Extract JSON from AI response text"""
         # Remove markdown code blocks
@@ -251,6 +1047,15 @@ class WordPressPublisherPipeline:
         
         self.stats['total_processed'] += 1
         
+        # Resume: keyword đã đăng rồi → không đăng lại
+        job_store = getattr(spider, 'job_store', None)
+        if job_store:
+            job = job_store.get(spider.job_key(item['keyword']))
+            if job and job.get('published_at'):
+                spider.logger.info(f"⏭️ Already published: {item['keyword']} → {job.get('post_link', '')}")
+                record_result(spider, item['keyword'], status='published', post_link=job.get('post_link', ''))
+                return item
+        
         wp_url = os.getenv("WP_URL")
         wp_user = os.getenv("WP_USER")
         wp_pass = os.getenv("WP_APP_PASSWORD")
@@ -258,6 +1063,7 @@ class WordPressPublisherPipeline:
         if not all([wp_url, wp_user, wp_pass]):
             spider.logger.error("❌ Missing WordPress credentials!")
             self.stats['publish_failed'] += 1
+            record_result(spider, item['keyword'], status='publish_failed', error='Missing WordPress credentials')
             return item
         
         # Get category ID
@@ -309,14 +1115,17 @@ class WordPressPublisherPipeline:
                 post_link = res.json().get('link', '')
                 spider.logger.info(f"✅ PUBLISHED: {item['keyword']}")
                 spider.logger.info(f"   Link: {post_link}")
+                record_result(spider, item['keyword'], status='published', post_link=post_link)
             else:
                 self.stats['publish_failed'] += 1
                 spider.logger.error(f"❌ Publish failed: HTTP {res.status_code}")
                 spider.logger.error(f"   Response: {res.text[:500]}")
+                record_result(spider, item['keyword'], status='publish_failed', error=f"HTTP {res.status_code}")
                 
         except Exception as e:
             self.stats['publish_failed'] += 1
             spider.logger.error(f"❌ WordPress publish error: {e}")
+            record_result(spider, item['keyword'], status='publish_failed', error=str(e)[:200])
 
         return item
     
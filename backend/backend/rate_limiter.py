@@ -0,0 +1,163 @@
+"""
+Rate Limiter - Token bucket dùng chung giữa các process (SQLite)
+✅ Giới hạn requests/phút (RPM) + tokens/phút (TPM) theo từng model Gemini
+✅ Mọi worker (dashboard / run.py / scrapy process) dùng chung 1 file → tổng vẫn dưới quota
+✅ Chờ bằng asyncio.sleep (không block reactor)
+✅ Gặp 429 → xả bucket, mọi process cùng lùi lại
+
+Config:
+    GEMINI_RATE_LIMITS='{"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}'  (ghi đè mặc định)
+    RATE_LIMIT_DB=/path/rate_limits.sqlite3
+
+File: backend/backend/rate_limiter.py
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from backend.storage import connect, data_path
+
+
+# Mặc định theo free tier (an toàn) - paid tier nên ghi đè qua GEMINI_RATE_LIMITS
+DEFAULT_LIMITS = {
+    'gemini-2.5-flash': {'rpm': 10, 'tpm': 250000},
+    'gemini-2.5-pro': {'rpm': 5, 'tpm': 250000},
+}
+
+# Không chờ quá lâu cho 1 lần kiểm tra (để còn đọc lại bucket)
+MAX_WAIT_STEP = 10.0
+
+
+def load_limits():
+    """DEFAULT_LIMITS + GEMINI_RATE_LIMITS (JSON) từ env"""
+    limits = {model: dict(limit) for model, limit in DEFAULT_LIMITS.items()}
+    raw = os.getenv('GEMINI_RATE_LIMITS', '')
+    if raw:
+        for model, limit in json.loads(raw).items():
+            limits.setdefault(model, {}).update(limit)
+    return limits
+
+
+class RateLimiter:
+    """Token bucket RPM/TPM theo model, state trong SQLite"""
+
+    def __init__(self, path=None, limits=None):
+        self.path = path or data_path('rate_limits.sqlite3', 'RATE_LIMIT_DB')
+        self.limits = limits if limits is not None else load_limits()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0}
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def _refill(self, model, limit, now):
+        """Đọc bucket + nạp lại theo thời gian đã trôi (trong transaction)"""
+        row = self.conn.execute(
+            "SELECT requests, tokens, updated_at FROM rate_buckets WHERE model = ?", (model,)
+        ).fetchone()
+        if row is None:
+            return float(limit['rpm']), float(limit['tpm'])
+
+        elapsed = max(0.0, now - row['updated_at'])
+        requests = min(limit['rpm'], row['requests'] + elapsed * limit['rpm'] / 60)
+        tokens = min(limit['tpm'], row['tokens'] + elapsed * limit['tpm'] / 60)
+        return requests, tokens
+
+    def _save(self, model, requests, tokens, now):
+        self.conn.execute(
+            """INSERT OR REPLACE INTO rate_buckets (model, requests, tokens, updated_at)
+               VALUES (?, ?, ?, ?)""",
+            (model, requests, tokens, now)
+        )
+
+    def try_acquire(self, model, tokens=0):
+        """
+        Lấy 1 request + `tokens` token từ bucket.
+
+        Returns:
+            0 nếu được phép gọi ngay, ngược lại số giây nên chờ
+        """
+        limit = self.limits.get(model)
+        if not limit:
+            return 0.0
+
+        # 1 prompt lớn hơn cả TPM → chỉ cần bucket đầy
+        tokens = min(tokens, limit['tpm'])
+        now = time.time()
+
+        # BEGIN IMMEDIATE: khoá ghi giữa các process, đọc-sửa-ghi nguyên tử
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available = self._refill(model, limit, now)
+
+            if requests >= 1 and available >= tokens:
+                self._save(model, requests - 1, available - tokens, now)
+                wait = 0.0
+            else:
+                wait = max(
+                    (1 - requests) * 60 / limit['rpm'] if requests < 1 else 0.0,
+                    (tokens - available) * 60 / limit['tpm'] if available < tokens else 0.0
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return wait
+
+    async def acquire(self, model, tokens=0, logger=None):
+        """Chờ (non-blocking) tới khi bucket đủ cho request này"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(model, tokens)
+            if wait <= 0:
+                break
+            if logger and not waited:
+                logger.info(f"⏳ Rate limit {model}: waiting {wait:.1f}s (~{tokens} tokens)")
+            step = min(wait, MAX_WAIT_STEP)
+            await asyncio.sleep(step)
+            waited += step
+
+        self.stats['acquired'] += 1
+        if waited:
+            self.stats['waited'] += 1
+            self.stats['wait_seconds'] += waited
+        return waited
+
+    def adjust(self, model, delta_tokens):
+        """Bù chênh lệch token thực tế (usage_metadata) so với ước lượng"""
+        limit = self.limits.get(model)
+        if not limit or not delta_tokens:
+            return
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available = self._refill(model, limit, now)
+            self._save(model, requests, min(limit['tpm'], available - delta_tokens), now)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def drain(self, model):
+        """Gặp 429: xả bucket → mọi process chờ nạp lại"""
+        if model not in self.limits:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._save(model, 0.0, 0.0, time.time())
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.conn.close()
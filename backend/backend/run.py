@@ -0,0 +1,319 @@
+"""
+Headless Batch Runner - Chạy batch không cần Streamlit
+✅ Input: keywords CSV / JSONL / TXT + config JSON
+✅ Crawl → AiGenerationPipeline → WordPressPublisherPipeline
+✅ N worker process song song, mỗi worker chạy multi-keyword mode
+✅ Output: 1 dòng JSONL / keyword (cron, CI)
+✅ Job store: chạy lại chỉ xử lý keywords chưa xong
+
+Usage (từ thư mục backend/):
+    python -m backend.run keywords.csv --config config.json --concurrency 3 --output results.jsonl
+
+File: backend/backend/run.py
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from backend.jobstore import JobStore, make_idempotency_key, new_owner_id
+
+
+# Config key (lowercase) → env var mà spider/pipelines đọc
+CONFIG_ENV = {
+    'gemini_api_key': 'GEMINI_API_KEY',
+    'google_api_key': 'GOOGLE_API_KEY',
+    'google_cse_id': 'GOOGLE_CSE_ID',
+    'wp_url': 'WP_URL',
+    'wp_user': 'WP_USER',
+    'wp_app_password': 'WP_APP_PASSWORD',
+    'wp_category_id': 'WP_CATEGORY_ID',
+    'brand_name': 'BRAND_NAME',
+    'category_name': 'CATEGORY_NAME',
+    'preferred_model': 'PREFERRED_MODEL',
+    'site_description': 'SITE_DESCRIPTION',
+    'sample_keywords': 'SAMPLE_KEYWORDS',
+}
+
+# Thư mục chứa scrapy.cfg
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEARTBEAT_INTERVAL = 30
+
+# Timeout → SIGTERM, chờ spider đóng (closed() ghi results) tối đa N giây rồi mới kill
+GRACEFUL_SHUTDOWN = 30
+
+
+def load_keywords(path):
+    """Đọc keywords từ .csv (cột 'keyword' hoặc cột đầu), .jsonl ({"keyword": ...}) hoặc .txt"""
+    keywords = []
+    suffix = Path(path).suffix.lower()
+
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if suffix == '.csv':
+            rows = list(csv.reader(f))
+            if rows and rows[0] and rows[0][0].strip().lower() == 'keyword':
+                rows = rows[1:]
+            keywords = [row[0] for row in rows if row]
+        elif suffix in ('.jsonl', '.ndjson'):
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    keywords.append(record['keyword'] if isinstance(record, dict) else str(record))
+        else:
+            keywords = f.read().splitlines()
+
+    # Bỏ trống + bỏ trùng, giữ thứ tự
+    result = []
+    seen = set()
+    for kw in keywords:
+        kw = kw.strip()
+        if kw and not kw.startswith('#') and kw not in seen:
+            seen.add(kw)
+            result.append(kw)
+    return result
+
+
+def load_config(path):
+    """Config JSON → env vars (key lowercase theo CONFIG_ENV, hoặc key UPPERCASE truyền thẳng)"""
+    if not path:
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    env = {}
+    for key, value in config.items():
+        env_name = CONFIG_ENV.get(key.lower(), key if key.isupper() else None)
+        if env_name is None:
+            print(f"⚠️ Unknown config key: {key}", file=sys.stderr)
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ','.join(str(v) for v in value)
+        env[env_name] = '' if value is None else str(value)
+    return env
+
+
+def shard(keywords, n):
+    """Chia keywords cho n workers (round-robin)"""
+    shards = [[] for _ in range(max(1, n))]
+    for idx, kw in enumerate(keywords):
+        shards[idx % len(shards)].append(kw)
+    return [s for s in shards if s]
+
+
+def start_worker(worker_id, keywords, env, workdir):
+    """1 scrapy process cho 1 shard keywords (multi-keyword mode)"""
+    keywords_file = os.path.join(workdir, f'keywords_{worker_id}.txt')
+    results_file = os.path.join(workdir, f'results_{worker_id}.jsonl')
+
+    with open(keywords_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(keywords) + '\n')
+
+    cmd = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'google_bot',
+        '-a', f'keywords_file={keywords_file}',
+        '-a', f'results_file={results_file}',
+        '-s', 'LOG_LEVEL=INFO'
+    ]
+
+    proc = subprocess.Popen(
+        cmd,
+        cwd=str(BACKEND_DIR),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1
+    )
+
+    # Forward log với prefix worker
+    def forward():
+        for line in proc.stdout:
+            sys.stderr.write(f"[w{worker_id}] {line}")
+        proc.stdout.close()
+
+    threading.Thread(target=forward, daemon=True).start()
+
+    return {
+        'id': worker_id,
+        'proc': proc,
+        'keywords': keywords,
+        'results_file': results_file,
+        'start': time.time(),
+        'last_progress': time.time(),
+        'done': 0,
+        'terminated_at': None,
+    }
+
+
+def read_results(path):
+    """
+    Đọc results JSONL của 1 worker → {keyword: result}.
+    Đọc cả lúc worker đang ghi → dòng cuối ghi dở (JSON lỗi) bị bỏ qua, lần đọc sau sẽ đủ.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[record['keyword']] = record
+    return results
+
+
+def run_batch(keywords, env, concurrency=2, keyword_timeout=180, job_store=None, log=print):
+    """Chạy batch, trả về list result (theo thứ tự keywords)"""
+    owner = new_owner_id()
+    category_name = env.get('CATEGORY_NAME', '')
+    wp_url = env.get('WP_URL', '')
+    results = {}
+    keys = {kw: make_idempotency_key(kw, category_name, wp_url) for kw in keywords}
+
+    # === Job store: bỏ qua keywords đã đăng / đang bị runner khác giữ ===
+    todo = keywords
+    if job_store:
+        job_store.enqueue(keywords, category_name, wp_url, batch_id=time.strftime('%Y%m%d-%H%M%S'))
+        todo = []
+        for kw in keywords:
+            job = job_store.get(keys[kw])
+            if job and job.get('published_at'):
+                job_store.complete(keys[kw])
+                results[kw] = {'keyword': kw, 'status': 'published', 'post_link': job.get('post_link', ''),
+                               'resumed': True}
+            elif job_store.claim(keys[kw], owner):
+                todo.append(kw)
+            else:
+                results[kw] = {'keyword': kw, 'status': 'skipped', 'error': 'Leased by another runner'}
+
+        log(f"📋 {len(todo)} keywords to run, {len(keywords) - len(todo)} skipped (done/leased)")
+
+    with tempfile.TemporaryDirectory(prefix='acp_run_') as workdir:
+        workers = [
+            start_worker(idx, shard_keywords, env, workdir)
+            for idx, shard_keywords in enumerate(shard(todo, concurrency), 1)
+        ]
+        log(f"🚀 Started {len(workers)} workers for {len(todo)} keywords")
+
+        last_heartbeat = time.time()
+        while any(w['proc'].poll() is None for w in workers):
+            time.sleep(1)
+            now = time.time()
+
+            for w in workers:
+                if w['proc'].poll() is not None:
+                    continue
+                
+                # Mỗi keyword xong (ghi results file) → gia hạn thêm keyword_timeout
+                done = len(read_results(w['results_file']))
+                if done > w['done']:
+                    w['done'] = done
+                    w['last_progress'] = now
+                
+                if w['terminated_at'] is None and now - w['last_progress'] > keyword_timeout:
+                    log(f"⏱️ Worker {w['id']} stalled {keyword_timeout}s - stopping gracefully")
+                    w['proc'].terminate()
+                    w['terminated_at'] = now
+                elif w['terminated_at'] is not None and now - w['terminated_at'] > GRACEFUL_SHUTDOWN:
+                    log(f"⏱️ Worker {w['id']} did not stop - killing")
+                    w['proc'].kill()
+
+            if job_store and now - last_heartbeat > HEARTBEAT_INTERVAL:
+                for w in workers:
+                    if w['proc'].poll() is None:
+                        for kw in w['keywords']:
+                            job_store.heartbeat(keys[kw], owner)
+                last_heartbeat = now
+
+        # === Gom kết quả ===
+        for w in workers:
+            worker_results = read_results(w['results_file'])
+            for kw in w['keywords']:
+                result = worker_results.get(kw) or {
+                    'keyword': kw,
+                    'status': 'failed',
+                    'error': f"No result (worker exit code {w['proc'].returncode})"
+                }
+                # Worker chết trước khi ghi kết quả nhưng bài đã đăng → không tính là fail
+                if job_store and result.get('status') != 'published' and job_store.is_published(keys[kw]):
+                    job = job_store.get(keys[kw])
+                    result = {'keyword': kw, 'status': 'published', 'post_link': job.get('post_link', '')}
+                results[kw] = result
+
+                if job_store:
+                    if result.get('status') == 'published':
+                        job_store.complete(keys[kw])
+                    else:
+                        job_store.fail(keys[kw], result.get('error') or result.get('status', ''))
+
+    return [results[kw] for kw in keywords]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Auto Content Pro - headless batch runner")
+    parser.add_argument('keywords', help="Keywords file (.csv / .jsonl / .txt)")
+    parser.add_argument('--config', help="Config JSON (gemini_api_key, wp_url, category_name, ...)")
+    parser.add_argument('--concurrency', type=int, default=2, help="Số worker process song song")
+    parser.add_argument('--output', default='-', help="Results JSONL (mặc định: stdout)")
+    parser.add_argument('--keyword-timeout', type=int, default=180, help="Timeout (giây) / keyword")
+    parser.add_argument('--no-job-store', action='store_true', help="Không dùng job store (không resume)")
+    args = parser.parse_args(argv)
+
+    keywords = load_keywords(args.keywords)
+    if not keywords:
+        print("❌ No keywords found", file=sys.stderr)
+        return 2
+
+    env = os.environ.copy()
+    env.update(load_config(args.config))
+    env['PYTHONUNBUFFERED'] = '1'
+
+    job_store = None
+    if not args.no_job_store:
+        job_store = JobStore(env.get('JOB_DB') or None)
+        env['JOB_DB'] = job_store.path
+
+    def log(msg):
+        print(msg, file=sys.stderr)
+
+    results = run_batch(
+        keywords,
+        env,
+        concurrency=args.concurrency,
+        keyword_timeout=args.keyword_timeout,
+        job_store=job_store,
+        log=log
+    )
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    published = sum(1 for r in results if r.get('status') == 'published')
+    log(f"=== Batch done: {published}/{len(results)} published ===")
+
+    return 0 if published == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
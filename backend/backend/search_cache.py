@@ -0,0 +1,91 @@
+"""
+Search Cache - Cache raw JSON của Google Custom Search (SQLite + TTL)
+✅ Retry keyword / chạy lại batch → KHÔNG tốn CSE quota (100 free/ngày)
+✅ TTL cấu hình được (SEARCH_CACHE_TTL, giây)
+✅ Bypass (SEARCH_CACHE_BYPASS=1): luôn gọi API, vẫn ghi đè cache
+✅ Thống kê hit / miss
+
+File: backend/backend/search_cache.py
+"""
+
+import os
+import json
+import hashlib
+import time
+
+from backend.storage import connect, data_path
+
+
+# Mặc định giữ kết quả search 7 ngày
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def make_query_key(query, cse_id='', num=10):
+    """Key theo query đã chuẩn hoá + CSE + số kết quả"""
+    normalized = ' '.join(query.lower().split())
+    raw = f"{normalized}|{cse_id}|{num}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class SearchCache:
+    """Cache kết quả Google CSE theo query"""
+
+    def __init__(self, path=None, ttl=None, bypass=None):
+        self.path = path or data_path('search_cache.sqlite3', 'SEARCH_CACHE_DB')
+        self.ttl = int(ttl if ttl is not None else os.getenv('SEARCH_CACHE_TTL', DEFAULT_TTL))
+        if bypass is None:
+            bypass = os.getenv('SEARCH_CACHE_BYPASS', '').lower() in ('1', 'true', 'yes')
+        self.bypass = bypass
+
+        self.stats = {'hit': 0, 'miss': 0, 'stored': 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                query_key TEXT PRIMARY KEY,
+                query TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def get(self, query, cse_id='', num=10):
+        """Trả về JSON đã cache (dict) hoặc None nếu miss / hết hạn / bypass"""
+        if self.bypass or self.ttl <= 0:
+            self.stats['miss'] += 1
+            return None
+
+        row = self.conn.execute(
+            "SELECT response, created_at FROM search_cache WHERE query_key = ?",
+            (make_query_key(query, cse_id, num),)
+        ).fetchone()
+
+        if row is None or time.time() - row['created_at'] > self.ttl:
+            self.stats['miss'] += 1
+            return None
+
+        self.stats['hit'] += 1
+        return json.loads(row['response'])
+
+    def set(self, query, data, cse_id='', num=10):
+        """Lưu response (chỉ response hợp lệ, không lưu lỗi quota/API)"""
+        if not isinstance(data, dict) or 'error' in data:
+            return
+
+        self.conn.execute(
+            """INSERT OR REPLACE INTO search_cache (query_key, query, response, created_at)
+               VALUES (?, ?, ?, ?)""",
+            (make_query_key(query, cse_id, num), query, json.dumps(data, ensure_ascii=False), time.time())
+        )
+        self.stats['stored'] += 1
+
+    def purge_expired(self):
+        """Xoá entries đã hết hạn, trả về số dòng đã xoá"""
+        cur = self.conn.execute(
+            "DELETE FROM search_cache WHERE created_at < ?",
+            (time.time() - self.ttl,)
+        )
+        return cur.rowcount
+
+    def close(self):
+        self.conn.close()
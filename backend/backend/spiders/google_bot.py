@@ -4,16 +4,41 @@ Google Search Spider - FLEXIBLE VERSION
 ✅ KHÔNG ưu tiên domain nào (100% linh hoạt)
 ✅ Tin tưởng Google ranking
 ✅ Try multiple results nếu scrape fail
+✅ Stop-on-first-success: mỗi keyword chỉ emit 1 item
+✅ Multi-keyword mode: 1 process cho cả danh sách keywords
+✅ Job store (JOB_DB): ghi stage từng keyword, bỏ qua keyword đã đăng
+✅ Search cache: query đã search (trong TTL) → không tốn CSE quota
+✅ Domain reputation: học domain nào hay fail → xếp sau / bỏ qua
+✅ Extraction templates: domain đã scrape thành công → thử selector đã học trước
+✅ Compaction: nội dung nguồn xếp hạng BM25 theo keyword, gói vừa SOURCE_TOKEN_BUDGET
+✅ Structured facts (JSON-LD, infobox, bảng thông số) → item['structured_facts']
+✅ Parse executor (PARSE_WORKERS): extract HTML trong process pool, reactor vẫn tải tiếp
 
 File: backend/backend/spiders/google_bot.py
 """
 
 import scrapy
 import os
+import sys
 import json
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-import re
+from urllib.parse import urlparse
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import maybe_deferred_to_future
+
+from backend.coordinator import KeywordCoordinator
+from backend.jobstore import JobStore, STAGES, make_idempotency_key
+from backend.search_cache import SearchCache
+from backend.domain_stats import DomainReputation
+from backend.domain_matcher import DomainMatcher
+from backend.extraction_templates import TemplateCache
+from backend.extraction import clean_content
+from backend.compaction import compact_source, estimate_tokens
+from backend.structured_facts import format_facts
+from backend.parse_executor import ParseExecutor
+
+
+# Trạng thái cuối của 1 keyword → ghi results file ngay (runner đọc được kể cả khi worker bị kill)
+FINAL_STATUSES = ('published', 'publish_failed', 'ai_failed')
 
 
 class GoogleBotSpider(scrapy.Spider):
@@ -57,6 +82,16 @@ class GoogleBotSpider(scrapy.Spider):
         'scribd.com',
     ]
     
+    # Build 1 lần khi load class: list mặc định + file rules (BLACKLIST_FILE, hỗ trợ allow/deny)
+    BLACKLIST = DomainMatcher.build(BLACKLIST_DOMAINS, os.getenv('BLACKLIST_FILE', ''))
+    
+    # Ngưỡng chất lượng: đạt → dừng, không thử candidates còn lại
+    MIN_SUCCESS_CHARS = 300
+    MIN_PARTIAL_CHARS = 100
+    
+    # Confidence (0-1) của extractor: đủ MIN_SUCCESS_CHARS mà chưa tới ngưỡng này (menu, trang 404...) → chưa đạt
+    SUCCESS_CONFIDENCE = float(os.getenv('SUCCESS_CONFIDENCE', '0.5'))
+    
     custom_settings = {
         'DOWNLOAD_DELAY': 1,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
@@ -64,14 +99,126 @@ class GoogleBotSpider(scrapy.Spider):
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
     }
     
-    def __init__(self, keyword='', *args, **kwargs):
+    def __init__(self, keyword='', keywords_file='', results_file='', *args, **kwargs):
         super(GoogleBotSpider, self).__init__(*args, **kwargs)
-        self.keyword = keyword or os.getenv('KEYWORD', '')
         
-        if not self.keyword:
+        # Single keyword (-a keyword=...) hoặc danh sách (-a keywords_file=... / "-" = stdin)
+        if keywords_file:
+            self.keywords = self.load_keywords(keywords_file)
+        else:
+            keyword = keyword or os.getenv('KEYWORD', '')
+            self.keywords = [keyword] if keyword else []
+        
+        if not self.keywords:
             raise ValueError("Keyword is required!")
         
-        self.logger.info(f"🔍 Spider initialized for keyword: {self.keyword}")
+        # Số candidates tải song song cho 1 keyword (1 = tuần tự)
+        self.candidate_window = int(os.getenv('CANDIDATE_WINDOW', '1') or 1)
+        self.coordinators = {}
+        
+        # Kết quả từng keyword (pipelines cập nhật tiếp qua record_result)
+        self.results_file = results_file or os.getenv('RESULTS_FILE', '')
+        self.keyword_results = {
+            kw: {'keyword': kw, 'status': 'pending', 'source_url': '', 'chars': 0}
+            for kw in self.keywords
+        }
+        
+        # Job store - chỉ bật khi runner truyền JOB_DB
+        self.job_store = JobStore(os.getenv('JOB_DB')) if os.getenv('JOB_DB') else None
+        
+        # Cache Google CSE (SEARCH_CACHE_TTL / SEARCH_CACHE_BYPASS)
+        try:
+            self.search_cache = SearchCache()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Search cache disabled: {e}")
+            self.search_cache = None
+        
+        # Lịch sử extract theo domain
+        try:
+            self.domain_reputation = DomainReputation()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Domain reputation disabled: {e}")
+            self.domain_reputation = None
+        
+        # Selector đã học theo domain
+        try:
+            self.template_cache = TemplateCache()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Extraction templates disabled: {e}")
+            self.template_cache = None
+        
+        # Extract HTML: inline (PARSE_WORKERS=0) hoặc process pool
+        self.parse_executor = ParseExecutor()
+        if self.parse_executor.workers:
+            self.logger.info(f"🧵 Parse executor: {self.parse_executor.workers} worker processes")
+        
+        if len(self.keywords) == 1:
+            self.logger.info(f"🔍 Spider initialized for keyword: {self.keywords[0]}")
+        else:
+            self.logger.info(f"🔍 Spider initialized for {len(self.keywords)} keywords")
+    
+    @staticmethod
+    def load_keywords(keywords_file):
+        """Đọc keywords: mỗi dòng 1 keyword, bỏ dòng trống / comment (#), bỏ trùng"""
+        if keywords_file == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(keywords_file, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        
+        keywords = []
+        seen = set()
+        for line in lines:
+            kw = line.strip()
+            if not kw or kw.startswith('#') or kw in seen:
+                continue
+            seen.add(kw)
+            keywords.append(kw)
+        
+        return keywords
+    
+    def job_key(self, keyword):
+        """Idempotency key của keyword trong job store"""
+        return make_idempotency_key(keyword, os.getenv('CATEGORY_NAME', ''), os.getenv('WP_URL', ''))
+    
+    def record_result(self, keyword, ai_result=None, **fields):
+        """Cập nhật kết quả của 1 keyword (spider + pipelines)"""
+        result = self.keyword_results.setdefault(
+            keyword, {'keyword': keyword, 'status': 'pending', 'source_url': '', 'chars': 0}
+        )
+        result.update(fields)
+        
+        if fields.get('status') in FINAL_STATUSES:
+            self._append_result(result)
+        
+        if not self.job_store:
+            return
+        
+        status = fields.get('status')
+        key = self.job_key(keyword)
+        try:
+            if status in STAGES:
+                self.job_store.mark_stage(
+                    key, status,
+                    source_url=fields.get('source_url'),
+                    ai_result=ai_result,
+                    post_link=fields.get('post_link')
+                )
+            elif fields.get('error'):
+                self.job_store.record_error(key, f"{status}: {fields['error']}")
+        except Exception as e:
+            self.logger.warning(f"⚠️ Job store update failed: {e}")
+    
+    def _append_result(self, result):
+        """Ghi ngay 1 dòng kết quả (append + flush); dòng sau của cùng keyword ghi đè dòng trước"""
+        if not self.results_file:
+            return
+        try:
+            with open(self.results_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                f.flush()
+        except Exception as e:
+            self.logger.error(f"❌ Cannot write results file: {e}")
     
     def start_requests(self):
         """Start with Google Custom Search"""
@@ -83,54 +230,126 @@ class GoogleBotSpider(scrapy.Spider):
             self.logger.error("❌ Missing GOOGLE_API_KEY or GOOGLE_CSE_ID")
             return
         
-        search_query = self.keyword
+        for keyword in self.keywords:
+            if self.job_store:
+                job = self.job_store.get(self.job_key(keyword))
+                if job and job.get('published_at'):
+                    self.logger.info(f"⏭️ Already published (job store): {keyword}")
+                    self.keyword_results[keyword].update(status='published', post_link=job.get('post_link', ''))
+                    continue
+            
+            search_query = keyword
+            
+            cached = None
+            if self.search_cache:
+                try:
+                    cached = self.search_cache.get(search_query, cse_id)
+                except Exception as e:
+                    self.logger.warning(f"⚠️ Search cache read failed: {e}")
+            if cached is not None:
+                self.logger.info(f"💾 Search cache HIT: {search_query}")
+                self._inc_stat('search_cache/hit')
+                yield from self._handle_search_results(keyword, cached)
+                continue
+            
+            self._inc_stat('search_cache/miss')
+            self.logger.info(f"🔍 Searching Google for: {search_query}")
+            
+            # Lấy 10 results để có nhiều backup
+            search_url = (
+                f"https://www.googleapis.com/customsearch/v1"
+                f"?key={api_key}"
+                f"&cx={cse_id}"
+                f"&q={search_query}"
+                f"&num=10"
+            )
+            
+            yield scrapy.Request(
+                url=search_url,
+                callback=self.parse_google_results,
+                errback=self.errback_httpbin,
+                dont_filter=True,
+                meta={'keyword': keyword}
+            )
+    
+    def _inc_stat(self, key):
+        """Tăng Scrapy stats (nếu spider đang chạy trong crawler)"""
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            crawler.stats.inc_value(key)
+    
+    def closed(self, reason):
+        """Log + ghi kết quả từng keyword"""
+        
+        self.parse_executor.shutdown()
         
-        self.logger.info(f"🔍 Searching Google for: {search_query}")
+        if self.search_cache:
+            cache_stats = self.search_cache.stats
+            self.logger.info(f"💾 Search cache: {cache_stats['hit']} hit / {cache_stats['miss']} miss")
         
-        # Lấy 10 results để có nhiều backup
-        search_url = (
-            f"https://www.googleapis.com/customsearch/v1"
-            f"?key={api_key}"
-            f"&cx={cse_id}"
-            f"&q={search_query}"
-            f"&num=10"
-        )
+        if self.template_cache:
+            template_stats = self.template_cache.stats
+            self.logger.info(
+                f"🧩 Templates: {template_stats['hit']} hit / {template_stats['miss']} miss / "
+                f"{template_stats['learned']} learned"
+            )
         
-        yield scrapy.Request(
-            url=search_url,
-            callback=self.parse_google_results,
-            errback=self.errback_httpbin,
-            dont_filter=True,
-            meta={'keyword': self.keyword}
-        )
+        self.logger.info(f"=== Keyword Results ({len(self.keyword_results)}) ===")
+        for result in self.keyword_results.values():
+            self.logger.info(f"📌 RESULT: {json.dumps(result, ensure_ascii=False)}")
+        
+        # Snapshot cuối (kể cả keyword chưa tới trạng thái cuối)
+        for result in self.keyword_results.values():
+            self._append_result(result)
     
     def is_blacklisted(self, url):
         """Check if URL is in blacklist"""
-        domain = urlparse(url).netloc.lower()
-        
-        for blocked in self.BLACKLIST_DOMAINS:
-            if blocked in domain:
-                return True
-        return False
+        return self.BLACKLIST.is_blocked(url)
+    
+    def _empty_item(self, keyword):
+        """Item rỗng khi không có kết quả search"""
+        self.record_result(keyword, status='no_results')
+        return {
+            'keyword': keyword,
+            'source_url': '',
+            'raw_text': '',
+            'image_url': ''
+        }
     
     def parse_google_results(self, response):
         """Parse Google results - Trust Google ranking, only filter blacklist"""
         
+        keyword = response.meta['keyword']
+        
         try:
             data = json.loads(response.text)
+        except Exception as e:
+            self.logger.error(f"❌ Error in parse_google_results: {e}")
+            yield self._empty_item(keyword)
+            return
+        
+        # Lỗi ghi cache (SQLite bị lock / hỏng) không được làm mất response đã trả quota
+        if self.search_cache:
+            try:
+                self.search_cache.set(keyword, data, cse_id=os.getenv("GOOGLE_CSE_ID", ""))
+            except Exception as e:
+                self.logger.warning(f"⚠️ Search cache write failed: {e}")
+        
+        yield from self._handle_search_results(keyword, data)
+    
+    def _handle_search_results(self, keyword, data):
+        """Lọc blacklist + giao candidates cho coordinator (dùng chung cho API và cache)"""
+        
+        try:
             items = data.get('items', [])
             
             if not items:
-                self.logger.warning("⚠️ No search results found")
-                yield {
-                    'keyword': self.keyword,
-                    'source_url': '',
-                    'raw_text': '',
-                    'image_url': ''
-                }
+                self.logger.warning(f"⚠️ No search results found: {keyword}")
+                yield self._empty_item(keyword)
                 return
             
-            self.logger.info(f"✅ Found {len(items)} search results")
+            self.logger.info(f"✅ Found {len(items)} search results for: {keyword}")
+            self.record_result(keyword, status='searched')
             
             # === ONLY FILTER BLACKLIST ===
             # Giữ nguyên thứ tự Google ranking!
@@ -150,13 +369,8 @@ class GoogleBotSpider(scrapy.Spider):
                     self.logger.info(f"  #{idx} ✅ OK: {domain}")
             
             if not valid_items:
-                self.logger.warning("⚠️ All results are blacklisted!")
-                yield {
-                    'keyword': self.keyword,
-                    'source_url': '',
-                    'raw_text': '',
-                    'image_url': ''
-                }
+                self.logger.warning(f"⚠️ All results are blacklisted: {keyword}")
+                yield self._empty_item(keyword)
                 return
             
             self.logger.info(f"📊 Valid results: {len(valid_items)}/{len(items)}")
@@ -165,15 +379,9 @@ class GoogleBotSpider(scrapy.Spider):
             # Thử từng URL theo thứ tự Google ranking
             # Dừng khi scrape thành công
             
-            for idx, result_item in enumerate(valid_items, 1):
-                target_url = result_item.get('link', '')
-                
-                self.logger.info(f"📄 [{idx}/{len(valid_items)}] Trying: {target_url[:80]}...")
-                
+            candidates = []
+            for result_item in valid_items:
                 # Get metadata
-                google_snippet = result_item.get('snippet', '')
-                google_title = result_item.get('title', '')
-                
                 image_url = ''
                 if 'pagemap' in result_item:
                     pagemap = result_item['pagemap']
@@ -185,37 +393,137 @@ class GoogleBotSpider(scrapy.Spider):
                                    meta.get('twitter:image') or 
                                    meta.get('image', ''))
                 
-                # Scrape
-                yield scrapy.Request(
-                    url=target_url,
-                    callback=self.parse_content,
-                    errback=self.errback_httpbin,
-                    dont_filter=True,
-                    meta={
-                        'keyword': self.keyword,
-                        'source_url': target_url,
-                        'google_image': image_url,
-                        'google_snippet': google_snippet,
-                        'google_title': google_title,
-                        'try_index': idx,
-                        'total_valid': len(valid_items)
-                    },
-                    priority=100 - idx  # Higher priority for earlier results
-                )
+                candidates.append({
+                    'url': result_item.get('link', ''),
+                    'snippet': result_item.get('snippet', ''),
+                    'title': result_item.get('title', ''),
+                    'image': image_url,
+                })
+            
+            # === DOMAIN REPUTATION ===
+            # Domain luôn fail → bỏ qua, domain hay fail → thử sau
+            
+            if self.domain_reputation:
+                ranked, skipped = self.domain_reputation.rank(candidates)
+                for candidate, stats in skipped:
+                    self.logger.info(
+                        f"  ⏭️ SKIP: {urlparse(candidate['url']).netloc} "
+                        f"(history: {stats['failures']} failed + {stats['fallbacks']} fallback / {stats['attempts']})"
+                    )
+                if ranked != [c for c in candidates if c in ranked]:
+                    self.logger.info("  🔀 Reordered candidates by domain history")
+                candidates = ranked
+            
+            coordinator = KeywordCoordinator(keyword, candidates, window=self.candidate_window)
+            self.coordinators[keyword] = coordinator
+            
+            yield from self._advance(coordinator)
             
         except Exception as e:
             self.logger.error(f"❌ Error in parse_google_results: {e}")
-            yield {
-                'keyword': self.keyword,
-                'source_url': '',
-                'raw_text': '',
-                'image_url': ''
-            }
+            yield self._empty_item(keyword)
+    
+    def _advance(self, coordinator):
+        """Schedule candidates tiếp theo, hoặc chốt kết quả khi đã hết"""
+        
+        for idx, candidate in coordinator.next_batch():
+            target_url = candidate['url']
+            try_index = idx + 1
+            
+            self.logger.info(f"📄 [{try_index}/{coordinator.total}] Trying: {target_url[:80]}...")
+            
+            # Scrape
+            yield scrapy.Request(
+                url=target_url,
+                callback=self.parse_content,
+                errback=self.errback_httpbin,
+                dont_filter=True,
+                meta={
+                    'keyword': coordinator.keyword,
+                    'source_url': target_url,
+                    'google_image': candidate['image'],
+                    'google_snippet': candidate['snippet'],
+                    'google_title': candidate['title'],
+                    'try_index': try_index,
+                    'total_valid': coordinator.total
+                },
+                priority=100 - try_index  # Higher priority for earlier results
+            )
+        
+        if coordinator.is_exhausted():
+            item = coordinator.finalize()
+            
+            if item is None:
+                # Tất cả request đều lỗi → dùng snippet của kết quả #1
+                first = coordinator.candidates[0] if coordinator.candidates else {}
+                self.logger.warning(f"⚠️ All candidates failed for: {coordinator.keyword}")
+                item = {
+                    'keyword': coordinator.keyword,
+                    'source_url': first.get('url', ''),
+                    'raw_text': self._snippet_fallback(first.get('title', ''), first.get('snippet', '')),
+                    'image_url': first.get('image', '')
+                }
+            else:
+                self.logger.info(f"📋 No page passed threshold - using best: {item['source_url'][:80]}")
+            
+            self.record_result(coordinator.keyword, status='scraped',
+                               source_url=item['source_url'], chars=len(item['raw_text']))
+            yield item
+    
+    def _is_success(self, chars, confidence):
+        """
+        Đạt ngưỡng chất lượng? Luôn cần đủ MIN_SUCCESS_CHARS: trang ngắn (soft-404, "đã chuyển")
+        vẫn có thể đạt confidence cao vì ít link + đủ dấu câu.
+        Legacy engine không có confidence → chỉ xét số ký tự.
+        """
+        if chars < self.MIN_SUCCESS_CHARS:
+            return False
+        return confidence is None or confidence >= self.SUCCESS_CONFIDENCE
+    
+    def _record_domain(self, domain, response, chars, fallback, confidence=None):
+        """Ghi kết quả extract vào domain reputation"""
+        if not self.domain_reputation:
+            return
+        try:
+            self.domain_reputation.record_fetch(
+                domain,
+                latency=response.meta.get('download_latency'),
+                chars=chars,
+                success=self._is_success(chars, confidence),
+                fallback=fallback
+            )
+        except Exception as e:
+            self.logger.warning(f"⚠️ Domain stats update failed: {e}")
+    
+    def _update_template(self, domain, extracted, success):
+        """Template hit → ghi nhận; miss → đếm; extract tốt bằng cascade → học selector mới"""
+        if not self.template_cache:
+            return
+        try:
+            status = extracted['metrics'].get('template')
+            if status == 'hit':
+                self.template_cache.record_hit(domain)
+                return
+            if status == 'miss':
+                self.template_cache.record_miss(domain)
+            if success and extracted.get('template'):
+                self.template_cache.learn(domain, extracted['template'])
+        except Exception as e:
+            self.logger.warning(f"⚠️ Template update failed: {e}")
+    
+    def _snippet_fallback(self, google_title, google_snippet):
+        """Build fallback text from Google title + snippet"""
+        fallback = ""
+        if google_title:
+            fallback += f"Title: {google_title}\n\n"
+        if google_snippet:
+            fallback += f"Summary: {google_snippet}\n"
+        return fallback
     
-    def parse_content(self, response):
+    async def parse_content(self, response):
         """Parse article content - FLEXIBLE for any site"""
         
-        keyword = response.meta.get('keyword', self.keyword)
+        keyword = response.meta['keyword']
         source_url = response.meta.get('source_url', '')
         google_image = response.meta.get('google_image', '')
         google_snippet = response.meta.get('google_snippet', '')
@@ -224,120 +532,66 @@ class GoogleBotSpider(scrapy.Spider):
         total_valid = response.meta.get('total_valid', 1)
         
         domain = urlparse(source_url).netloc
+        
+        coordinator = self.coordinators.get(keyword)
+        if coordinator and not coordinator.is_active(try_index - 1):
+            self.logger.info(f"⏭️ [{try_index}/{total_valid}] Skip {domain} - keyword already resolved")
+            return
+        
         self.logger.info(f"📝 [{try_index}/{total_valid}] Extracting from: {domain}")
         
         try:
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # Remove unwanted
-            for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']):
-                tag.decompose()
-            
-            # Remove clutter
-            clutter_classes = ['navigation', 'sidebar', 'menu', 'footer', 'header', 'ads', 'advertisement', 'cookie', 'popup']
-            for clutter in clutter_classes:
-                for elem in soup.find_all(class_=lambda x: x and clutter in x.lower()):
-                    elem.decompose()
-            
-            content = ''
-            
-            # === FLEXIBLE EXTRACTION - Works for most sites ===
-            
-            # Strategy 1: Specific selectors for known platforms
-            if 'fandom.com' in source_url or 'wikia.com' in source_url:
-                main_content = soup.find('div', class_='mw-parser-output')
-                if main_content:
-                    for elem in main_content.find_all(['p', 'h2', 'h3', 'h4', 'ul', 'ol']):
-                        text = elem.get_text(separator=' ', strip=True)
-                        if text and len(text) > 10:
-                            content += text + '\n\n'
-            
-            # Strategy 2: WordPress (very common)
-            if not content and ('wordpress' in response.text.lower() or 'wp-content' in response.text.lower()):
-                for class_hint in ['entry-content', 'post-content', 'article-content', 'content-area']:
-                    post_content = soup.find(['div', 'article'], class_=lambda x: x and class_hint in x.lower())
-                    if post_content:
-                        content = post_content.get_text(separator='\n', strip=True)
-                        break
-            
-            # Strategy 3: Semantic HTML5 tags
-            if not content:
-                article = soup.find('article')
-                if article:
-                    content = article.get_text(separator='\n', strip=True)
-            
-            if not content:
-                main = soup.find('main')
-                if main:
-                    content = main.get_text(separator='\n', strip=True)
-            
-            if not content:
-                main_role = soup.find(attrs={'role': 'main'})
-                if main_role:
-                    content = main_role.get_text(separator='\n', strip=True)
-            
-            # Strategy 4: Common class names
-            if not content:
-                for class_name in ['content', 'article', 'post', 'entry', 'body', 'main-content', 'page-content']:
-                    candidates = soup.find_all(['div', 'section'], class_=lambda x: x and class_name in x.lower())
-                    if candidates:
-                        # Get longest div (likely main content)
-                        best_candidate = max(candidates, key=lambda d: len(d.get_text(strip=True)))
-                        text = best_candidate.get_text(separator='\n', strip=True)
-                        if len(text) > 100:
-                            content = text
-                            break
-            
-            # Strategy 5: Last resort - body
-            if not content:
-                body = soup.find('body')
-                if body:
-                    content = body.get_text(separator='\n', strip=True)
-            
-            # === CLEAN CONTENT ===
-            
-            lines = [line.strip() for line in content.split('\n') if line.strip()]
-            
-            # Remove very short lines (navigation, menu items)
-            lines = [line for line in lines if len(line) > 15]
-            
-            # Remove duplicates
-            cleaned_lines = []
-            prev_line = None
-            for line in lines:
-                if line != prev_line:
-                    cleaned_lines.append(line)
-                    prev_line = line
-            
-            content = '\n'.join(cleaned_lines)
-            
-            # Limit but keep substantial content
-            if len(content) > 20000:
-                content = content[:20000]
+            template = self.template_cache.get(domain) if self.template_cache else None
+            extracted = await maybe_deferred_to_future(
+                self.parse_executor.submit(response.body, source_url, encoding=response.encoding, template=template)
+            )
+            facts = extracted.get('facts') or {}
+            if facts:
+                self.logger.info(f"📑 Structured facts: {len(facts)}")
+            
+            # Không cắt cứng theo ký tự - compaction giữ các đoạn liên quan nhất
+            # (facts đã chiếm 1 phần token budget của nguồn)
+            content = clean_content(extracted['content'], max_chars=0)
+            content, compaction = compact_source(
+                content, keyword, reserved=estimate_tokens(format_facts(facts))
+            )
+            if compaction['tokens_out'] < compaction['tokens_in']:
+                self.logger.info(
+                    f"🗜️ Compacted: {compaction['kept']}/{compaction['paragraphs']} paragraphs, "
+                    f"~{compaction['tokens_in']} → ~{compaction['tokens_out']} tokens "
+                    f"({compaction['duplicates']} duplicate lines)"
+                )
+            
+            metrics = extracted['metrics']
+            confidence = extracted.get('confidence')
+            self.logger.info(
+                f"🧩 Strategy: {extracted['strategy']} ({metrics.get('engine')}, {metrics.get('parse_ms')} ms, "
+                f"confidence {confidence})"
+            )
             
             # === EVALUATE SUCCESS ===
             
             chars = len(content)
             
-            if chars >= 300:
+            self._update_template(domain, extracted, self._is_success(chars, confidence))
+            
+            if self._is_success(chars, confidence):
                 self.logger.info(f"✅ SUCCESS! {chars} chars from {domain}")
                 success = True
-            elif chars >= 100:
+            elif chars >= self.MIN_PARTIAL_CHARS:
                 self.logger.warning(f"⚠️ Partial: {chars} chars from {domain}")
                 success = True  # Acceptable
             else:
                 self.logger.warning(f"❌ Failed: Only {chars} chars from {domain}")
                 success = False
             
+            self._record_domain(domain, response, chars=chars, fallback=not success, confidence=confidence)
+            
             # === FALLBACK TO SNIPPET ===
             
             if not success and (google_snippet or google_title):
                 self.logger.info("📋 Using Google snippet as fallback")
-                fallback = ""
-                if google_title:
-                    fallback += f"Title: {google_title}\n\n"
-                if google_snippet:
-                    fallback += f"Summary: {google_snippet}\n"
+                fallback = self._snippet_fallback(google_title, google_snippet)
                 
                 if fallback:
                     content = fallback
@@ -345,67 +599,89 @@ class GoogleBotSpider(scrapy.Spider):
             
             # === FIND IMAGE ===
             
-            image_url = google_image
-            
-            if not image_url:
-                og_image = soup.find('meta', property='og:image')
-                if og_image and og_image.get('content'):
-                    image_url = og_image.get('content')
-            
-            if not image_url:
-                tw_image = soup.find('meta', attrs={'name': 'twitter:image'})
-                if tw_image and tw_image.get('content'):
-                    image_url = tw_image.get('content')
-            
-            if not image_url:
-                # Find first reasonable img
-                imgs = soup.find_all('img')
-                for img in imgs:
-                    src = img.get('src') or img.get('data-src')
-                    if src and not any(skip in src.lower() for skip in ['logo', 'icon', 'avatar', 'ad', 'banner']):
-                        if src.startswith('//'):
-                            image_url = 'https:' + src
-                        elif src.startswith('/'):
-                            parsed = urlparse(source_url)
-                            image_url = f"{parsed.scheme}://{parsed.netloc}{src}"
-                        elif src.startswith('http'):
-                            image_url = src
-                        
-                        if image_url:
-                            break
+            image_url = google_image or extracted['image_url']
             
             if image_url:
                 self.logger.info(f"🖼️ Image: {image_url[:60]}...")
             
             # === YIELD RESULT ===
             
-            yield {
+            item = {
                 'keyword': keyword,
                 'source_url': source_url,
                 'raw_text': content,
-                'image_url': image_url
+                'image_url': image_url,
+                'structured_facts': facts
             }
             
         except Exception as e:
             self.logger.error(f"❌ Parse error on {domain}: {e}")
             
             # Fallback to snippet
-            fallback = ""
-            if google_title:
-                fallback += f"Title: {google_title}\n\n"
-            if google_snippet:
-                fallback += f"Summary: {google_snippet}\n"
-            
-            yield {
+            chars = 0
+            confidence = 0.0
+            self._record_domain(domain, response, chars=0, fallback=True)
+            item = {
                 'keyword': keyword,
                 'source_url': source_url,
-                'raw_text': fallback,
+                'raw_text': self._snippet_fallback(google_title, google_snippet),
                 'image_url': google_image
             }
+        
+        if not coordinator:
+            self.record_result(keyword, status='scraped', source_url=source_url, chars=chars)
+            yield item
+            return
+        
+        # Trong lúc parse (process pool), candidate khác có thể đã thắng
+        if not coordinator.is_active(try_index - 1):
+            self.logger.info(f"⏭️ [{try_index}/{total_valid}] Drop {domain} - keyword resolved during parse")
+            return
+        
+        if self._is_success(chars, confidence):
+            # Đạt ngưỡng → dừng, huỷ các candidates còn lại
+            resolved = coordinator.report_success(try_index - 1, item)
+            if resolved:
+                self.logger.info(f"🏁 Keyword resolved at candidate #{try_index}: {keyword}")
+                self.record_result(keyword, status='scraped', source_url=source_url, chars=chars)
+                yield resolved
+            return
+        
+        # Partial tốt nhất = nhiều chữ nhất, có trọng số theo chất lượng
+        score = chars if confidence is None else chars * max(confidence, 0.1)
+        coordinator.report_partial(try_index - 1, item, score)
+        for request in self._advance(coordinator):
+            yield request
     
     def errback_httpbin(self, failure):
         """Handle request errors"""
+        
+        if failure.check(IgnoreRequest):
+            # Candidate bị huỷ vì keyword đã xong
+            return
+        
         self.logger.error(f"❌ Request failed: {failure.value}")
         
-        # Don't yield - let next URL try
-        return
\ No newline at end of file
+        # Let next URL try
+        meta = failure.request.meta
+        keyword = meta.get('keyword')
+        coordinator = self.coordinators.get(keyword)
+        try_index = meta.get('try_index')
+        
+        if try_index is not None and self.domain_reputation:
+            try:
+                self.domain_reputation.record_failure(failure.request.url, latency=meta.get('download_latency'))
+            except Exception as e:
+                self.logger.warning(f"⚠️ Domain stats update failed: {e}")
+        
+        if try_index is None:
+            # Google search request lỗi
+            if keyword:
+                self.record_result(keyword, status='search_failed', error=str(failure.value)[:200])
+            return
+        
+        if not coordinator:
+            return
+        
+        coordinator.report_failure(try_index - 1)
+        yield from self._advance(coordinator)
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Local Storage Helpers - SQLite dùng chung cho các store
+✅ 1 thư mục data cố định (không phụ thuộc cwd: dashboard, scrapy, CLI dùng chung)
+✅ WAL mode → nhiều process đọc/ghi cùng lúc
+
+File: backend/backend/storage.py
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+
+# backend/data (cùng cấp scrapy.cfg)
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+
+def data_path(filename, env_var=None):
+    """Đường dẫn file data: ưu tiên env_var, sau đó DATA_DIR, cuối cùng backend/data"""
+    if env_var and os.getenv(env_var):
+        return os.getenv(env_var)
+
+    data_dir = Path(os.getenv('DATA_DIR') or DEFAULT_DATA_DIR)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return str(data_dir / filename)
+
+
+def connect(path):
+    """Mở SQLite connection (autocommit, transaction tự quản bằng BEGIN)"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
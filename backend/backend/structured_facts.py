@@ -0,0 +1,205 @@
+"""
+Structured Facts - Lấy dữ kiện có cấu trúc từ trang (trước khi bỏ boilerplate)
+✅ JSON-LD (application/ld+json): Product, Article, Review, VideoGame...
+✅ Fandom portable-infobox (label → value)
+✅ Bảng thông số 2 cột (th/td), danh sách <dl>
+✅ Meta tags (description, og:type, published time, price)
+✅ Output: dict key → value gọn (vài trăm bytes) cho prompt
+
+File: backend/backend/structured_facts.py
+"""
+
+import json
+import re
+
+
+MAX_FACTS = 40
+MAX_VALUE_CHARS = 200
+MAX_KEY_CHARS = 60
+MAX_SPEC_TABLES = 3
+
+# JSON-LD: bỏ các type chỉ mang thông tin điều hướng / site
+SKIP_LD_TYPES = {
+    'BreadcrumbList', 'WebSite', 'WebPage', 'SearchAction', 'ImageObject', 'SiteNavigationElement',
+    'Organization', 'ListItem', 'EntryPoint', 'ReadAction', 'CollectionPage', 'FAQPage', 'HowTo'
+}
+
+# JSON-LD: bỏ các key không phải dữ kiện
+SKIP_LD_KEYS = {
+    '@context', '@id', 'url', 'image', 'logo', 'thumbnailUrl', 'sameAs', 'potentialAction',
+    'mainEntityOfPage', 'breadcrumb', 'isPartOf', 'publisher', 'articleBody', 'text', 'inLanguage',
+    'contentUrl', 'embedUrl', 'wordCount', 'hasPart', 'itemListElement'
+}
+
+META_FACTS = {
+    'description': 'description',
+    'og:type': 'type',
+    'article:published_time': 'published',
+    'article:modified_time': 'modified',
+    'product:price:amount': 'price',
+    'product:price:currency': 'currency',
+    'product:brand': 'brand',
+}
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def _clean(value):
+    return WHITESPACE.sub(' ', str(value)).strip()[:MAX_VALUE_CHARS]
+
+
+def _text(el):
+    return _clean(' '.join(t for t in el.itertext() if t.strip()))
+
+
+def _class_xpath(name):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+class _Facts:
+    """Dict có giới hạn, key đầu tiên thắng"""
+
+    def __init__(self, limit=MAX_FACTS):
+        self.data = {}
+        self.limit = limit
+
+    def add(self, key, value):
+        key = _clean(key).rstrip(':').strip()[:MAX_KEY_CHARS]
+        value = _clean(value) if value is not None else ''
+        if not key or not value or key in self.data or len(self.data) >= self.limit:
+            return
+        self.data[key] = value
+
+    @property
+    def full(self):
+        return len(self.data) >= self.limit
+
+
+# === JSON-LD ===
+
+def _ld_objects(data):
+    """Duỗi list / @graph thành các object"""
+    if isinstance(data, list):
+        for entry in data:
+            yield from _ld_objects(entry)
+    elif isinstance(data, dict):
+        if '@graph' in data:
+            yield from _ld_objects(data['@graph'])
+        else:
+            yield data
+
+
+def _ld_types(obj):
+    types = obj.get('@type', [])
+    return set(types if isinstance(types, list) else [types])
+
+
+def _flatten_ld(obj, facts, prefix='', depth=0):
+    for key, value in obj.items():
+        if key in SKIP_LD_KEYS or (key.startswith('@') and (key != '@type' or depth)):
+            continue
+        name = f'{prefix}{key}' if key != '@type' else f'{prefix}type'
+
+        if isinstance(value, dict):
+            if depth < 1 and not (_ld_types(value) & SKIP_LD_TYPES):
+                _flatten_ld(value, facts, prefix=f'{name}.', depth=depth + 1)
+        elif isinstance(value, list):
+            scalars = [v for v in value if isinstance(v, (str, int, float))]
+            if scalars:
+                facts.add(name, ', '.join(str(v) for v in scalars[:5]))
+            elif key == 'additionalProperty':
+                # PropertyValue: {name, value} → thông số sản phẩm
+                for prop in value:
+                    if isinstance(prop, dict):
+                        facts.add(prop.get('name', ''), prop.get('value'))
+            elif value and isinstance(value[0], dict) and depth < 1:
+                # author / brand dạng list → lấy name
+                names = [v.get('name') for v in value if isinstance(v, dict) and v.get('name')]
+                if names:
+                    facts.add(name, ', '.join(str(n) for n in names[:5]))
+        elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            facts.add(name, value)
+
+
+def _json_ld_facts(root, facts):
+    for script in root.xpath('//script[@type="application/ld+json"]'):
+        try:
+            data = json.loads(script.text or '')
+        except ValueError:
+            continue
+        for obj in _ld_objects(data):
+            if facts.full:
+                return
+            if not isinstance(obj, dict) or _ld_types(obj) & SKIP_LD_TYPES:
+                continue
+            _flatten_ld(obj, facts)
+
+
+# === HTML ===
+
+def _infobox_facts(root, facts):
+    """Fandom / MediaWiki portable-infobox"""
+    for box in root.xpath(f'//*[{_class_xpath("portable-infobox")}]'):
+        for title in box.xpath(f'.//*[{_class_xpath("pi-title")}]')[:1]:
+            facts.add('name', _text(title))
+        for row in box.xpath(f'.//*[{_class_xpath("pi-data")}]'):
+            label = row.xpath(f'.//*[{_class_xpath("pi-data-label")}]')
+            value = row.xpath(f'.//*[{_class_xpath("pi-data-value")}]')
+            if label and value:
+                facts.add(_text(label[0]), _text(value[0]))
+
+
+def _spec_table_facts(root, facts):
+    """Bảng 2 cột (tên thông số | giá trị) và <dl>"""
+    tables = 0
+    for table in root.iter('table'):
+        if tables >= MAX_SPEC_TABLES or facts.full:
+            return
+        rows = []
+        for tr in table.iter('tr'):
+            cells = [c for c in tr if c.tag in ('th', 'td')]
+            if len(cells) == 2:
+                rows.append((_text(cells[0]), _text(cells[1])))
+        # Bảng thông số: ít nhất 3 dòng dạng key/value, key ngắn
+        if len(rows) >= 3 and all(len(key) <= MAX_KEY_CHARS for key, _ in rows):
+            tables += 1
+            for key, value in rows:
+                facts.add(key, value)
+
+    for dl in root.iter('dl'):
+        if facts.full:
+            return
+        for dt in dl.iter('dt'):
+            dd = dt.getnext()
+            if dd is not None and dd.tag == 'dd':
+                facts.add(_text(dt), _text(dd))
+
+
+def _meta_facts(root, facts):
+    for meta in root.iter('meta'):
+        name = meta.get('property') or meta.get('name') or ''
+        if name in META_FACTS:
+            facts.add(META_FACTS[name], meta.get('content'))
+
+
+def extract_facts(root, limit=MAX_FACTS):
+    """
+    Dữ kiện có cấu trúc từ cây lxml (gọi TRƯỚC khi bỏ script / aside).
+
+    Thứ tự ưu tiên (key trùng → nguồn trước thắng): JSON-LD → infobox → bảng → meta
+    """
+    facts = _Facts(limit)
+    for collect in (_json_ld_facts, _infobox_facts, _spec_table_facts, _meta_facts):
+        if facts.full:
+            break
+        try:
+            collect(root, facts)
+        except Exception:
+            # HTML / JSON lỗi ở 1 nguồn không được làm hỏng cả trang
+            continue
+    return facts.data
+
+
+def format_facts(facts):
+    """dict → block 'key: value' cho prompt"""
+    return '\n'.join(f'- {key}: {value}' for key, value in (facts or {}).items())
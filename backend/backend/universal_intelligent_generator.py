@@ -13,6 +13,12 @@ import json
 from google import genai
 from google.genai import types
 
+# Cùng fallback import với pipelines.py (chạy file này trực tiếp / ngoài package backend)
+try:
+    from backend.structured_facts import format_facts
+except ImportError:
+    from structured_facts import format_facts
+
 # Fix encoding for Windows
 import sys
 if sys.platform == 'win32' and sys.stdout.encoding != 'utf-8':
@@ -197,41 +203,38 @@ class UniversalIntelligentGenerator:
         
         return self.website_profile
     
-    def generate_universal_prompt(self, keyword, category_name, brand_name, base_content=""):
-        """
-        V3.5 HYBRID: Hard rules + AI enhancement
-        
-        Args:
-            keyword: Từ khóa
-            category_name: Category (QUAN TRỌNG!)
-            brand_name: Thương hiệu
-            base_content: Nội dung gốc
-        
-        Returns:
-            str: Universal prompt
-        """
-        
-        # Step 1: Get hard rules từ category
+    def resolve_rules(self, category_name):
+        """Hard rules của category (hoặc bộ rules general)"""
         normalized_cat = normalize_category(category_name)
         
         if normalized_cat and normalized_cat in CATEGORY_RULES:
-            rules = CATEGORY_RULES[normalized_cat]
             print(f"Using hard rules for: {normalized_cat}")
-        else:
-            print(f"WARNING: No rules for category '{category_name}' - using general")
-            rules = {
-                "niche": "general content",
-                "sub_niche": "mixed topics",
-                "keyword_type": "general",
-                "entity_hint": "chủ đề chung",
-                "required_info": ["Thông tin cơ bản", "Định nghĩa", "Ứng dụng"],
-                "sources": ["nguồn uy tín"],
-                "tone": "friendly",
-                "depth": "moderate",
-                "format": ["giới thiệu", "phân tích", "kết luận"]
-            }
+            return CATEGORY_RULES[normalized_cat]
         
-        # Step 2: Build prompt với hard rules
+        print(f"WARNING: No rules for category '{category_name}' - using general")
+        return {
+            "niche": "general content",
+            "sub_niche": "mixed topics",
+            "keyword_type": "general",
+            "entity_hint": "chủ đề chung",
+            "required_info": ["Thông tin cơ bản", "Định nghĩa", "Ứng dụng"],
+            "sources": ["nguồn uy tín"],
+            "tone": "friendly",
+            "depth": "moderate",
+            "format": ["giới thiệu", "phân tích", "kết luận"]
+        }
+    
+    @staticmethod
+    def min_words(rules):
+        """Độ dài tối thiểu (từ) theo độ sâu của category"""
+        depth = rules["depth"]
+        return 1800 if depth == "deep" else 1400 if depth == "technical" else 1200
+    
+    def build_system_instruction(self, rules, brand_name):
+        """
+        Phần TĨNH của prompt: giống hệt cho mọi keyword cùng category + brand
+        → dùng làm system instruction / context cache.
+        """
         niche = rules["niche"]
         sub_niche = rules["sub_niche"]
         keyword_type = rules["keyword_type"]
@@ -256,10 +259,10 @@ Bạn là chuyên gia viết nội dung SEO trong lĩnh vực **{niche}**.
 
 # NHIỆM VỤ - QUAN TRỌNG
 
-Viết bài **{keyword_type}** về: `{keyword}`
+Mỗi yêu cầu cho 1 **từ khóa** (mục "TỪ KHÓA"). Viết bài **{keyword_type}** về từ khóa đó.
 
 ⚠️ **CONTEXT BẮT BUỘC:**
-- Đây là **{entity_hint}**
+- Từ khóa là **{entity_hint}**
 - KHÔNG PHẢI là chủ đề khác (y tế, công nghệ, tài chính...)
 - Tập trung 100% vào {niche}
 
@@ -289,7 +292,7 @@ Viết bài **{keyword_type}** về: `{keyword}`
 
 ⚠️ **QUY TẮC VÀNG:**
 - TUYỆT ĐỐI tuân thủ context: {entity_hint}
-- Nếu KHÔNG tìm thấy thông tin về {keyword} trong context này → Ghi: "Thông tin về {keyword} trong {niche} chưa được công bố"
+- Nếu KHÔNG tìm thấy thông tin về từ khóa trong context này → Ghi: "Thông tin về <từ khóa> trong {niche} chưa được công bố"
 - KHÔNG đoán, KHÔNG bịa
 - KHÔNG nhầm lẫn với chủ đề khác
 
@@ -297,7 +300,7 @@ Viết bài **{keyword_type}** về: `{keyword}`
 
 # CẤU TRÚC BÀI VIẾT
 
-**Tiêu đề (H1):** Hấp dẫn, chứa từ khóa `{keyword}`, phù hợp {niche}
+**Tiêu đề (H1):** Hấp dẫn, chứa từ khóa, phù hợp {niche}
 
 **Nội dung:**
 
@@ -307,14 +310,14 @@ Viết bài **{keyword_type}** về: `{keyword}`
             prompt += f"- {fmt}\n"
         
         # Word count based on depth
-        min_words = 1800 if depth == "deep" else 1400 if depth == "technical" else 1200
+        min_words = self.min_words(rules)
         
         prompt += f"""
 ---
 
 # TỐI ƯU SEO
 
-**Từ khóa chính:** `{keyword}`
+**Từ khóa chính:** từ khóa trong mục "TỪ KHÓA"
 **Xuất hiện:** 8-15 lần tự nhiên
 **Độ dài:** Tối thiểu {min_words} từ
 
@@ -350,9 +353,38 @@ Trả về **CHỈ JSON**:
     "content": "<p>Nội dung HTML...</p>"
 }}
 ```
+"""
+        
+        return prompt
+    
+    def build_keyword_prompt(self, keyword, rules, base_content="", structured_facts=None):
+        """Phần ĐỘNG của prompt: từ khóa + dữ kiện + nội dung tham khảo"""
+        niche = rules["niche"]
+        
+        prompt = f"""# TỪ KHÓA
+
+Viết bài **{rules["keyword_type"]}** về: `{keyword}`
+
+(Đây là **{rules["entity_hint"]}** - tập trung 100% vào {niche}.
+Nếu không có thông tin → "Thông tin về {keyword} trong {niche} chưa được công bố")
 
 ---
+"""
+        
+        # Dữ kiện có cấu trúc: gọn, ưu tiên dùng thay vì dò trong văn bản
+        if structured_facts:
+            facts_lines = format_facts(structured_facts)
+            prompt += f"""
+# DỮ KIỆN CHÍNH (từ nguồn)
+
+Dùng các thông số dưới đây làm dữ liệu chính xác cho {', '.join(rules["required_info"])}:
 
+{facts_lines}
+
+---
+"""
+        
+        prompt += f"""
 # NỘI DUNG THAM KHẢO
 
 {base_content if base_content else f"Không có nội dung gốc. Tìm kiếm web về {keyword} trong context {niche}."}
@@ -360,21 +392,128 @@ Trả về **CHỈ JSON**:
         
         return prompt
     
+    def build_outline_prompt(self, keyword_prompt, rules, min_sections=3, max_sections=8):
+        """
+        Outline mode - bước 1: dàn ý thay vì cả bài.
+        Vẫn dùng JSON title / excerpt / content, content = mở bài + khung H2.
+        """
+        return f"""{keyword_prompt}
+---
+
+# NHIỆM VỤ LẦN NÀY: DÀN Ý (CHƯA VIẾT CẢ BÀI)
+
+Bài hoàn chỉnh (tối thiểu {self.min_words(rules)} từ) sẽ được viết sau theo từng phần dựa trên dàn ý này.
+
+- **title**: tiêu đề cuối cùng của bài
+- **excerpt**: mô tả SEO 150-160 ký tự
+- **content**: HTML gồm
+  1. 1-2 thẻ `<p>` mở bài HOÀN CHỈNH (viết hay như bài thật)
+  2. {min_sections}-{max_sections} phần, mỗi phần: `<h2>Tiêu đề phần</h2>` + 1 thẻ `<p>` ghi chú 2-3 câu: ý chính, dữ kiện cần dùng
+  3. Phần cuối là kết luận
+
+Các phần KHÔNG trùng ý nhau, phủ hết thông tin bắt buộc, theo cấu trúc bài viết đã nêu.
+"""
+    
+    def build_section_prompt(self, keyword_prompt, title, sections, index, words, note=""):
+        """
+        Outline mode - bước 2: viết 1 phần (H2) của dàn ý.
+        
+        Args:
+            sections: [{'heading': ..., 'notes': ...}] từ dàn ý
+            index: vị trí phần cần viết (0-based)
+            words: số từ mục tiêu cho phần này
+            note: lỗi của lần viết trước (nếu có)
+        """
+        section = sections[index]
+        outline_lines = '\n'.join(
+            f"{idx}. {entry['heading']}" + (" ← PHẦN CẦN VIẾT" if idx - 1 == index else "")
+            for idx, entry in enumerate(sections, 1)
+        )
+        is_last = index == len(sections) - 1
+        
+        prompt = f"""{keyword_prompt}
+---
+
+# DÀN Ý BÀI VIẾT: {title}
+
+{outline_lines}
+
+---
+
+# NHIỆM VỤ LẦN NÀY: VIẾT PHẦN {index + 1}/{len(sections)}
+
+**Phần:** {section['heading']}
+**Ý chính:** {section['notes'] or "(theo tiêu đề phần)"}
+
+- **title**: đúng nguyên văn "{section['heading']}"
+- **excerpt**: để trống ""
+- **content**: HTML của RIÊNG phần này, bắt đầu bằng `<h2>{section['heading']}</h2>`, khoảng {words} từ (có thể dùng `<h3>`, `<ul>`)
+- KHÔNG viết mở bài chung{"" if is_last else ", KHÔNG viết kết luận chung"}, KHÔNG lặp ý của các phần khác trong dàn ý
+- Văn phong, xưng hô thống nhất với cả bài
+"""
+        if note:
+            prompt += f"""
+⚠️ **Lần viết trước chưa đạt:** {note}. Viết lại đúng yêu cầu trên.
+"""
+        return prompt
+    
+    def generate_prompt_parts(self, keyword, category_name, brand_name, base_content="",
+                              structured_facts=None, rules=None):
+        """
+        Prompt tách 2 phần (rules: hard rules đã resolve sẵn, None → resolve theo category_name).
+        
+        Returns:
+            (system_instruction, keyword_prompt): phần tĩnh theo category + phần theo keyword
+        """
+        rules = rules or self.resolve_rules(category_name)
+        return (
+            self.build_system_instruction(rules, brand_name),
+            self.build_keyword_prompt(keyword, rules, base_content, structured_facts)
+        )
+    
+    def generate_universal_prompt(self, keyword, category_name, brand_name, base_content="",
+                                  structured_facts=None, rules=None):
+        """
+        V3.5 HYBRID: Hard rules + AI enhancement
+        
+        Args:
+            keyword: Từ khóa
+            category_name: Category (QUAN TRỌNG!)
+            brand_name: Thương hiệu
+            base_content: Nội dung gốc
+            structured_facts: Dữ kiện key → value từ trang nguồn (JSON-LD, infobox...)
+            rules: Hard rules đã resolve sẵn (None → resolve theo category)
+        
+        Returns:
+            str: Universal prompt (phần tĩnh + phần theo keyword)
+        """
+        system_instruction, keyword_prompt = self.generate_prompt_parts(
+            keyword, category_name, brand_name, base_content, structured_facts, rules
+        )
+        return f"{system_instruction}\n---\n\n{keyword_prompt}"
+    
     def generate_with_auto_analysis(self, keyword, category_name, brand_name, 
                                    site_url, base_content="", 
-                                   site_description="", sample_keywords=None):
-        """One-shot với HYBRID mode"""
+                                   site_description="", sample_keywords=None,
+                                   structured_facts=None, split=False, rules=None):
+        """
+        One-shot với HYBRID mode (split=True → (system_instruction, keyword_prompt)).
+        rules: hard rules caller đã resolve (vd. pipeline cần cho outline mode) → không resolve lại
+        """
         
         # Simple website profile
         if not self.website_profile:
             self.analyze_website_universal(site_url, site_description, sample_keywords)
         
         # Generate với hard rules
-        prompt = self.generate_universal_prompt(
+        build = self.generate_prompt_parts if split else self.generate_universal_prompt
+        prompt = build(
             keyword, 
             category_name or "", 
             brand_name or "Website", 
-            base_content or ""
+            base_content or "",
+            structured_facts=structured_facts,
+            rules=rules
         )
         
         return prompt
@@ -384,7 +523,7 @@ Trả về **CHỈ JSON**:
 
 def create_universal_prompt(keyword, category_name, brand_name, site_url,
                            base_content="", site_description="", 
-                           sample_keywords=None, gemini_api_key=None):
+                           sample_keywords=None, gemini_api_key=None, structured_facts=None):
     """V3.5 Hybrid helper"""
     
     if not gemini_api_key:
@@ -402,5 +541,6 @@ def create_universal_prompt(keyword, category_name, brand_name, site_url,
         site_url=site_url,
         base_content=base_content or "",
         site_description=site_description or "",
-        sample_keywords=sample_keywords
+        sample_keywords=sample_keywords,
+        structured_facts=structured_facts
     )
\ No newline at end of file
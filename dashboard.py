@@ -3,6 +3,9 @@ Auto Content Pro Dashboard - V3 Clean Version (COMPLETE FIXED)
 ✅ Auto-expand failed keyword logs
 ✅ Better error display with error summary
 ✅ Proper success checking (PUBLISHED + returncode)
+✅ Chạy song song nhiều keyword + stream log realtime
+✅ Job store (SQLite): resume batch dang dở, không generate/đăng lại
+✅ Stats: chi phí / token / tokens/s / tiết kiệm cache thật từ metrics store
 
 File: dashboard.py
 """
@@ -12,10 +15,17 @@ import os
 import subprocess
 import sys
 import time
+import queue
+import threading
 from pathlib import Path
 import requests
 from requests.auth import HTTPBasicAuth
 
+# Backend package (job store)
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend'))
+from backend.jobstore import JobStore, make_idempotency_key, new_owner_id
+from backend.metrics import MetricsStore
+
 # Page config
 st.set_page_config(
     page_title="Auto Content Pro - V3",
@@ -46,6 +56,75 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Timeout cho mỗi keyword (giây)
+KEYWORD_TIMEOUT = 180
+
+# Số dòng log cuối hiển thị khi đang chạy
+LIVE_LOG_LINES = 200
+
+# Gia hạn lease job mỗi N giây
+HEARTBEAT_INTERVAL = 30
+
+# Chi phí ước lượng / keyword khi chưa có dữ liệu metrics
+DEFAULT_COST_PER_KEYWORD = 0.006
+
+
+def start_keyword_process(job_id, kw, env, events):
+    """Chạy scrapy cho 1 keyword, đẩy từng dòng log vào queue"""
+    cmd = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'google_bot',
+        '-a', f'keyword={kw}',
+        '-s', 'LOG_ENABLED=True',
+        '-s', 'LOG_LEVEL=INFO'
+    ]
+    
+    kw_env = env.copy()
+    kw_env['KEYWORD'] = kw
+    kw_env['PYTHONUNBUFFERED'] = '1'
+    
+    proc = subprocess.Popen(
+        cmd,
+        cwd='backend',
+        env=kw_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1
+    )
+    
+    def reader():
+        for line in proc.stdout:
+            events.put((job_id, line.rstrip('\n')))
+        proc.stdout.close()
+        events.put((job_id, None))  # EOF
+    
+    threading.Thread(target=reader, daemon=True).start()
+    return proc
+
+
+def diagnose_failure(log_full):
+    """Trích lý do thất bại từ log"""
+    if 'DropItem' in log_full:
+        if 'V3 failed' in log_full:
+            return "V3 prompt generation failed"
+        elif 'AI failed' in log_full:
+            return "AI generation failed"
+        elif 'V3 Universal Generator not available' in log_full:
+            return "V3 không khả dụng - Check import"
+        return "Item bị drop trong pipeline"
+    elif 'No search results' in log_full:
+        return "Google không tìm thấy kết quả"
+    elif 'Publish failed' in log_full:
+        return "WordPress publish failed"
+    elif 'Missing WordPress credentials' in log_full:
+        return "Thiếu WordPress credentials"
+    elif 'GEMINI_API_KEY' in log_full:
+        return "Thiếu Gemini API Key"
+    return "Lỗi không xác định - xem log chi tiết"
+
+
 # Title
 st.title("🚀 Auto Content Pro - V3 Universal")
 st.markdown("**V3 CLEAN** - Tự động adapt với mọi niche")
@@ -55,6 +134,8 @@ if 'is_connected' not in st.session_state:
     st.session_state['is_connected'] = False
 if 'wp_categories' not in st.session_state:
     st.session_state['wp_categories'] = {}
+if 'runner_id' not in st.session_state:
+    st.session_state['runner_id'] = new_owner_id()
 
 # ============================================================
 # SIDEBAR - Configuration
@@ -164,6 +245,16 @@ with st.sidebar:
         
         st.info("💡 **Tip:** Sample keywords giúp V3 hiểu niche nhanh hơn. Không bắt buộc nhưng khuyến nghị.")
     
+    st.header("6. Hiệu năng")
+    
+    max_workers = st.slider(
+        "Số keyword chạy song song",
+        min_value=1,
+        max_value=10,
+        value=3,
+        help="Mỗi keyword chạy 1 process riêng. Tăng lên nếu máy đủ mạnh và quota AI cho phép."
+    )
+    
     st.divider()
     
     if st.button("🔄 Kết nối & Tải Chuyên mục", use_container_width=True):
@@ -250,14 +341,30 @@ with tab1:
         with col2:
             run_button = st.button("▶️ CHẠY NGAY", use_container_width=True, type="primary")
         
+        # === Resume batch dang dở (job store) ===
+        job_store = JobStore()
+        unfinished_jobs = job_store.unfinished(category_name=selected_category, wp_url=wp_url)
+        resume_button = False
+        
+        if unfinished_jobs:
+            with st.expander(f"♻️ {len(unfinished_jobs)} keyword chưa hoàn thành (batch trước)", expanded=False):
+                for job in unfinished_jobs[:50]:
+                    stages = [stage for stage in ('searched', 'scraped', 'generated', 'published') if job.get(f'{stage}_at')]
+                    st.write(f"- **{job['keyword']}** - {job['status']} ({' → '.join(stages) or 'chưa chạy'})")
+                resume_button = st.button("♻️ Tiếp tục batch dang dở", use_container_width=True)
+        
         # Run logic (COMPLETE FIXED)
-        if test_button or run_button:
+        if test_button or run_button or resume_button:
             run_cat_name = selected_category
             
             if test_button:
                 keywords = keywords[:1]
                 st.info(f"🧪 Test mode: Chỉ chạy keyword đầu tiên")
             
+            if resume_button:
+                keywords = [job['keyword'] for job in unfinished_jobs]
+                st.info(f"♻️ Resume: {len(keywords)} keyword chưa hoàn thành")
+            
             if not keywords:
                 st.error("❌ Chưa nhập từ khóa!")
             elif not gemini_key:
@@ -283,6 +390,7 @@ with tab1:
                 env['BRAND_NAME'] = brand_name
                 env['CATEGORY_NAME'] = run_cat_name
                 env['PREFERRED_MODEL'] = st.session_state.get('preferred_model', 'gemini-2.5-flash')
+                env['JOB_DB'] = job_store.path
                 
                 # V3 Configuration
                 if site_description:
@@ -295,105 +403,158 @@ with tab1:
                 # Results tracking
                 success_count = 0
                 failed_keywords = []
+                skipped_keywords = []
                 
-                # Process each keyword
-                for idx, kw in enumerate(keywords):
-                    status.info(f"⏳ Processing: **{kw}** ({idx+1}/{len(keywords)})")
+                # === Job store: tạo job cho keywords mới, bỏ qua keyword đã đăng ===
+                runner_id = st.session_state['runner_id']
+                job_store.enqueue(keywords, run_cat_name, wp_url, batch_id=time.strftime('%Y%m%d-%H%M%S'))
+                
+                # === Worker pool: tối đa max_workers process cùng lúc ===
+                events = queue.Queue()
+                pending = list(enumerate(keywords))
+                running = {}
+                done_count = 0
+                
+                def finish(job, timed_out=False):
+                    """Chốt kết quả 1 keyword, cập nhật log + status box"""
+                    kw = job['kw']
+                    log_full = '\n'.join(job['lines'])
+                    is_success = (not timed_out) and (job['proc'].returncode == 0) and (
+                        'PUBLISHED' in log_full or job_store.is_published(job['key'])
+                    )
                     
-                    env['KEYWORD'] = kw
+                    job['log'].code(log_full, language='log')
                     
-                    try:
-                        # Run scrapy
-                        cmd = [
-                            sys.executable, '-m', 'scrapy', 'crawl', 'google_bot',
-                            '-a', f'keyword={kw}',
-                            '-s', 'LOG_ENABLED=True',
-                            '-s', 'LOG_LEVEL=INFO'
-                        ]
+                    if is_success:
+                        job_store.complete(job['key'])
+                        job['box'].update(label=f"✅ Log: {kw}", state='complete', expanded=(job['idx'] == 0))
+                        return True
+                    
+                    job_store.fail(job['key'], "timeout" if timed_out else diagnose_failure(log_full))
+                    
+                    with job['box']:
+                        if timed_out:
+                            st.error(f"**⏱️ Process timeout sau {KEYWORD_TIMEOUT} giây**")
+                            st.info("Có thể do: network chậm, website khó scrape, hoặc AI mất nhiều thời gian")
+                        else:
+                            st.error("⚠️ **THẤT BẠI** - Kiểm tra log chi tiết ở trên")
+                            st.warning(f"**Lý do:** {diagnose_failure(log_full)}")
+                    
+                    suffix = " (Timeout)" if timed_out else ""
+                    job['box'].update(label=f"❌ Log: {kw}{suffix}", state='error', expanded=True)
+                    return False
+                
+                while pending or running:
+                    # Fill pool
+                    while pending and len(running) < max_workers:
+                        idx, kw = pending.pop(0)
+                        key = make_idempotency_key(kw, run_cat_name, wp_url)
                         
-                        result = subprocess.run(
-                            cmd,
-                            cwd='backend',
-                            env=env,
-                            capture_output=True,
-                            text=True,
-                            timeout=180
-                        )
+                        # Đã đăng ở lần chạy trước → không chạy lại
+                        if job_store.is_published(key):
+                            job_store.complete(key)
+                            success_count += 1
+                            done_count += 1
+                            skipped_keywords.append(kw)
+                            continue
                         
-                        # === FIX: Check success BEFORE displaying logs ===
-                        log_full = result.stdout + result.stderr
-                        is_success = ('PUBLISHED' in log_full) and (result.returncode == 0)
+                        # Runner khác đang giữ lease → bỏ qua
+                        if not job_store.claim(key, runner_id):
+                            failed_keywords.append(kw)
+                            done_count += 1
+                            with log_container:
+                                st.warning(f"🔒 {kw}: đang được runner khác xử lý - bỏ qua")
+                            continue
                         
-                        # === FIX: Display logs with proper expand logic ===
                         with log_container:
-                            # Auto-expand if: FAILED or first keyword
-                            should_expand = (not is_success) or (idx == 0)
-                            
-                            # Emoji based on status  
-                            status_emoji = "✅" if is_success else "❌"
-                            log_title = f"{status_emoji} Log: {kw}"
-                            
-                            with st.expander(log_title, expanded=should_expand):
-                                # Show error summary at top if failed
-                                if not is_success:
-                                    st.error("⚠️ **THẤT BẠI** - Kiểm tra log chi tiết bên dưới:")
-                                    
-                                    # Extract specific error type
-                                    if 'DropItem' in log_full:
-                                        if 'V3 failed' in log_full:
-                                            st.warning("**Lý do:** V3 prompt generation failed")
-                                        elif 'AI failed' in log_full:
-                                            st.warning("**Lý do:** AI generation failed")
-                                        elif 'V3 Universal Generator not available' in log_full:
-                                            st.warning("**Lý do:** V3 không khả dụng - Check import")
-                                        else:
-                                            st.warning("**Lý do:** Item bị drop trong pipeline")
-                                    elif 'No search results' in log_full:
-                                        st.warning("**Lý do:** Google không tìm thấy kết quả")
-                                    elif 'Publish failed' in log_full:
-                                        st.warning("**Lý do:** WordPress publish failed")
-                                    elif 'Missing WordPress credentials' in log_full:
-                                        st.warning("**Lý do:** Thiếu WordPress credentials")
-                                    elif 'GEMINI_API_KEY' in log_full:
-                                        st.warning("**Lý do:** Thiếu Gemini API Key")
-                                    else:
-                                        st.warning("**Lý do:** Lỗi không xác định - xem log chi tiết")
-                                    
-                                    st.markdown("---")
-                                
-                                # Show full log
-                                st.code(log_full, language='log')
+                            box = st.status(f"⏳ Log: {kw}", expanded=(idx == 0))
+                        with box:
+                            log_placeholder = st.empty()
+                        
+                        try:
+                            proc = start_keyword_process(idx, kw, env, events)
+                        except Exception as e:
+                            failed_keywords.append(kw)
+                            done_count += 1
+                            job_store.fail(key, str(e))
+                            with box:
+                                st.error(f"**Exception:** {str(e)}")
+                            box.update(label=f"❌ Log: {kw} (Exception)", state='error', expanded=True)
+                            continue
                         
-                        # Update counters and status
-                        if is_success:
+                        running[idx] = {
+                            'idx': idx,
+                            'kw': kw,
+                            'key': key,
+                            'proc': proc,
+                            'start': time.time(),
+                            'heartbeat': time.time(),
+                            'lines': [],
+                            'box': box,
+                            'log': log_placeholder,
+                            'dirty': False,
+                        }
+                    
+                    if not running:
+                        continue
+                    
+                    # Drain log events (chờ tối đa 0.5s)
+                    finished = []
+                    batch = []
+                    try:
+                        batch.append(events.get(timeout=0.5))
+                        while True:
+                            batch.append(events.get_nowait())
+                    except queue.Empty:
+                        pass
+                    
+                    for job_id, line in batch:
+                        job = running.get(job_id)
+                        if job is None:
+                            continue
+                        if line is None:
+                            finished.append(job_id)
+                        else:
+                            job['lines'].append(line)
+                            job['dirty'] = True
+                    
+                    # Timeout check + heartbeat
+                    now = time.time()
+                    for job_id, job in running.items():
+                        if job_id not in finished and now - job['start'] > KEYWORD_TIMEOUT:
+                            job['proc'].kill()
+                            job['timed_out'] = True
+                        elif now - job['heartbeat'] > HEARTBEAT_INTERVAL:
+                            job_store.heartbeat(job['key'], runner_id)
+                            job['heartbeat'] = now
+                    
+                    # Chốt keywords đã xong
+                    for job_id in finished:
+                        job = running.pop(job_id)
+                        job['proc'].wait()
+                        done_count += 1
+                        kw = job['kw']
+                        
+                        if finish(job, timed_out=job.get('timed_out', False)):
                             success_count += 1
                             status.success(f"✅ Success: **{kw}**")
                         else:
                             failed_keywords.append(kw)
                             status.error(f"❌ Failed: **{kw}** - Log đã tự động mở ở trên")
-                        
-                        time.sleep(2)
-                        
-                    except subprocess.TimeoutExpired:
-                        failed_keywords.append(kw)
-                        status.error(f"⏱️ Timeout: **{kw}** (quá 3 phút)")
-                        
-                        with log_container:
-                            with st.expander(f"❌ Log: {kw} (Timeout)", expanded=True):
-                                st.error("**⏱️ Process timeout sau 180 giây**")
-                                st.info("Có thể do: network chậm, website khó scrape, hoặc AI mất nhiều thời gian")
                     
-                    except Exception as e:
-                        failed_keywords.append(kw)
-                        status.error(f"❌ Error: **{kw}** - {str(e)}")
-                        
-                        with log_container:
-                            with st.expander(f"❌ Log: {kw} (Exception)", expanded=True):
-                                st.error(f"**Exception:** {str(e)}")
-                                st.code(str(e), language='text')
+                    # Live log cho keywords đang chạy
+                    for job in running.values():
+                        if job['dirty']:
+                            job['log'].code('\n'.join(job['lines'][-LIVE_LOG_LINES:]), language='log')
+                            job['dirty'] = False
                     
                     # Update progress
-                    progress.progress((idx + 1) / len(keywords))
+                    progress.progress(done_count / len(keywords))
+                    if running:
+                        status.info(
+                            f"⏳ Đang chạy ({done_count}/{len(keywords)} xong): "
+                            + ", ".join(f"**{job['kw']}**" for job in running.values())
+                        )
                 
                 # === Final results ===
                 st.divider()
@@ -411,6 +572,9 @@ with tab1:
                     success_rate = (success_count / len(keywords) * 100) if keywords else 0
                     st.metric("📊 Tỷ lệ", f"{success_rate:.1f}%")
                 
+                if skipped_keywords:
+                    st.info(f"⏭️ {len(skipped_keywords)} keyword đã đăng từ trước - không chạy lại")
+                
                 if failed_keywords:
                     st.error("**❌ Keywords thất bại:**")
                     for kw in failed_keywords:
@@ -446,17 +610,88 @@ with tab2:
                 pass
     
     with col2:
-        st.subheader("💰 Cost Estimate")
+        st.subheader("💰 Cost")
         
-        cost_per_keyword = 0.006
+        # Metrics thật từ pipeline (token, chi phí, latency từng lần gọi Gemini)
+        metrics_summary = None
+        recent_keywords = []
+        try:
+            metrics_store = MetricsStore()
+            period = st.selectbox("Khoảng thời gian:", ["24 giờ", "7 ngày", "30 ngày", "Tất cả"], index=1)
+            period_days = {"24 giờ": 1, "7 ngày": 7, "30 ngày": 30}.get(period)
+            since = time.time() - period_days * 86400 if period_days else None
+            metrics_summary = metrics_store.summary(since=since)
+            recent_keywords = metrics_store.recent_keywords(limit=20)
+            metrics_store.close()
+        except Exception as e:
+            st.warning(f"⚠️ Không đọc được metrics: {e}")
+        
+        cost_per_keyword = DEFAULT_COST_PER_KEYWORD
+        if metrics_summary and metrics_summary['cost_per_keyword'] is not None:
+            cost_per_keyword = metrics_summary['cost_per_keyword']
+            st.caption(f"Theo {metrics_summary['keywords']} keyword đã chạy")
+        else:
+            st.caption(f"Chưa có dữ liệu - ước lượng ${DEFAULT_COST_PER_KEYWORD}/keyword")
         
         num_keywords = st.number_input("Số keywords/ngày:", min_value=1, value=50)
         
         daily_cost = num_keywords * cost_per_keyword
         monthly_cost = daily_cost * 30
         
+        st.metric("Chi phí/keyword", f"${cost_per_keyword:.4f}")
         st.metric("Chi phí/ngày", f"${daily_cost:.2f}")
         st.metric("Chi phí/tháng", f"${monthly_cost:.2f}")
+    
+    if metrics_summary and metrics_summary['calls'] + metrics_summary['cache_hits']:
+        st.divider()
+        st.subheader("📈 Token & Performance")
+        
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Tổng chi phí", f"${metrics_summary['cost']:.4f}")
+        tokens_per_second = metrics_summary['tokens_per_second']
+        m2.metric("Tokens/s", f"{tokens_per_second:.0f}" if tokens_per_second else "N/A")
+        m3.metric("Tiết kiệm nhờ cache", f"${metrics_summary['saved']:.4f}")
+        m4.metric("Lần gọi lỗi / retry", f"{metrics_summary['retries']}/{metrics_summary['calls']}")
+        
+        t1, t2, t3, t4 = st.columns(4)
+        t1.metric("Prompt tokens", f"{metrics_summary['prompt_tokens']:,}")
+        t2.metric("Cached tokens", f"{metrics_summary['cached_tokens']:,}")
+        t3.metric("Output tokens", f"{metrics_summary['output_tokens']:,}")
+        t4.metric("Generation cache hits", metrics_summary['cache_hits'])
+        
+        st.write("**Theo model:**")
+        st.dataframe([
+            {
+                'Model': row['model'],
+                'Calls': row['calls'],
+                'Failed': row['failed'],
+                'Avg latency (s)': round(row['avg_latency'], 1) if row['avg_latency'] else None,
+                'Prompt tokens': row['prompt_tokens'],
+                'Cached tokens': row['cached_tokens'],
+                'Output tokens': row['output_tokens'],
+                'Cost ($)': round(row['cost'], 4),
+                'Saved ($)': round(row['saved'], 4),
+            }
+            for row in metrics_summary['per_model']
+        ], use_container_width=True)
+        
+        if recent_keywords:
+            st.write("**Keyword gần đây:**")
+            st.dataframe([
+                {
+                    'Keyword': row['keyword'],
+                    'Model': row['models'],
+                    'Calls': row['calls'],
+                    'Retries': row['retries'],
+                    'Prompt tokens': row['prompt_tokens'],
+                    'Cached tokens': row['cached_tokens'],
+                    'Output tokens': row['output_tokens'],
+                    'Latency (s)': row['latency'],
+                    'Cost ($)': round(row['cost'], 4),
+                    'Saved ($)': round(row['saved'], 4),
+                }
+                for row in recent_keywords
+            ], use_container_width=True)
 
 # ============================================================
 # TAB 3: GUIDE